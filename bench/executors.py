@@ -0,0 +1,112 @@
+"""
+CPU 进程池压测：随机生成一批 JPEG，分别在事件循环里直接算 dHash（改造前的做法）和经 cpu_executor
+在 1..N 个 worker 上算，报告吞吐（张/秒）和同期事件循环的最大卡顿。
+吞吐应随 worker 数近似线性增长，直到核数；事件循环最大卡顿应从「一张图的解码时间」降到毫秒级。
+
+运行：
+    python -m bench.executors                   # 64 张 1600×1600，worker 数 1、2、4 … 到核数
+    python -m bench.executors -n 200 --side 2400
+    python -m bench.executors --workers 1 2 3
+"""
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+from typing import List, Tuple
+
+from bench.fake_telegram import FAKE_TOKEN
+from src.utils.imaging import dhash
+
+
+def make_images(count: int, side: int) -> List[bytes]:
+    from PIL import Image
+
+    images = []
+    for i in range(count):
+        img = Image.effect_noise((side, side), 30 + i % 50).convert("RGB")
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+async def _watch_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """每 interval 醒一次，返回实际间隔比预期多出的最大值（秒）。"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def measure(images: List[bytes], workers: int | None) -> Tuple[float, float]:
+    """workers=None 表示直接在事件循环上算（基准）。返回 (张/秒, 最大卡顿秒)。"""
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch_lag(stop))
+    await asyncio.sleep(0)
+    executor = None
+    if workers is None:
+        started = time.perf_counter()
+        for data in images:
+            dhash(data)
+            await asyncio.sleep(0)
+    else:
+        from src.config import settings
+        from src.services.executors import CpuExecutor
+
+        settings.CPU_WORKERS = workers
+        executor = CpuExecutor()
+        await executor.run(dhash, images[0])  # 预热：启动 worker 进程不计入吞吐
+        started = time.perf_counter()
+        await asyncio.gather(*(executor.run(dhash, data) for data in images))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    lag = await watcher
+    if executor is not None:
+        await asyncio.to_thread(executor.shutdown)
+    return len(images) / elapsed, lag
+
+
+def _prepare_env() -> None:
+    """在 import src.config 之前配置好环境变量（settings 在 import 时读取）。"""
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": FAKE_TOKEN,
+        "OPENAI_API_KEY": "sk-bench",
+        "OWNER_IDS": "1",
+        "DATA_DIR": tempfile.mkdtemp(prefix="atrioly-executors-"),
+        "LOG_LEVEL": "WARNING",
+    })
+
+
+async def run(args) -> None:
+    cores = os.cpu_count() or 1
+    counts = args.workers or sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    images = make_images(args.count, args.side)
+    size_kb = sum(map(len, images)) / len(images) / 1024
+
+    print(f"\n=== executors · {len(images)} JPEG {args.side}px (~{size_kb:.0f}KB) · {cores} cores ===")
+    print(f"{'mode':<12} {'img/s':>8} {'speedup':>8} {'max lag':>9}")
+    base, lag = await measure(images, None)
+    print(f"{'inline':<12} {base:8.1f} {1:7.2f}x {lag * 1000:7.1f}ms")
+    for workers in counts:
+        rate, lag = await measure(images, workers)
+        print(f"{f'{workers} worker(s)':<12} {rate:8.1f} {rate / base:7.2f}x {lag * 1000:7.1f}ms")
+    if cores == 1:
+        print("ℹ️ Only one core here: expect no throughput gain, only the event-loop lag drop.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--count", type=int, default=64, help="图片数")
+    parser.add_argument("--side", type=int, default=1600, help="图片边长（像素）")
+    parser.add_argument("--workers", type=int, nargs="*", help="要测的 worker 数（默认 1、2、4 … 到核数）")
+    args = parser.parse_args()
+    _prepare_env()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
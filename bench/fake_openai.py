@@ -0,0 +1,217 @@
+"""
+本地假 OpenAI Chat Completions 端点（仅用于 bench / 压测，不依赖外网）。
+
+- POST {base_url}/chat/completions，支持普通响应和 stream=True（SSE，分块写出）
+- 带 json_schema 的请求：按 schema 生成一个合法实例（少量字段按消息内容做启发式判断）
+- 可配置延迟（均值 ± 抖动）、错误率（返回 500 / 429）
+- 记录每次调用（method 名取自 json_schema.name，没有 schema 的记为 "text"）
+
+用法：
+    fake_ai = FakeOpenAI(latency=0.3, jitter=0.1, error_rate=0.02)
+    await fake_ai.start()
+    AsyncOpenAI(api_key="sk-bench", base_url=fake_ai.base_url)
+"""
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+_MEMBERSHIP_RE = re.compile(r"netflix|奈飞|disney|迪士尼|youtube|hbo|spotify|合租|拼车|上车", re.I)
+_SPAM_RE = re.compile(r"代理|兼职|返利|加v|加微|稳赚", re.I)
+_PLATFORM_RE = re.compile(r"netflix|disney|youtube|hbo|spotify|apple", re.I)
+
+
+class FakeOpenAI:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        stream_chunks: int = 8,
+        seed: int = 42,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_chunks = stream_chunks
+        self.rng = random.Random(seed)
+        # (时间戳, method, 是否出错)
+        self.calls: List[Tuple[float, str, bool]] = []
+        self._ids = itertools.count(1)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: set = set()
+
+    # ---------- 生命周期 ----------
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            # 客户端的 keep-alive 连接也一并断开，否则 wait_closed 会一直等
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    # ---------- 响应内容 ----------
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    @staticmethod
+    def _instance(schema: Dict[str, Any], text: str, name: str = "") -> Any:
+        """按 strict json_schema 生成一个合法实例。"""
+        types = schema.get("type")
+        if isinstance(types, list):
+            types = next(t for t in types if t != "null")
+        if "enum" in schema:
+            return schema["enum"][0]
+        if types == "object":
+            return {
+                key: FakeOpenAI._instance(sub, text, key)
+                for key, sub in schema.get("properties", {}).items()
+            }
+        if types == "array":
+            if name == "results":
+                # classify_batch：每条消息一个结果
+                count = len(re.findall(r"^\[\d+\]", text, re.M)) or 1
+                return [
+                    {**FakeOpenAI._instance(schema["items"], text, "item"), "i": i}
+                    for i in range(count)
+                ]
+            if name == "tags":
+                return ["bench"]
+            return []
+        if types == "boolean":
+            if name == "is_spam":
+                return bool(_SPAM_RE.search(text))
+            if name == "is_membership":
+                return bool(_MEMBERSHIP_RE.search(text))
+            return name == "ok"
+        if types == "integer":
+            return 0
+        if name == "platform":
+            m = _PLATFORM_RE.search(text)
+            return m.group(0).title() if m else None
+        return f"bench {name or 'text'}"
+
+    def _content(self, body: Dict[str, Any]) -> Tuple[str, str]:
+        messages = body.get("messages") or []
+        user = messages[-1].get("content") if messages else ""
+        if not isinstance(user, str):
+            user = json.dumps(user, ensure_ascii=False)
+        fmt = body.get("response_format") or {}
+        if fmt.get("type") == "json_schema":
+            spec = fmt["json_schema"]
+            return spec["name"], json.dumps(self._instance(spec["schema"], user), ensure_ascii=False)
+        if fmt.get("type") == "json_object":
+            return "json_object", json.dumps({"summary": "bench"})
+        return "text", "这是一条来自 bench 的模拟回复。" * 3
+
+    @staticmethod
+    def _usage(body: Dict[str, Any], content: str) -> Dict[str, Any]:
+        prompt = sum(len(str(m.get("content", ""))) for m in body.get("messages") or []) // 4
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": len(content) // 4 + 1,
+            "total_tokens": prompt + len(content) // 4 + 1,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    # ---------- HTTP ----------
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                raw = await reader.readexactly(int(headers.get("content-length", 0)))
+                body = json.loads(raw) if raw else {}
+                await self._respond(body, writer)
+        except (asyncio.IncompleteReadError, ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _respond(self, body: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        method, content = self._content(body)
+        await asyncio.sleep(self._delay())
+
+        if self.rng.random() < self.error_rate:
+            self.calls.append((time.perf_counter(), method, True))
+            payload = json.dumps({"error": {"message": "bench injected error", "type": "server_error"}}).encode()
+            reason = "Too Many Requests" if self.error_status == 429 else "Internal Server Error"
+            writer.write(
+                f"HTTP/1.1 {self.error_status} {reason}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+            return
+
+        self.calls.append((time.perf_counter(), method, False))
+        cid = f"chatcmpl-bench-{next(self._ids)}"
+        model = body.get("model", "bench")
+        created = int(time.time())
+
+        if not body.get("stream"):
+            payload = json.dumps({
+                "id": cid,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": self._usage(body, content),
+            }, ensure_ascii=False).encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+            return
+
+        # 流式：chunked 编码逐段写出 SSE，段间按首包延迟的 1/10 间隔
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        step = max(1, len(content) // self.stream_chunks)
+        pieces = [content[i:i + step] for i in range(0, len(content), step)]
+        events = [
+            {"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            for piece in pieces
+        ]
+        events.append({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        events.append({"choices": [], "usage": self._usage(body, content)})
+        for event in events:
+            event.update({"id": cid, "object": "chat.completion.chunk", "created": created, "model": model})
+            data = f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+            await asyncio.sleep(self.latency / 10)
+        done = b"data: [DONE]\n\n"
+        writer.write(f"{len(done):x}\r\n".encode() + done + b"\r\n0\r\n\r\n")
+        await writer.drain()
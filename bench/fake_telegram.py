@@ -0,0 +1,185 @@
+"""
+本地假 Telegram Bot API（仅用于 bench / 压测，不依赖外网）。
+
+- 基于 asyncio.start_server 的极简 HTTP/1.1 server
+- 支持 PTB 会调用的常见方法：getMe / setWebhook / deleteWebhook / getUpdates /
+  sendMessage / forwardMessage / copyMessage / editMessageText ...
+- 记录所有调用（method, params, 时间戳），方便 harness 做断言和统计
+- 可以把 update 通过 HTTP POST 推给 bot 的 webhook，模拟 Telegram 推送
+
+用法：
+    fake = FakeTelegram()
+    await fake.start()
+    app = ApplicationBuilder().token(FAKE_TOKEN).base_url(fake.base_url).build()
+"""
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+FAKE_TOKEN = "123456:FAKE-TOKEN"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "AtriolyBench", "username": "atrioly_bench_bot"}
+
+
+def make_text_update(
+    update_id: int,
+    chat_id: int,
+    text: str,
+    user_id: Optional[int] = None,
+    chat_type: str = "supergroup",
+    date: Optional[int] = None,
+) -> Dict[str, Any]:
+    """构造一个最小的文本消息 update（dict 形式，可直接 json.dumps 推给 webhook）。"""
+    uid = user_id or chat_id
+    chat = {"id": chat_id, "type": chat_type}
+    if chat_type == "private":
+        chat["first_name"] = f"user{uid}"
+    else:
+        chat["title"] = f"group{chat_id}"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": date or int(time.time()),
+            "chat": chat,
+            "from": {"id": uid, "is_bot": False, "first_name": f"user{uid}"},
+            "text": text,
+        },
+    }
+
+
+class FakeTelegram:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        # 每个 Bot API 调用的模拟网络延迟（秒）
+        self.latency = latency
+        self.calls: List[Tuple[float, str, Dict[str, Any]]] = []
+        self.pending_updates: List[Dict[str, Any]] = []
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._msg_ids = itertools.count(1_000_000)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: set = set()
+
+    # ---------- 生命周期 ----------
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            # 客户端的 keep-alive 连接也一并断开，否则 wait_closed 会一直等
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+
+    @property
+    def base_url(self) -> str:
+        """传给 ApplicationBuilder().base_url(...)，PTB 会在后面拼上 token。"""
+        return f"http://{self.host}:{self.port}/bot"
+
+    def calls_of(self, method: str) -> List[Dict[str, Any]]:
+        return [params for _, m, params in self.calls if m == method]
+
+    # ---------- 推送 update ----------
+
+    async def post_updates(self, webhook_url: str, updates: List[Dict[str, Any]], secret: str | None = None) -> None:
+        """像 Telegram 一样把 update 逐条 POST 到 bot 的 webhook（按顺序，不等待处理完成）。"""
+        import httpx
+
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+        async with httpx.AsyncClient() as client:
+            for upd in updates:
+                resp = await client.post(webhook_url, json=upd, headers=headers)
+                resp.raise_for_status()
+
+    # ---------- Bot API 模拟 ----------
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": next(self._msg_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+            "text": params.get("text") or params.get("caption") or "",
+        }
+
+    def _dispatch(self, method: str, params: Dict[str, Any]) -> Any:
+        custom = self.handlers.get(method)
+        if custom:
+            return custom(params)
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            updates, self.pending_updates = self.pending_updates, []
+            return updates
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": len(self.pending_updates)}
+        if method == "copyMessage":
+            return {"message_id": next(self._msg_ids)}
+        if method in ("forwardMessages", "copyMessages"):
+            return [{"message_id": next(self._msg_ids)} for _ in params.get("message_ids") or []]
+        if method.startswith("send") and method not in ("sendChatAction", "sendMediaGroup"):
+            return self._message(params)
+        if method == "sendMediaGroup":
+            media = params.get("media") or []
+            return [self._message(params) for _ in media]
+        if method in ("forwardMessage", "editMessageText"):
+            return self._message(params)
+        return True
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                _, path, _ = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                method = path.rsplit("/", 1)[-1].split("?", 1)[0]
+                params = self._parse_body(body, headers.get("content-type", ""))
+                self.calls.append((time.perf_counter(), method, params))
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                payload = json.dumps({"ok": True, "result": self._dispatch(method, params)}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _parse_body(body: bytes, content_type: str) -> Dict[str, Any]:
+        if not body:
+            return {}
+        if "json" in content_type:
+            return json.loads(body)
+        if "multipart" in content_type:
+            # 上传文件的场景 bench 里不关心内容，只记录调用
+            return {"multipart": True}
+        params = {}
+        for k, v in parse_qsl(body.decode("utf-8"), keep_blank_values=True):
+            # PTB 会把非字符串参数 JSON 编码
+            try:
+                params[k] = json.loads(v)
+            except ValueError:
+                params[k] = v
+        return params
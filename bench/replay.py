@@ -0,0 +1,336 @@
+"""
+离线回放压测：把一批群聊 / 私聊 update 灌进 main.build_application() 构建的真实 handler 图，
+Bot API 和 OpenAI 都指向本地假 server（bench/fake_telegram.py、bench/fake_openai.py），不依赖外网。
+
+报告：
+  - updates/s
+  - 分阶段延迟 p50 / p95 / p99：
+      queue   : 入队 → handler 开始（含同 chat 排队、worker 名额等待）
+      handler : handler 执行耗时
+      e2e     : 入队 → handler 结束
+      ai      : 单次 OpenAI 调用（客户端视角，含重试）
+      tg      : 单次 Bot API 调用（客户端视角）
+  - 每条 update 平均的 Bot API / OpenAI 调用次数
+并与 bench/baseline.json 里同名 profile 的基线对比，退化超过容忍度时退出码为 1。
+
+运行：
+    python -m bench.replay                          # 合成语料 + realistic 配置，对比基线
+    python -m bench.replay --profile degraded -n 2000
+    python -m bench.replay --corpus updates.jsonl   # 回放录制的 update（每行一个 Telegram update JSON）
+    python -m bench.replay --dump-corpus out.jsonl  # 导出合成语料
+    python -m bench.replay --update-baseline        # 用本次结果覆盖基线
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from bench.fake_openai import FakeOpenAI
+from bench.fake_telegram import FAKE_TOKEN, FakeTelegram, make_text_update
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+OWNER_ID = 1
+GROUPS = [-1001000000000 - i for i in range(20)]
+USERS = list(range(2001, 2301))
+CHAT_MODE_USERS = USERS[:40]
+
+# 延迟 / 错误配置：ai = (均值, 抖动, 错误率)，tg = 每次 Bot API 调用延迟
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "fast": {"ai": (0.02, 0.01, 0.0), "tg": 0.002},
+    "realistic": {"ai": (0.6, 0.4, 0.01), "tg": 0.03},
+    "degraded": {"ai": (2.5, 1.5, 0.15), "tg": 0.08},
+}
+
+# 退化判定：值越大越好的指标 / 越小越好的指标
+HIGHER_IS_BETTER = ("updates_per_sec",)
+LOWER_IS_BETTER = ("e2e_p95", "e2e_p99", "tg_calls_per_update", "ai_calls_per_update")
+
+_GROUP_NOISE = ["今天吃什么", "有人打游戏吗", "哈哈哈哈", "周末去爬山", "这个 bug 怎么修", "早上好"]
+_GROUP_TRIGGER = ["有人知道 Apple 新品吗", "这个 sub 怎么订", "share 一下链接", "车坏了怎么办"]
+_GROUP_OFFER = ["Netflix 4K 合租还差 2 位，月付", "Spotify 家庭组上车，私聊", "YouTube Premium 拼车 缺 1", "迪士尼+ 合租位出"]
+_GROUP_SPAM = ["USDT 稳赚 click here", "crypto investment 日入过万", "casino 注册送 88"]
+_DM_TEXT = ["你好，请问还有 Netflix 位置吗？", "我上个月付款了但是没收到", "怎么续费", "谢谢！", "在吗", "能开发票吗"]
+_CHAT_TEXT = ["给我讲个笑话", "帮我想个周末计划", "Python 里 asyncio 怎么用", "翻译：good morning"]
+_OWNER_FAST = ["待办：买牛奶", "todo: buy milk", "列出所有提醒", "30分钟后提醒我关火", "remind me in 20 minutes to stretch"]
+_OWNER_AI = ["把买牛奶那个改成明天", "下周五是妈妈生日", "刚才那个提醒取消掉", "帮我记一下 3 月 1 日交房租",
+             "remind me in 1 hour 30 minutes to call back"]
+
+
+def synth_corpus(n: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """按大致真实的比例生成群聊 / 私聊 / owner 指令混合语料。"""
+    rng = random.Random(seed)
+    kinds = [
+        ("group_noise", 0.40), ("group_trigger", 0.15), ("group_offer", 0.10), ("group_spam", 0.05),
+        ("dm_forward", 0.15), ("dm_chat", 0.05), ("owner_fast", 0.05), ("owner_ai", 0.05),
+    ]
+    names, weights = zip(*kinds)
+    corpus = []
+    for i in range(1, n + 1):
+        kind = rng.choices(names, weights)[0]
+        if kind.startswith("group"):
+            pool = {"group_noise": _GROUP_NOISE, "group_trigger": _GROUP_TRIGGER,
+                    "group_offer": _GROUP_OFFER, "group_spam": _GROUP_SPAM}[kind]
+            upd = make_text_update(i, rng.choice(GROUPS), rng.choice(pool), user_id=rng.choice(USERS))
+        elif kind == "dm_forward":
+            uid = rng.choice(USERS[len(CHAT_MODE_USERS):])
+            upd = make_text_update(i, uid, rng.choice(_DM_TEXT), chat_type="private")
+        elif kind == "dm_chat":
+            uid = rng.choice(CHAT_MODE_USERS)
+            upd = make_text_update(i, uid, rng.choice(_CHAT_TEXT), chat_type="private")
+        else:
+            pool = _OWNER_FAST if kind == "owner_fast" else _OWNER_AI
+            upd = make_text_update(i, OWNER_ID, rng.choice(pool), chat_type="private")
+        upd["_kind"] = kind
+        corpus.append(upd)
+    return corpus
+
+
+def check_fast_intent() -> List[str]:
+    """owner_fast 的句子必须被本地解析命中，owner_ai 的必须交给 AI（本地给出错的结果比没命中更糟）；返回不符合的句子。"""
+    from src.services.fast_intent import FastIntentParser
+
+    parser = FastIntentParser()
+    wrong = [text for text in _OWNER_FAST if parser.parse(text) is None]
+    wrong += [text for text in _OWNER_AI if parser.parse(text) is not None]
+    return wrong
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def _prepare_env(tg: FakeTelegram, ai: FakeOpenAI, data_dir: str, args) -> None:
+    """在 import src.* 之前配置好环境变量（settings 在 import 时读取）。"""
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": FAKE_TOKEN,
+        "TELEGRAM_API_BASE_URL": tg.base_url,
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": ai.base_url,
+        "OWNER_IDS": str(OWNER_ID),
+        "FORWARD_TO": str(OWNER_ID),
+        "DATA_DIR": data_dir,
+        "LOG_LEVEL": "WARNING",
+        "CATCHUP_MAX_AGE": "0",
+        "CONCURRENT_UPDATES": str(args.workers),
+        "DM_COALESCE_DELAY": str(args.coalesce_delay),
+        "STREAM_EDIT_INTERVAL": "0.2",
+    })
+    with open(os.path.join(data_dir, "chat_modes.json"), "w", encoding="utf-8") as f:
+        json.dump({str(uid): "chat" for uid in CHAT_MODE_USERS}, f)
+
+
+async def run(args) -> Dict[str, float]:
+    profile = PROFILES[args.profile]
+    ai_latency, ai_jitter, ai_errors = profile["ai"]
+    tg = FakeTelegram(latency=profile["tg"])
+    ai = FakeOpenAI(latency=ai_latency, jitter=ai_jitter, error_rate=ai_errors, seed=args.seed)
+    await tg.start()
+    await ai.start()
+    data_dir = tempfile.mkdtemp(prefix="atrioly-bench-")
+    _prepare_env(tg, ai, data_dir, args)
+
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+
+    from src.main import build_application
+    from src.bot.telemetry import InstrumentedRequest
+    from src.services.ai_agent import agent
+    from src.bot.dm_coalescer import dm_coalescer
+
+    logging.getLogger().setLevel(logging.WARNING)
+    spans: Dict[str, List[float]] = defaultdict(list)
+    counters = {"tg": 0, "ai": 0}
+
+    # ---- 客户端视角的 Bot API / OpenAI 计时 ----
+    # 继承生产用的 InstrumentedRequest，bench 同时覆盖到 /metrics 的记账开销
+    class TimedRequest(InstrumentedRequest):
+        async def do_request(self, url, method, *a, **kw):
+            t0 = time.perf_counter()
+            try:
+                return await super().do_request(url, method, *a, **kw)
+            finally:
+                spans["tg"].append(time.perf_counter() - t0)
+                counters["tg"] += 1
+
+    hedged_create = agent._hedged_create
+
+    async def timed_create(*a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return await hedged_create(*a, **kw)
+        finally:
+            spans["ai"].append(time.perf_counter() - t0)
+            counters["ai"] += 1
+
+    stream = agent._stream
+
+    async def timed_stream(*a, **kw):
+        t0 = time.perf_counter()
+        try:
+            async for delta in stream(*a, **kw):
+                yield delta
+        finally:
+            spans["ai"].append(time.perf_counter() - t0)
+            counters["ai"] += 1
+
+    agent._hedged_create = timed_create
+    agent._stream = timed_stream
+
+    builder = ApplicationBuilder().request(TimedRequest(connection_pool_size=args.workers * 2))
+    app = build_application(builder)
+
+    # ---- 队列 / handler 计时：包住 update processor 交给 handler 的 coroutine ----
+    processor = app.update_processor
+    do_process = processor.do_process_update
+    enqueued: Dict[int, float] = {}
+
+    async def timed_process(update, coroutine):
+        async def _inner():
+            start = time.perf_counter()
+            try:
+                await coroutine
+            finally:
+                end = time.perf_counter()
+                t_in = enqueued.get(getattr(update, "update_id", -1), start)
+                spans["queue"].append(start - t_in)
+                spans["handler"].append(end - start)
+                spans["e2e"].append(end - t_in)
+        await do_process(update, _inner())
+
+    processor.do_process_update = timed_process
+
+    corpus = load_corpus(args.corpus) if args.corpus else synth_corpus(args.n, args.seed)
+    now = int(time.time())
+
+    async with app:
+        await app.start()
+        counters["tg"] = 0  # 不计初始化时的 getMe
+        t0 = time.perf_counter()
+        interval = 1.0 / args.rate if args.rate > 0 else 0.0
+        for raw in corpus:
+            raw = {k: v for k, v in raw.items() if not k.startswith("_")}
+            if "message" in raw:
+                raw["message"]["date"] = now
+            update = Update.de_json(raw, app.bot)
+            enqueued[update.update_id] = time.perf_counter()
+            await app.update_queue.put(update)
+            if interval:
+                await asyncio.sleep(interval)
+        await app.update_queue.join()
+        # 私聊合并的 flush 在 handler 之外异步进行，等它们也处理完
+        while dm_coalescer.bursts or dm_coalescer._tasks:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - t0
+        await app.stop()
+    await agent.client.close()
+
+    await tg.stop()
+    await ai.stop()
+
+    n = len(corpus)
+    result = {
+        "updates": n,
+        "elapsed": elapsed,
+        "updates_per_sec": n / elapsed,
+        "tg_calls_per_update": counters["tg"] / n,
+        "ai_calls_per_update": counters["ai"] / n,
+        "ai_errors": sum(1 for _, _, err in ai.calls if err),
+    }
+    for stage in ("queue", "handler", "e2e", "ai", "tg"):
+        for q in (0.50, 0.95, 0.99):
+            result[f"{stage}_p{int(q * 100)}"] = percentile(spans[stage], q)
+    return result
+
+
+def report(result: Dict[str, float], profile: str) -> None:
+    print(f"profile={profile} | {result['updates']} updates in {result['elapsed']:.2f}s "
+          f"| {result['updates_per_sec']:.1f} updates/s")
+    print(f"{'stage':<8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage in ("queue", "handler", "e2e", "ai", "tg"):
+        row = [result[f"{stage}_p{q}"] * 1000 for q in (50, 95, 99)]
+        print(f"{stage:<8} " + " ".join(f"{v:>7.1f}ms" for v in row))
+    print(f"API calls / update: bot={result['tg_calls_per_update']:.2f} "
+          f"openai={result['ai_calls_per_update']:.2f} (injected AI errors: {result['ai_errors']})")
+
+
+def compare(result: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    regressions = []
+    for key in HIGHER_IS_BETTER:
+        if key in baseline and result[key] < baseline[key] * (1 - tolerance):
+            regressions.append(f"{key}: {result[key]:.3f} < baseline {baseline[key]:.3f}")
+    for key in LOWER_IS_BETTER:
+        if key in baseline and result[key] > baseline[key] * (1 + tolerance) + 1e-3:
+            regressions.append(f"{key}: {result[key]:.3f} > baseline {baseline[key]:.3f}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("-n", type=int, default=1000, help="合成语料条数")
+    parser.add_argument("--corpus", help="回放的 update 语料（jsonl）")
+    parser.add_argument("--dump-corpus", help="把合成语料写到该文件后退出")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--rate", type=float, default=0.0, help="开环注入速率（updates/s，0 = 一次性灌入）")
+    parser.add_argument("--workers", type=int, default=32, help="CONCURRENT_UPDATES")
+    parser.add_argument("--coalesce-delay", type=float, default=0.2, help="DM_COALESCE_DELAY")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="相对基线允许的退化比例")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    if args.dump_corpus:
+        with open(args.dump_corpus, "w", encoding="utf-8") as f:
+            for upd in synth_corpus(args.n, args.seed):
+                f.write(json.dumps(upd, ensure_ascii=False) + "\n")
+        return
+
+    wrong = check_fast_intent()
+    if wrong:
+        print("❌ Fast-path parse checks failed:\n  " + "\n  ".join(wrong))
+        sys.exit(1)
+
+    result = asyncio.run(run(args))
+    report(result, args.profile)
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    key = args.profile if not args.corpus else f"{args.profile}:{os.path.basename(args.corpus)}"
+    if args.update_baseline:
+        baselines[key] = {k: round(v, 4) for k, v in result.items() if k in HIGHER_IS_BETTER + LOWER_IS_BETTER}
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"📌 Baseline '{key}' updated.")
+        return
+
+    if key not in baselines:
+        print(f"ℹ️ No baseline for '{key}' (run with --update-baseline to record one).")
+        return
+    regressions = compare(result, baselines[key], args.tolerance)
+    if regressions:
+        print("❌ Regression vs baseline:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print(f"✅ Within {args.tolerance:.0%} of baseline '{key}'.")
+
+
+if __name__ == "__main__":
+    main()
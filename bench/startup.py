@@ -0,0 +1,161 @@
+"""
+启动耗时压测：每轮起一个全新的解释器子进程，分阶段计时
+    import_handlers : import src.bot.handlers（单测 / 工具脚本 import handler 的代价）
+    import_main     : 在此基础上 import src.main（commands、telemetry 等其余模块）
+    build_app       : main.build_application()
+    load_services   : main.load_services() + main.start_scheduler()（读 JSON 存储、启动调度器、重挂 reminder）
+    ready           : 以上之和，容器从启动到能开始拉 update 的时间（不含解释器自身启动）
+    ai_client       : 首次访问 agent.client（import openai，启动后在后台线程里预热，不计入 ready）
+取多轮中位数，与 bench/baseline.json 里的 "startup" 基线对比，退化超过容忍度时退出码为 1。
+
+运行：
+    python -m bench.startup                     # 5 轮，对比基线
+    python -m bench.startup --importtime        # 额外列出最慢的顶层 import
+    python -m bench.startup --tasks 5000        # 更大的任务库
+    python -m bench.startup --update-baseline   # 用本次结果覆盖基线
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from bench.fake_telegram import FAKE_TOKEN
+from bench.replay import BASELINE_FILE
+
+BASELINE_KEY = "startup"
+PHASES = ("import_handlers", "import_main", "build_app", "load_services", "ready", "ai_client")
+# 参与基线对比的阶段（越小越好）
+COMPARED = ("import_handlers", "ready")
+
+_CHILD = r"""
+import json, time
+t = time.perf_counter
+out = {}
+s = t(); import src.bot.handlers; out["import_handlers"] = t() - s
+s = t(); import src.main; out["import_main"] = t() - s
+s = t(); app = src.main.build_application(); out["build_app"] = t() - s
+from src.services.scheduler import scheduler_service
+s = t(); src.main.load_services(); src.main.start_scheduler(app); out["load_services"] = t() - s
+out["ready"] = out["import_handlers"] + out["import_main"] + out["build_app"] + out["load_services"]
+from src.services.ai_agent import agent
+s = t(); agent.client; out["ai_client"] = t() - s
+scheduler_service.scheduler.shutdown(wait=False)
+print(json.dumps(out))
+"""
+
+
+def _prepare_data(data_dir: str, tasks: int) -> None:
+    """造一份规模可控的数据目录：任务（含未来的 reminder）、黑名单、chat 模式。"""
+    now = datetime.now()
+    data: Dict[str, List[dict]] = {"todo": [], "reminder": [], "days": [], "annis": []}
+    for i in range(tasks):
+        category = ("todo", "reminder", "days", "annis")[i % 4]
+        entry = {"id": 1_700_000_000 + i, "title": f"task {i} 买牛奶 #{i % 50}", "tags": [f"tag{i % 30}"]}
+        if category == "reminder":
+            entry["datetime"] = (now + timedelta(days=1, minutes=i)).isoformat(timespec="seconds")
+        data[category].append(entry)
+    files = {
+        "tasks.json": data,
+        "blacklist.json": {"banned": list(range(10_000, 10_500)), "warnings": {}},
+        "chat_modes.json": {str(uid): "chat" for uid in range(2001, 2101)},
+    }
+    for name, payload in files.items():
+        with open(os.path.join(data_dir, name), "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+
+
+def _env(data_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_BOT_TOKEN": FAKE_TOKEN,
+        "OPENAI_API_KEY": "sk-bench",
+        "OWNER_IDS": "1",
+        "DATA_DIR": data_dir,
+        "LOG_LEVEL": "WARNING",
+        "METRICS_PORT": "0",
+    })
+    return env
+
+
+def run_once(data_dir: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", _CHILD]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(cmd, cwd=root, env=_env(data_dir), capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(f"❌ Startup child failed:\n{proc.stderr[-2000:]}")
+    return proc
+
+
+def slowest_imports(stderr: str, top: int = 15) -> List[tuple]:
+    """解析 -X importtime 输出，返回 (累计 ms, 模块) 里最慢的顶层 import。"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        if not cumulative_us.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            rows.append((int(cumulative_us) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--rounds", type=int, default=5)
+    parser.add_argument("--tasks", type=int, default=2000, help="任务库条数")
+    parser.add_argument("--importtime", action="store_true", help="列出最慢的顶层 import")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="相对基线允许的退化比例（import 耗时抖动较大）")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="atrioly-startup-")
+    _prepare_data(data_dir, args.tasks)
+
+    runs = [json.loads(run_once(data_dir).stdout.strip().splitlines()[-1]) for _ in range(args.rounds)]
+    result = {phase: statistics.median(r[phase] for r in runs) for phase in PHASES}
+
+    print(f"\n=== startup · {args.rounds} rounds · {args.tasks} tasks (median) ===")
+    for phase in PHASES:
+        print(f"{phase:<16} {result[phase] * 1000:8.1f}ms")
+
+    if args.importtime:
+        print("\n-- slowest top-level imports (cumulative) --")
+        for ms, name in slowest_imports(run_once(data_dir, importtime=True).stderr):
+            print(f"{ms:8.1f}ms  {name}")
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    if args.update_baseline:
+        baselines[BASELINE_KEY] = {k: round(result[k] * 1000, 1) for k in COMPARED}
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"📌 Baseline '{BASELINE_KEY}' updated.")
+        return
+
+    if BASELINE_KEY not in baselines:
+        print(f"ℹ️ No baseline for '{BASELINE_KEY}' (run with --update-baseline to record one).")
+        return
+    baseline = baselines[BASELINE_KEY]
+    regressions = [
+        f"{k}: {result[k] * 1000:.1f}ms > baseline {baseline[k]:.1f}ms"
+        for k in COMPARED
+        if k in baseline and result[k] * 1000 > baseline[k] * (1 + args.tolerance)
+    ]
+    if regressions:
+        print("❌ Regression vs baseline:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print(f"✅ Within {args.tolerance:.0%} of baseline '{BASELINE_KEY}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Webhook 模式并发 / 顺序验证。
+
+用本地 FakeTelegram 充当 Bot API，把 N 个 chat 交错的 update 依次 POST 到
+PTB 的 webhook server，handler 随机 sleep 模拟慢 IO，然后检查：
+  1. 每个 chat 内部处理顺序 == 发送顺序
+  2. 不同 chat 之间确实并行（吞吐对比 CONCURRENT_UPDATES=1）
+
+运行：
+    python -m bench.webhook_ordering --chats 20 --per-chat 25 --workers 32
+"""
+import argparse
+import asyncio
+import random
+import socket
+import sys
+import time
+from collections import defaultdict
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, ContextTypes, MessageHandler, filters
+
+from bench.fake_telegram import FAKE_TOKEN, FakeTelegram, make_text_update
+from src.bot.update_processor import ChatSequencedUpdateProcessor
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_once(chats: int, per_chat: int, workers: int, max_delay: float) -> dict:
+    fake = FakeTelegram()
+    await fake.start()
+
+    seen = defaultdict(list)
+    done = asyncio.Event()
+    total = chats * per_chat
+    rng = random.Random(42)
+
+    async def _record(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await asyncio.sleep(rng.uniform(0, max_delay))
+        seen[update.effective_chat.id].append(int(update.effective_message.text))
+        if sum(len(v) for v in seen.values()) >= total:
+            done.set()
+
+    app = (
+        ApplicationBuilder()
+        .token(FAKE_TOKEN)
+        .base_url(fake.base_url)
+        .concurrent_updates(ChatSequencedUpdateProcessor(workers))
+        .build()
+    )
+    app.add_handler(MessageHandler(filters.TEXT, _record))
+
+    port = _free_port()
+    webhook = f"http://127.0.0.1:{port}/telegram"
+    async with app:
+        await app.updater.start_webhook(
+            listen="127.0.0.1", port=port, url_path="telegram", webhook_url=webhook
+        )
+        await app.start()
+
+        # 交错发送：chat0#0, chat1#0, ..., chat0#1, chat1#1, ...
+        updates = [
+            make_text_update(seq * chats + c + 1, -1000 - c, str(seq))
+            for seq in range(per_chat)
+            for c in range(chats)
+        ]
+        t0 = time.perf_counter()
+        await fake.post_updates(webhook, updates)
+        await asyncio.wait_for(done.wait(), timeout=120)
+        elapsed = time.perf_counter() - t0
+
+        await app.updater.stop()
+        await app.stop()
+    await fake.stop()
+
+    ordered = all(v == sorted(v) and len(v) == per_chat for v in seen.values())
+    return {"workers": workers, "elapsed": elapsed, "ups": total / elapsed, "ordered": ordered}
+
+
+async def main_async(args) -> int:
+    baseline = await run_once(args.chats, args.per_chat, 1, args.max_delay)
+    concurrent = await run_once(args.chats, args.per_chat, args.workers, args.max_delay)
+    for r in (baseline, concurrent):
+        print(
+            f"workers={r['workers']:>3} | {r['elapsed']:.2f}s | "
+            f"{r['ups']:.1f} updates/s | per-chat order {'OK' if r['ordered'] else 'BROKEN'}"
+        )
+    speedup = concurrent["ups"] / baseline["ups"]
+    print(f"speedup x{speedup:.1f}")
+    return 0 if baseline["ordered"] and concurrent["ordered"] else 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--per-chat", type=int, default=25)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--max-delay", type=float, default=0.02, help="handler 随机耗时上限（秒）")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
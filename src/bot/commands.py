@@ -1,5 +1,10 @@
-from telegram import Update
+import json
+import logging
+
+from telegram import InputFile, Update
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
+from telegram.helpers import escape_markdown
 from telegram.ext import ContextTypes
 
 from src.config import settings
@@ -8,8 +13,22 @@ from src.services.membership import manager
 from src.services.ai_agent import agent
 from src.services.state_manager import state_manager
 from src.services.task_manager import task_manager
+from src.services.overload import overload
+from src.services.ai_usage import usage_stats
+from src.services.fast_intent import fast_intent
+from src.services.vision import image_pipeline
+from src.services.perf import perf
+from src.services.scheduler import scheduler_service
+from src.services.cost_ledger import cost_ledger, month_start_hour
+from src.services.profiler import profiler
+from src.services.shared_state import INSTANCE_ID, StateWriteError, scheduler_leader
+from src.services.group_config import group_config
+from src.bot.task_pages import task_pager, format_entry, SECTION_TITLES
+from src.services.task_index import format_tags
 import datetime
 
+log = logging.getLogger(__name__)
+
 
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -30,7 +49,14 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "`/ai_test <text>` - Test AI logic (group filter)\n"
         "`/mode [chat|forward]` - Switch AI/Human routing\n"
         "`/ping` - Check bot responsiveness\n"
-        "`/listall` - List all stored tasks (owner only)\n"
+        "`/listall [category]` - Browse stored tasks page by page (owner only)\n"
+        "`/search <words>` - Full-text search over tasks (owner only)\n"
+        "`/tag [name]` - Tasks with a tag, or the most used tags (owner only)\n"
+        "`/ai_usage` - AI tokens, cache hits & parse failures (owner only)\n"
+        "`/perf [slow|export|reset]` - Per-stage latency of the message pipeline (owner only)\n"
+        "`/spend [24h|7d|30d|month]` - AI cost by group, user & feature (owner only)\n"
+        "`/profile [seconds]` - Sample the running bot: hot functions, coroutines, loop stalls (owner only)\n"
+        "`/groupcfg [chat_id|here] [profile|default]` - Per-group trigger/model profiles (owner only)\n"
         "**Admin Only:**\n"
         "`/blacklist <uid>` - Ban user\n"
         "`/whitelist <uid>` - Unban user"
@@ -68,13 +94,20 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         annis = 0
 
     now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    load = overload.snapshot()
 
     txt = (
         f"🟢 **Atrioly System v3.0.2**\n"
         f"━━━━━━━━━━━━━━━━━━\n"
         f"🤖 **Model**: `{settings.DEFAULT_MODEL}`\n"
         f"📡 **Mode**: `{mode.upper()}`\n"
-        f"⏰ **Scheduler**: Active (Asia/Shanghai)\n"
+        f"⏰ **Scheduler**: {'Active' if scheduler_service.started else 'Stopped'} "
+        f"({scheduler_service.job_count} jobs, Asia/Shanghai)\n"
+        f"🧭 **Instance**: `{INSTANCE_ID}` "
+        f"({'leader' if scheduler_leader.is_leader else 'standby'}, {settings.STATE_BACKEND} state)\n"
+        f"🚦 **Load**: `{load['name'].upper()}` "
+        f"(in-flight {load['in_flight']}, latency {load['latency']}s, errors {load['error_rate']:.0%})\n"
+        f"🔌 **AI Upstream**: `{agent.breaker.state.upper()}`\n"
         f"📅 **Date**: {now_str}\n"
         f"━━━━━━━━━━━━━━━━━━\n"
         f"**Database Stats:**\n"
@@ -142,7 +175,12 @@ async def cmd_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Invalid mode. Use `chat` or `forward`.")
         return
 
-    state_manager.set_mode(update.effective_user.id, new_mode)
+    try:
+        state_manager.set_mode(update.effective_user.id, new_mode)
+    except StateWriteError as e:
+        log.error(f"❌ Failed to switch mode: {e}")
+        await update.message.reply_text("⚠️ Storage is busy, mode not changed. Please try again.")
+        return
     await update.message.reply_text(
         f"✅ Mode switched to: **{new_mode.upper()}**",
         parse_mode=ParseMode.MARKDOWN,
@@ -153,121 +191,309 @@ async def cmd_ping(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🏓 Pong! System operational.")
 
 
-# -------- NEW: /listall --------
+async def cmd_ai_usage(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """按 AIAgent 方法展示 token 用量、prompt 缓存命中率与 JSON 解析失败率（owner only）。"""
+    if update.effective_user.id not in settings.OWNER_IDS:
+        return
+    fast_total = fast_intent.hits + fast_intent.misses
+    await update.message.reply_text(
+        "📊 **AI Usage (since start)**\n" + usage_stats.render() + "\n"
+        f"⚡ Fast path: `{fast_intent.hits}/{fast_total}` owner commands "
+        f"resolved locally ({fast_intent.coverage:.0%})\n"
+        f"🖼 Image cache: `{image_pipeline.hits}` hits / `{image_pipeline.misses}` vision calls",
+        parse_mode=ParseMode.MARKDOWN,
+    )
+
+
+async def cmd_perf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    消息管线各阶段耗时（owner only）：
+    /perf         各阶段 p50 / p95 / p99 / max（毫秒）
+    /perf slow    最近的慢 update 分段明细
+    /perf export  以 JSON 文件导出直方图 + 慢 trace
+    /perf reset   清空统计
+    """
+    if update.effective_user.id not in settings.OWNER_IDS:
+        return
+    sub = context.args[0].lower() if context.args else ""
+
+    if sub == "reset":
+        perf.reset()
+        await update.message.reply_text("🧹 Perf stats cleared.")
+        return
+    if sub == "export":
+        payload = json.dumps(perf.export(), ensure_ascii=False, indent=2).encode("utf-8")
+        await update.message.reply_document(InputFile(payload, filename="perf.json"))
+        return
+    if sub == "slow":
+        body, title = perf.render_slow(), f"🐢 **Slow updates** (> {settings.PERF_SLOW_MS:.0f}ms)"
+    else:
+        body, title = perf.render(), "⏱ **Pipeline latency**"
+    # 表格可能很长，按 Telegram 单条上限截断
+    await update.message.reply_text(
+        f"{title}\n```\n{body[:3800]}\n```", parse_mode=ParseMode.MARKDOWN
+    )
+
+
+async def _run_profile(message, seconds: int) -> None:
+    try:
+        report = await profiler.run(seconds)
+    except RuntimeError as e:
+        await message.reply_text(f"⚠️ {e}")
+        return
+    await message.reply_text(f"🔬 Profile\n```\n{report.summary()[:3900]}\n```", parse_mode=ParseMode.MARKDOWN)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    await message.reply_document(
+        InputFile(report.folded().encode("utf-8"), filename=f"profile-{stamp}.folded"),
+        caption="Collapsed stacks (flamegraph.pl / speedscope.app)",
+    )
+
+
+async def cmd_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    采样正在运行的进程 N 秒（默认 10）：墙钟热点函数、最忙的协程、CPU 热点、期间的事件循环卡顿，
+    回复文字摘要 + collapsed stack 文件（可直接生成火焰图）。
+    仅 owner 可用。
+    """
+    if update.effective_user.id not in settings.OWNER_IDS:
+        return
+    try:
+        seconds = int(context.args[0]) if context.args else 10
+    except ValueError:
+        await update.message.reply_text("Usage: `/profile [seconds]`", parse_mode=ParseMode.MARKDOWN)
+        return
+    seconds = max(1, min(seconds, settings.PROFILE_MAX_SECONDS))
+    if profiler.running:
+        await update.message.reply_text("⚠️ A profile is already running.")
+        return
+    await update.message.reply_text(f"🔬 Profiling for {seconds}s…")
+    # 放到后台跑：同一 chat 的 update 是串行的，不能让 owner 的后续消息等这几秒
+    context.application.create_task(_run_profile(update.message, seconds), update=update)
+
+
+_SPEND_PERIODS = {"24h": 24, "7d": 7 * 24, "30d": 30 * 24}
 
-def _fmt_tags_hash(raw) -> str:
+
+async def cmd_spend(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    统一把 tags 渲染为系统风格: #reminder #exam #CET_6
-    - 自动去重
-    - 自动补 '#'
-    - 把空格替换为下划线，避免 Markdown 断开
+    AI 费用排行（按群 / 用户 / 功能），数据来自 cost_ledger 的小时桶。
+    用法：/spend [24h|7d|30d|month]（默认本月）
+    仅 owner 可用。
     """
-    if not raw:
-        return ""
-
-    tags = raw if isinstance(raw, list) else [str(raw)]
-    normalized = []
-    seen = set()
-
-    for t in tags:
-        s = str(t).strip()
-        if not s:
-            continue
-        # 空格 -> 下划线，避免拆成两个词
-        s = s.replace(" ", "_")
-        # 自动补 '#'
-        if not s.startswith("#"):
-            s = "#" + s
-        # 去重（不区分大小写）
-        key = s.lower()
-        if key in seen:
-            continue
-        seen.add(key)
-        normalized.append(s)
-
-    if not normalized:
-        return ""
-    return " | Tags: " + " ".join(normalized)
+    if update.effective_user.id not in settings.OWNER_IDS:
+        return
+    period = context.args[0].lower() if context.args else "month"
+    if period in _SPEND_PERIODS:
+        since = int(datetime.datetime.now().timestamp() // 3600) - _SPEND_PERIODS[period]
+        label = f"last {period}"
+    else:
+        since, label = month_start_hour(), "this month"
+
+    data = cost_ledger.top(since)
+    calls, tokens, cost = data["total"]
+    lines = [f"💸 **AI Spend** ({label})", f"Total: `${cost:.2f}` · {calls} calls · {tokens} tokens"]
+
+    def name(key) -> str:
+        return escape_markdown(cost_ledger.names.get(key, str(key)))
+
+    if data["group"]:
+        lines.append("\n👥 **Top groups**")
+        for chat_id, (n, t, c) in data["group"]:
+            budget = cost_ledger.budget(chat_id)
+            note = ""
+            if budget > 0:
+                note = f" · budget ${budget:.2f}" + (" ⛔" if cost_ledger.over_budget(chat_id) else "")
+            lines.append(f"- {name(chat_id)} (`{chat_id}`): `${c:.3f}` · {n} calls{note}")
+    if data["user"]:
+        lines.append("\n👤 **Top users**")
+        for user_id, (n, t, c) in data["user"]:
+            lines.append(f"- {name(user_id)} (`{user_id}`): `${c:.3f}` · {n} calls")
+    if data["method"]:
+        lines.append("\n🧩 **By feature**")
+        for method, (n, t, c) in data["method"]:
+            lines.append(f"- `{method}`: `${c:.3f}` · {n} calls · {t} tokens")
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+
+
+async def cmd_groupcfg(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    按群配置档位（关键词 / 规则集 / 抽样 / 模型档位 / 告警对象），数据在 group_config。
+    用法：
+      /groupcfg                          列出档位与已配置的群
+      /groupcfg <chat_id|here> <档位>     把群切到某个档位（default = 回到默认档）
+      /groupcfg reload                   重新读入 group_config.json
+    仅 owner 可用。
+    """
+    if update.effective_user.id not in settings.OWNER_IDS:
+        return
+    args = context.args or []
+    group_config.load()
+
+    if args and args[0].lower() == "reload":
+        group_config.reload()
+        await update.message.reply_text(
+            f"🔄 Group config reloaded: {len(group_config.profiles)} profiles, {len(group_config.by_chat)} groups."
+        )
+        return
+
+    if len(args) == 2:
+        chat = update.effective_chat
+        if args[0].lower() == "here":
+            chat_id, title = chat.id, chat.title
+        else:
+            try:
+                chat_id = int(args[0])
+            except ValueError:
+                chat_id = None
+            title = cost_ledger.names.get(chat_id)
+        if chat_id is None or (args[0].lower() == "here" and chat.type == "private"):
+            await update.message.reply_text(
+                "Usage: `/groupcfg <chat_id|here> <profile|default>`", parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        name = args[1].lower()
+        try:
+            assigned = group_config.assign(chat_id, None if name == "default" else name, title)
+        except StateWriteError as e:
+            log.error(f"❌ Failed to assign group profile: {e}")
+            await update.message.reply_text("⚠️ Storage is busy, group config not changed. Please try again.")
+            return
+        if not assigned:
+            await update.message.reply_text(
+                f"❌ Unknown profile `{escape_markdown(name)}`. Available: {', '.join(group_config.profiles)}",
+                parse_mode=ParseMode.MARKDOWN,
+            )
+            return
+        profile = group_config.resolve(chat_id)
+        await update.message.reply_text(
+            f"🎛 `{chat_id}` → **{profile.name}** ({profile.describe()})", parse_mode=ParseMode.MARKDOWN
+        )
+        return
+
+    lines = [f"🎛 **Group Profiles** (default: **{group_config.default.name}**)"]
+    for name, profile in group_config.profiles.items():
+        lines.append(f"- **{name}**: `{profile.describe()}`")
+    if group_config.by_chat:
+        lines.append("\n👥 **Configured groups**")
+        for chat_id, profile in group_config.by_chat.items():
+            title = escape_markdown(cost_ledger.names.get(chat_id, str(chat_id)))
+            lines.append(f"- {title} (`{chat_id}`): **{profile.name}**")
+    lines.append("\nSet: `/groupcfg <chat_id|here> <profile|default>` · Reload: `/groupcfg reload`")
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+
+
+# -------- NEW: /listall --------
+
+_LISTALL_ALIASES = {
+    "todo": "todo", "todos": "todo", "待办": "todo",
+    "reminder": "reminder", "reminders": "reminder", "提醒": "reminder",
+    "days": "days", "day": "days", "倒数日": "days",
+    "annis": "annis", "anni": "annis", "纪念日": "annis",
+}
 
 
 async def cmd_listall(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    列出所有 Todo / Reminder / Days / Anniversary。
+    分页列出 Todo / Reminder / Days / Anniversary，底部按钮翻页 / 按类别筛选。
+    用法：/listall [todo|reminder|days|annis]
     仅 owner 可用。
     """
     user_id = update.effective_user.id
     if user_id not in settings.OWNER_IDS:
         return
 
-    todos = task_manager.get_entries("todo")
-    reminders = task_manager.get_entries("reminder")
-    days = task_manager.get_entries("days")
-    annis = task_manager.get_entries("annis")
-
-    lines = ["📋 **All Stored Tasks**"]
-
-    # Todos
-    if todos:
-        lines.append("\n✅ *Todos*")
-        for t in todos:
-            tid = t.get("id", "?")
-            title = t.get("title", "(no title)")
-            note = t.get("note", "")
-            line = f"- [`{tid}`] **{title}**"
-            if note:
-                line += f" — {note}"
-            line += _fmt_tags_hash(t.get("tags"))
-            lines.append(line)
-    else:
-        lines.append("\n✅ *Todos*: _none_")
-
-    # Reminders
-    if reminders:
-        lines.append("\n⏰ *Reminders*")
-        for r in reminders:
-            rid = r.get("id", "?")
-            title = r.get("title", "(no title)")
-            dt = r.get("datetime", "N/A")
-            note = r.get("note", "")
-            line = f"- [`{rid}`] **{title}** — {dt}"
-            if note:
-                line += f" | {note}"
-            line += _fmt_tags_hash(r.get("tags"))
-            lines.append(line)
-    else:
-        lines.append("\n⏰ *Reminders*: _none_")
-
-    # Special Days
-    if days:
-        lines.append("\n📅 *Days*")
-        for d in days:
-            did = d.get("id", "?")
-            title = d.get("title", "(no title)")
-            date = d.get("date") or d.get("datetime") or "N/A"
-            note = d.get("note", "")
-            line = f"- [`{did}`] **{title}** — {date}"
-            if note:
-                line += f" | {note}"
-            line += _fmt_tags_hash(d.get("tags"))
-            lines.append(line)
-    else:
-        lines.append("\n📅 *Days*: _none_")
-
-    # Anniversaries
-    if annis:
-        lines.append("\n🎉 *Anniversaries*")
-        for a in annis:
-            aid = a.get("id", "?")
-            title = a.get("title", "(no title)")
-            date = a.get("date") or a.get("datetime") or "N/A"
-            note = a.get("note", "")
-            line = f"- [`{aid}`] **{title}** — {date}"
-            if note:
-                line += f" | {note}"
-            line += _fmt_tags_hash(a.get("tags"))
-            lines.append(line)
-    else:
-        lines.append("\n🎉 *Anniversaries*: _none_")
+    view = _LISTALL_ALIASES.get(context.args[0].lower(), "all") if context.args else "all"
+    text, markup = task_pager.page(view)
+    await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=markup)
 
-    msg = "\n".join(lines)
-    await update.message.reply_text(msg, parse_mode=ParseMode.MARKDOWN)
+
+async def cb_listall(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/listall 的翻页 / 筛选按钮（callback_data 以 'la:' 开头）。"""
+    query = update.callback_query
+    if update.effective_user.id not in settings.OWNER_IDS:
+        await query.answer()
+        return
+
+    view, direction, cursor = task_pager.parse_callback(query.data)
+    text, markup = task_pager.page(view, direction, cursor)
+    await query.answer()
+    try:
+        await query.edit_message_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=markup)
+    except BadRequest as e:
+        # 重复点击同一个按钮时内容没变，忽略
+        if "not modified" not in str(e).lower():
+            raise
+
+
+# -------- /search & /tag --------
+
+SEARCH_LIMIT = 20
+
+
+def _render_hits(title: str, hits, total: int | None = None) -> str:
+    lines = [title]
+    current = None
+    for category, entry in hits[:SEARCH_LIMIT]:
+        if category != current:
+            current = category
+            lines.append(f"\n{SECTION_TITLES.get(category, category)}")
+        lines.append(format_entry(category, entry))
+    total = len(hits) if total is None else total
+    if total > SEARCH_LIMIT:
+        lines.append(f"\n_… and {total - SEARCH_LIMIT} more_")
+    return "\n".join(lines)
+
+
+async def cmd_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    全文检索任务（标题 / 备注 / 标签，中英文混合，按相关度排序）。
+    用法：/search 报告
+    仅 owner 可用。
+    """
+    if update.effective_user.id not in settings.OWNER_IDS:
+        return
+    query = " ".join(context.args).strip()
+    if not query:
+        await update.message.reply_text("Usage: `/search <words>`", parse_mode=ParseMode.MARKDOWN)
+        return
+
+    hits = task_manager.search(query, k=SEARCH_LIMIT)
+    if not hits:
+        await update.message.reply_text(f"🔍 No tasks match {escape_markdown(query)}.", parse_mode=ParseMode.MARKDOWN)
+        return
+    # 按相关度取 top-K 后再按类别分组展示
+    order = {c: i for i, c in enumerate(SECTION_TITLES)}
+    hits.sort(key=lambda h: order.get(h[0], len(order)))
+    await update.message.reply_text(
+        _render_hits(f"🔍 **Search**: {escape_markdown(query)}", hits), parse_mode=ParseMode.MARKDOWN
+    )
+
+
+async def cmd_tag(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /tag <name>：列出带该标签的任务（不区分大小写，# 可写可不写）
+    /tag       ：列出最常用的标签
+    仅 owner 可用。
+    """
+    if update.effective_user.id not in settings.OWNER_IDS:
+        return
+
+    if not context.args:
+        counts = task_manager.index.tag_counts()
+        if not counts:
+            await update.message.reply_text("🏷 No tags yet.")
+            return
+        lines = ["🏷 **Top Tags**"] + [f"- {escape_markdown(format_tags([t]))} ({n})" for t, n in counts]
+        await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+        return
+
+    tag = " ".join(context.args)
+    total = task_manager.index.tag_size(tag)
+    label = escape_markdown(format_tags([tag]) or tag)
+    if not total:
+        await update.message.reply_text(f"🏷 No tasks tagged {label}.", parse_mode=ParseMode.MARKDOWN)
+        return
+    hits = task_manager.entries_with_tag(tag, limit=SEARCH_LIMIT)
+    await update.message.reply_text(
+        _render_hits(f"🏷 **Tagged** {label} ({total})", hits, total), parse_mode=ParseMode.MARKDOWN
+    )
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set
+
+from telegram import Message, User
+from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
+
+from src.config import settings
+from src.services.ai_agent import agent
+from src.services.blacklist_manager import blacklist
+from src.services.state_manager import state_manager
+from src.services.task_index import format_tags
+from src.services.vision import describe_message
+from src.services.perf import perf
+from src.services.metrics import SPAM_AI
+from src.services.shared_state import StateWriteError
+
+log = logging.getLogger(__name__)
+
+
+class _Burst:
+    def __init__(self, bot, user: User):
+        self.bot = bot
+        self.user = user
+        self.messages: List[Message] = []
+        self.started = time.monotonic()
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+
+class DMCoalescer:
+    """
+    Forward 模式下的私聊合并（debounce）：
+    用户连发几条短消息时，等安静 DM_COALESCE_DELAY 秒后再统一处理——
+    一次 AI 分类、一条合并的 header、一次 forward_messages 批量转发给每个管理员。
+    - 从第一条算起最多等 DM_COALESCE_MAX_WAIT 秒，或攒满 DM_COALESCE_MAX_MESSAGES 条就立即处理
+    - 每条消息的 safety 检查仍在 handler 里逐条进行
+    """
+
+    def __init__(self):
+        self.bursts: Dict[int, _Burst] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def add(self, bot, user: User, msg: Message) -> None:
+        burst = self.bursts.get(user.id)
+        if burst is None:
+            burst = self.bursts[user.id] = _Burst(bot, user)
+        burst.messages.append(msg)
+
+        if settings.DM_COALESCE_DELAY <= 0:
+            # 关闭合并：逐条立即处理
+            await self.flush(user.id)
+            return
+
+        if burst.handle:
+            burst.handle.cancel()
+        waited = time.monotonic() - burst.started
+        if (
+            len(burst.messages) >= settings.DM_COALESCE_MAX_MESSAGES
+            or waited >= settings.DM_COALESCE_MAX_WAIT
+        ):
+            self._spawn(user.id)
+            return
+        delay = min(settings.DM_COALESCE_DELAY, settings.DM_COALESCE_MAX_WAIT - waited)
+        burst.handle = asyncio.get_running_loop().call_later(delay, self._spawn, user.id)
+
+    def _spawn(self, user_id: int) -> None:
+        task = asyncio.create_task(self.flush(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, user_id: int) -> None:
+        burst = self.bursts.pop(user_id, None)
+        if not burst or not burst.messages:
+            return
+        if burst.handle:
+            burst.handle.cancel()
+        try:
+            await self._process(burst)
+        except Exception as e:
+            log.error(f"❌ Failed to process DM burst from {user_id}: {e}")
+
+    async def flush_all(self) -> None:
+        """退出前调用：取消所有计时器，立即处理每个还在攒的 burst，并等待已经在跑的处理任务。"""
+        for burst in self.bursts.values():
+            if burst.handle:
+                burst.handle.cancel()
+        pending = list(self.bursts)
+        if pending:
+            log.info(f"📤 Flushing {len(pending)} pending DM bursts before shutdown")
+        await asyncio.gather(*(self.flush(user_id) for user_id in pending))
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @perf.traced("dm_batch")
+    async def _process(self, burst: _Burst) -> None:
+        user, messages = burst.user, burst.messages
+        perf.annotate(messages=len(messages))
+        with perf.span("describe"):
+            texts = await asyncio.gather(*(describe_message(m) for m in messages))
+        if len(texts) == 1:
+            joined = texts[0]
+        else:
+            joined = "\n".join(f"[{i}] {t}" for i, t in enumerate(texts, 1) if t)
+
+        with perf.span("ai"):
+            analysis = await agent.analyze_private_message(joined)
+
+        # Spam Enforcement（整段只记一次 strike）
+        if analysis.get("is_spam"):
+            SPAM_AI.inc()
+            with perf.span("strike"):
+                try:
+                    status = blacklist.add_strike(user.id)
+                except StateWriteError as e:
+                    # 黑名单存储忙：这次不记 strike，spam 也不转发给管理员
+                    log.error(f"❌ Failed to record strike for {user.id}: {e}")
+                    return
+            if status == "banned":
+                await messages[-1].reply_text("🚫 You have been banned for spam.")
+            return
+
+        tags = escape_markdown(format_tags(analysis.get("tags")))
+        category = analysis.get("category", "general").upper()
+        summary = analysis.get("summary", "No summary")
+        title = "Private Message" if len(messages) == 1 else f"Private Messages ×{len(messages)}"
+
+        header = (
+            f"📨 **{title}** [{category}]\n"
+            f"👤 **From**: {user.full_name} (`{user.id}`)\n"
+            f"🏷 **Tags**: {tags or '—'}\n"
+            f"📝 **Summary**: {summary}\n"
+            f"-----------------------------"
+        )
+
+        message_ids = [m.message_id for m in messages]
+        with perf.span("forward"):
+            for admin_id in settings.get_forward_targets():
+                try:
+                    await burst.bot.send_message(chat_id=admin_id, text=header, parse_mode=ParseMode.MARKDOWN)
+                    # 一次请求转发整段（保持原顺序；最多 100 条）
+                    forwarded = await burst.bot.forward_messages(
+                        chat_id=admin_id, from_chat_id=user.id, message_ids=message_ids
+                    )
+                    for fwd in forwarded:
+                        state_manager.register_forward(fwd.message_id, user.id)
+                except Exception as e:
+                    log.error(f"Failed to forward DM burst to {admin_id}: {e}")
+
+        if len(messages) > 1:
+            log.info("📦 Coalesced %d DMs from %s into one forward", len(messages), user.id, extra={"user_id": user.id})
+
+
+dm_coalescer = DMCoalescer()
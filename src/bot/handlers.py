@@ -1,8 +1,11 @@
 import logging
 import os
+import random
+from datetime import datetime, timezone
 from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, ApplicationHandlerStop
+from telegram.helpers import escape_markdown
 
 from src.config import settings
 from src.services.ai_agent import agent
@@ -10,24 +13,126 @@ from src.services.safety import safety_filter
 from src.services.blacklist_manager import blacklist
 from src.services.state_manager import state_manager
 from src.services.task_manager import task_manager  # NEW
+from src.services.task_index import format_tags
+from src.services.catchup import catchup
+from src.services.overload import overload
+from src.services.fast_intent import fast_intent
+from src.services.vision import describe_message
+from src.services.conversation_memory import conversation_memory
+from src.bot.streaming import stream_reply
+from src.bot.dm_coalescer import dm_coalescer
+from src.bot.media_relay import media_relay
+from src.services.perf import perf
+from src.services.metrics import SPAM_AI, SPAM_KEYWORD, SPAM_SAFETY
+from src.services.cost_ledger import cost_ledger
+from src.services.group_config import GroupProfile, group_config
+from src.services.shared_state import StateWriteError
+from src.utils.log_setup import LogText
 
 # Setup Logger
 log = logging.getLogger(__name__)
 
-def _fmt_tags_hash(tags) -> str:
-    """将标签列表/字符串统一转为 '#tag' 形式。"""
-    if not tags:
-        return "—"
-    # 允许字符串或列表两种输入
-    if isinstance(tags, str):
-        tags = [t.strip() for t in tags.split(",") if t.strip()]
-    return " ".join(
-        f"#{t.strip().replace(' ', '_')}"  # 空格换成下划线，避免分裂标签
-        for t in tags
-        if isinstance(t, str) and t.strip()
+CHAT_FALLBACK = "⚠️ AI 聊天暂时不可用，请稍后再试。"
+# 共享存储写锁超时 / 写入失败（StateWriteError）时给用户的回复：这次修改没有生效
+STATE_BUSY_REPLY = "⚠️ 存储正忙，这次修改没有保存，请稍后重试。"
+
+async def _chat_mode_reply(msg, user_id: int, text: str) -> None:
+    """Chat 模式：带上该用户的会话记忆调用 AI，回复成功后写回记忆。"""
+    history = conversation_memory.context(user_id)
+    if settings.CHAT_STREAMING:
+        with perf.span("chat"):
+            reply_text = await stream_reply(msg, agent.chat_reply_stream(text, history), CHAT_FALLBACK)
+    else:
+        with perf.span("chat"):
+            try:
+                reply_text = await agent.chat_reply(text, history)
+            except Exception as e:
+                log.error(f"❌ chat_reply failed for user {user_id}: {e}")
+                reply_text = CHAT_FALLBACK
+        with perf.span("reply"):
+            await msg.reply_text(reply_text, parse_mode=ParseMode.MARKDOWN)
+
+    # 失败兜底 / 未配置 key 的提示不进记忆
+    if reply_text and not reply_text.startswith("⚠️"):
+        with perf.span("memory"):
+            await conversation_memory.record(user_id, text, reply_text)
+
+
+def _created_card(action: str, entry: dict) -> str:
+    """新建任务后的回复卡片。"""
+    return (
+        f"✅ **Created {action.upper()}**\n"
+        f"📌 {escape_markdown(entry.get('title') or 'No title')}\n"
+        f"🕒 {escape_markdown(str(entry.get('datetime') or entry.get('date') or 'N/A'))}\n"
+        f"🏷 {escape_markdown(format_tags(entry.get('tags'), empty='—'))}"
     )
 
 
+async def _apply_fast_command(msg, fast: dict) -> bool:
+    """执行本地解析出的删除 / 列出指令；找不到目标时返回 False，交回 AI 流程。"""
+    if "id" in fast:
+        for category in ("todo", "reminder", "days", "annis"):
+            entry = task_manager.index.docs.get((category, fast["id"]))
+            if entry and task_manager.delete_entry(category, fast["id"]):
+                await msg.reply_text(
+                    f"🗑 已删除 {category} `{fast['id']}`：{escape_markdown(entry.get('title') or '(no title)')}",
+                    parse_mode=ParseMode.MARKDOWN,
+                )
+                return True
+        return False
+
+    target = fast.get("target")
+    entries = task_manager.get_entries(target)
+    if not entries:
+        await msg.reply_text(f"📭 当前没有 {target}。")
+        return True
+    lines = [f"📋 **{target.upper()}** ({len(entries)})"]
+    for e in entries[:30]:
+        when = e.get("datetime") or e.get("date")
+        title = escape_markdown(e.get("title") or "(no title)")
+        lines.append(f"- [`{e.get('id', '?')}`] {title}" + (f" — {escape_markdown(str(when))}" if when else ""))
+    if len(entries) > 30:
+        lines.append(f"… 还有 {len(entries) - 30} 条，用 /listall 查看全部")
+    await msg.reply_text("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+    return True
+
+
+async def _budget_alert(bot, chat_id: int, chat_title: str, profile: GroupProfile) -> None:
+    """群本月 AI 预算用完时通知管理员（每群每月一次）。"""
+    if not cost_ledger.take_budget_alert(chat_id):
+        return
+    spent = cost_ledger.month_spend.get(chat_id, 0.0)
+    log.warning(f"💸 AI budget exceeded for group {chat_id} (${spent:.2f}), switching to keyword-only")
+    text = (
+        f"💸 **AI Budget Exceeded**\n"
+        f"👥 {chat_title or chat_id} (`{chat_id}`)\n"
+        f"📊 ${spent:.2f} / ${cost_ledger.budget(chat_id):.2f} this month\n"
+        f"Switched to keyword-only scanning until next month."
+    )
+    for admin in profile.alert_targets():
+        try:
+            await bot.send_message(chat_id=admin, text=text, parse_mode=ParseMode.MARKDOWN)
+        except Exception as e:
+            log.error(f"❌ Failed to send budget alert to {admin}: {e}")
+
+
+async def handle_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    PTB 全局 error handler：handler 里没接住的异常记完整堆栈，私聊里给用户一个重试提示，
+    不让这条 update 无声无息地失败（群里不回，避免刷屏）。
+    """
+    log.error("❌ Unhandled error while processing update: %s", context.error, exc_info=context.error)
+    if not isinstance(update, Update) or not update.effective_message or not update.effective_chat:
+        return
+    if update.effective_chat.type != "private":
+        return
+    text = STATE_BUSY_REPLY if isinstance(context.error, StateWriteError) else "⚠️ 处理这条消息时出错，请稍后重试。"
+    try:
+        await update.effective_message.reply_text(text)
+    except Exception as e:
+        log.error(f"❌ Failed to send error reply: {e}")
+
+
 async def gatekeeper_middleware(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     PRIORITY -1: Checks if user is banned.
@@ -38,6 +143,7 @@ async def gatekeeper_middleware(update: Update, context: ContextTypes.DEFAULT_TY
         raise ApplicationHandlerStop
 
 
+@perf.traced("group")
 async def handle_group_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = update.effective_message
 
@@ -48,38 +154,89 @@ async def handle_group_message(update: Update, context: ContextTypes.DEFAULT_TYP
     text = msg.text
     user = update.effective_user
     chat_title = update.effective_chat.title
+    # 每条群消息都会打的日志：懒格式化 + 结构化字段，按 stage 采样（LOG_SAMPLING）
+    ids = {"chat_id": update.effective_chat.id, "user_id": user.id}
 
     # --- DEBUG LOG: Message Receipt ---
     log.info(
-        f"📩 GROUP MSG RECEIVED | Group: '{chat_title}' | "
-        f"User: {user.full_name} | Text: '{text[:50]}...'"
+        "📩 GROUP MSG RECEIVED | Group: '%s' | User: %s | Text: '%s'",
+        chat_title, user.full_name, LogText(text),
+        extra={"stage": "group.receive", **ids},
     )
 
+    # --- 0. Group Profile (按群配置：关键词 / 规则集 / 抽样 / 模型档位 / 告警对象，一次查表) ---
+    profile = group_config.resolve(update.effective_chat.id)
+    perf.annotate(profile=profile.name)
+
     # --- 1. Zero-Cost Safety Check ---
-    if safety_filter.is_obvious_spam(text):
-        log.info(f"🛡️ SPAM DETECTED (Layer 1) | Dropping message from {user.id}")
+    with perf.span("safety"):
+        is_spam = profile.is_spam(text)
+    if is_spam:
+        log.info("🛡️ SPAM DETECTED (Layer 1) | Dropping message from %s", user.id, extra={"stage": "group.spam", **ids})
+        perf.annotate(outcome="spam_l1")
+        SPAM_SAFETY.inc()
         return
 
     # --- 2. Relevance Trigger Check ---
-    triggers = [
-        "车", "合租", "会员", "Netflix", "奈飞", "Disney", "迪士尼",
-        "YouTube", "HBO", "Prime", "sub", "share", "Apple", "Spotify",
-    ]
-    is_relevant_keyword = any(t.lower() in text.lower() for t in triggers)
+    with perf.span("keyword"):
+        is_relevant_keyword = profile.matches(text)
 
     if not is_relevant_keyword:
-        log.info("⏭️ SKIPPED (No Keyword) | Text did not contain membership keywords.")
+        log.info("⏭️ SKIPPED (No Keyword) | Text did not contain membership keywords.", extra={"stage": "group.skip", **ids})
+        perf.annotate(outcome="no_keyword")
         return
     else:
-        log.info("✅ KEYWORD MATCHED | Proceeding to AI Analysis.")
+        log.info("✅ KEYWORD MATCHED | Proceeding to AI Analysis.", extra={"stage": "group.match", **ids})
+
+    # --- 2.5 Stale Backlog (重启后积压) → 廉价路径 + 汇总 digest ---
+    if catchup.is_stale(msg.date):
+        log.info("📦 STALE MESSAGE | Deferred to catch-up digest.", extra={"stage": "group.stale", **ids})
+        catchup.add(context.bot, update.effective_chat.id, chat_title, user.full_name, text, msg.link)
+        perf.annotate(outcome="stale")
+        return
+
+    # --- 2.6 Overload Control (自适应降载) ---
+    if msg.date:
+        overload.observe_queue_age(
+            (datetime.now(timezone.utc) - msg.date).total_seconds()
+        )
+    level = overload.level
+    if level >= 1 and not profile.matches(text, strict=True):
+        log.info("🚦 SKIPPED (Overload strict) | No strong keyword.", extra={"stage": "group.overload", **ids})
+        perf.annotate(outcome="overload_strict")
+        return
+    if level == 2 and overload.should_sample_out(update.effective_chat.id, profile.priority):
+        log.info("🚦 SKIPPED (Overload sample) | Non-priority group sampled out.", extra={"stage": "group.overload", **ids})
+        perf.annotate(outcome="overload_sample")
+        return
+
+    # --- 2.7 Monthly AI Budget (按群) ---
+    over_budget = cost_ledger.over_budget(update.effective_chat.id)
+    if over_budget:
+        await _budget_alert(context.bot, update.effective_chat.id, chat_title, profile)
 
     # --- 3. AI Analysis ---
+    # 群档位的廉价路径：model_tier=none 的群从不调 AI，抽样没抽中的消息也只做关键词判定
+    sampled_out = profile.sample_rate < 1.0 and random.random() >= profile.sample_rate
+    keyword_only = level >= 3 or over_budget or profile.keyword_only or sampled_out
     try:
-        log.info("🧠 Sending to AI Agent for context analysis...")
-        analysis = await agent.analyze_message(text)
-        log.info(f"🧠 AI RESULT: {analysis}")
+        if level >= 3:
+            log.info("🚦 Overload keyword-only mode, skipping AI.", extra={"stage": "group.ai", **ids})
+            analysis = agent.keyword_verdict(text, "Overload keyword-only mode")
+        elif over_budget:
+            log.info("💸 Group over monthly AI budget, keyword-only.", extra={"stage": "group.ai", **ids})
+            analysis = agent.keyword_verdict(text, "Monthly AI budget exceeded")
+        elif keyword_only:
+            log.info("🎛 Group profile '%s' keyword path, skipping AI.", profile.name, extra={"stage": "group.ai", **ids})
+            analysis = agent.keyword_verdict(text, f"Group profile '{profile.name}' keyword path")
+        else:
+            log.info("🧠 Sending to AI Agent for context analysis...", extra={"stage": "group.ai", **ids})
+            with perf.span("ai"):
+                analysis = await agent.analyze_message(text, model=profile.model)
+        log.info("🧠 AI RESULT: %s", LogText(analysis), extra={"stage": "group.result", **ids})
     except Exception as e:
-        log.error(f"❌ AI ERROR: {e}")
+        log.error("❌ AI ERROR: %s", e, extra=ids)
+        perf.annotate(outcome="ai_error")
         return
 
     # --- 4. Logic Branching ---
@@ -87,23 +244,31 @@ async def handle_group_message(update: Update, context: ContextTypes.DEFAULT_TYP
     # Branch A: Spam Enforcement
     if analysis.get("is_spam"):
         reason = analysis.get("spam_reason", "Spam detected")
-        log.warning(f"🤖 AI SPAM DETECTED | Reason: {reason}")
+        log.warning("🤖 AI SPAM DETECTED | Reason: %s", LogText(reason), extra=ids)
+        perf.annotate(outcome="spam_ai")
+        (SPAM_KEYWORD if keyword_only else SPAM_AI).inc()
 
-        status = blacklist.add_strike(user.id)
+        with perf.span("strike"):
+            try:
+                status = blacklist.add_strike(user.id)
+            except StateWriteError as e:
+                # 黑名单存储忙：这次不记 strike（群里不打扰），下一条 spam 还会再判
+                log.error("❌ Failed to record strike: %s", e, extra=ids)
+                return
 
         if status == "banned":
             await msg.reply_text(
                 f"🚫 **System Alert**\nUser {user.mention_html()} has been banned.\nReason: {reason}",
                 parse_mode="HTML",
             )
-            log.info(f"🚫 User {user.id} BANNED.")
+            log.info("🚫 User %s BANNED.", user.id, extra=ids)
         elif status == "warned":
             count = blacklist.get_strike_count(user.id)
             await msg.reply_text(
                 f"⚠️ **Warning ({count}/3)**\n{user.mention_html()}, message flagged: {reason}",
                 parse_mode="HTML",
             )
-            log.info(f"⚠️ User {user.id} WARNED.")
+            log.info("⚠️ User %s WARNED.", user.id, extra=ids)
         return
 
     # Branch B: Membership Opportunity
@@ -111,7 +276,8 @@ async def handle_group_message(update: Update, context: ContextTypes.DEFAULT_TYP
         platform = analysis.get("platform", "Unknown")
         summary = analysis.get("summary", "No details")
 
-        log.info(f"💎 MEMBERSHIP FOUND | Platform: {platform} | Forwarding to admins...")
+        log.info("💎 MEMBERSHIP FOUND | Platform: %s | Forwarding to admins...", platform, extra=ids)
+        perf.annotate(outcome="membership")
 
         alert_msg = (
             f"💠 **Verified Opportunity**\n"
@@ -120,23 +286,26 @@ async def handle_group_message(update: Update, context: ContextTypes.DEFAULT_TYP
             f"🔗 [Original Message]({msg.link})"
         )
 
-        targets = settings.get_forward_targets()
+        targets = profile.alert_targets()
         if not targets:
             log.warning("⚠️ No FORWARD_TO targets configured!")
 
-        for admin in targets:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin, text=alert_msg, parse_mode=ParseMode.MARKDOWN
-                )
-                log.info(f"🚀 Sent alert to Admin ID: {admin}")
-            except Exception as e:
-                log.error(f"❌ Failed to forward to {admin}: {e}")
+        with perf.span("forward"):
+            for admin in targets:
+                try:
+                    await context.bot.send_message(
+                        chat_id=admin, text=alert_msg, parse_mode=ParseMode.MARKDOWN
+                    )
+                    log.info("🚀 Sent alert to Admin ID: %s", admin, extra={"stage": "group.forward", **ids})
+                except Exception as e:
+                    log.error(f"❌ Failed to forward to {admin}: {e}")
     else:
-        log.info("📉 AI determined message was NOT a membership offer.")
+        log.info("📉 AI determined message was NOT a membership offer.", extra={"stage": "group.result", **ids})
+        perf.annotate(outcome="not_membership")
 
 
 # --- Private Logic (Owner Secretary + User Support) ---
+@perf.traced("private")
 async def handle_private_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     私聊逻辑分两部分：
@@ -151,165 +320,122 @@ async def handle_private_message(update: Update, context: ContextTypes.DEFAULT_T
     text = msg.text or ""
 
     # 0. Safety Check
-    if safety_filter.is_obvious_spam(text):
+    with perf.span("safety"):
+        is_spam = safety_filter.is_obvious_spam(text or msg.caption or "")
+    if is_spam:
+        perf.annotate(outcome="spam_l1")
+        SPAM_SAFETY.inc()
         return
 
     mode = state_manager.get_mode(user.id)
+    is_owner = user.id in settings.OWNER_IDS
+
+    # 图片：chat 模式和 Owner 秘书模式用「caption + 视觉描述」作为文本（forward 模式在合并时统一处理）
+    if msg.photo and (is_owner or mode == "chat"):
+        with perf.span("vision"):
+            text = await describe_message(msg)
 
     # --- 1. Owner Secretary Mode ---
-    if user.id in settings.OWNER_IDS:
-        log.info(f"Owner private message in mode: {mode}")
+    if is_owner:
+        log.info("Owner private message in mode: %s", mode, extra={"stage": "private.receive", "user_id": user.id})
 
         # CHAT mode for owner: pure AI chat, no task parsing
         if mode == "chat":
-            try:
-                reply_text = await agent.chat_reply(text)
-            except Exception as e:
-                log.error(f"❌ chat_reply failed for owner {user.id}: {e}")
-                reply_text = "⚠️ AI 聊天暂时不可用，请稍后再试。"
-            await msg.reply_text(reply_text, parse_mode=ParseMode.MARKDOWN)
+            perf.annotate(outcome="owner_chat")
+            await _chat_mode_reply(msg, user.id, text)
             return
         else:
-            intent = await agent.analyze_owner_intent(text)
-            action = intent.get("action", "none")
+            if msg.photo and not msg.caption:
+                # 没有附带指令的图片：只回复识别结果
+                await msg.reply_text(f"🖼 {text}")
+                return
+
+            # 0) 本地快速解析：常见的创建 / 删除 / 列出句式直接处理，不调 LLM
+            with perf.span("fast_intent"):
+                fast = fast_intent.parse(text)
+            if fast and fast.pop("kind") != "create":
+                with perf.span("fast_apply"):
+                    try:
+                        applied_fast = await _apply_fast_command(msg, fast)
+                    except StateWriteError as e:
+                        log.error(f"❌ Fast command failed: {e}")
+                        await msg.reply_text(STATE_BUSY_REPLY)
+                        return
+                if applied_fast:
+                    perf.annotate(outcome="fast_command")
+                    return
+                fast_intent.fell_through()
+                fast = None
 
-            if action != "none":
-                # 写入任务系统（创建 todo/reminder/days/annis）
+            if fast:
+                # 本地已确定是新建任务，直接写入
+                perf.annotate(outcome="fast_create")
                 try:
-                    task_manager.add_entry(action, intent)
+                    with perf.span("db"):
+                        task_manager.add_entry(fast["action"], fast)
                 except Exception as e:
                     log.error(f"❌ task_manager.add_entry failed: {e}")
-                    await msg.reply_text(f"⚠️ 创建 {action} 时出错：{e}")
+                    await msg.reply_text(f"⚠️ 创建 {fast['action']} 时出错：{e}")
                     return
-
-                raw_tags = intent.get("tags", [])
-                tags_str = _fmt_tags_hash(raw_tags)
-
-                reply = (
-                    f"✅ **Created {action.upper()}**\n"
-                    f"📌 {intent.get('title') or 'No title'}\n"
-                    f"🕒 {intent.get('datetime') or 'N/A'}\n"
-                    f"🏷 {tags_str}"
-                )
-                await msg.reply_text(reply, parse_mode=ParseMode.MARKDOWN)
+                with perf.span("reply"):
+                    await msg.reply_text(_created_card(fast["action"], fast), parse_mode=ParseMode.MARKDOWN)
                 return
 
-            # action == 'none'：进入“任务管理模式”（更新 / 删除 / 列出）
+            # 1) 单次 AI 调用：新建 / 更新 / 删除 / 查询一起解析，只带入检索出的相关任务
             try:
-                todos = task_manager.get_entries("todo")
-                reminders = task_manager.get_entries("reminder")
-                days = task_manager.get_entries("days")
-                annis = task_manager.get_entries("annis")
+                with perf.span("retrieve"):
+                    scoped = task_manager.relevant_entries(text)
             except Exception as e:
-                log.error(f"❌ Failed to load task lists for manage_tasks_from_chat: {e}")
+                log.error(f"❌ Failed to load task lists for owner command: {e}")
                 await msg.reply_text("⚠️ 读取任务列表失败，暂时无法进行管理操作。")
                 return
 
-            manage_res = await agent.manage_tasks_from_chat(
-                text,
-                todos=todos,
-                reminders=reminders,
-                days=days,
-                annis=annis,
-            )
+            with perf.span("ai"):
+                res = await agent.process_owner_command(text, scoped)
 
-            if not manage_res.get("ok"):
-                # AI 未能可靠解析当前指令
-                log.warning(f"manage_tasks_from_chat returned not ok: {manage_res}")
+            if not res.get("ok"):
+                # AI 未能可靠解析当前指令（或只是闲聊）
+                log.warning("process_owner_command returned not ok: %s", LogText(res))
+                perf.annotate(outcome="owner_not_ok")
                 await msg.reply_text("🤖 没有完全理解这条任务管理指令，未对现有任务做修改。")
                 return
 
-            ops = manage_res.get("operations", [])
-            for op in ops:
-                op_type = op.get("op")
-                target = op.get("target")
-                if target not in ("todo", "reminder", "days", "annis"):
-                    continue
+            # 2) 所有操作一次性落库
+            with perf.span("db"):
+                try:
+                    applied = task_manager.apply_operations(res.get("operations", []))
+                except StateWriteError as e:
+                    log.error(f"❌ apply_operations failed: {e}")
+                    await msg.reply_text(STATE_BUSY_REPLY)
+                    return
+            perf.annotate(outcome="owner_ops", ops=len(applied))
 
-                if op_type == "create":
-                    data = op.get("data") or {}
-                    try:
-                        task_manager.add_entry(target, data)
-                    except Exception as e:
-                        log.error(f"❌ add_entry failed in manage_tasks_from_chat: {e}")
-                elif op_type == "update":
-                    entry_id = op.get("id")
-                    data = op.get("data") or {}
-                    if entry_id is not None:
-                        try:
-                            task_manager.update_entry(target, entry_id, data)
-                        except Exception as e:
-                            log.error(f"❌ update_entry failed in manage_tasks_from_chat: {e}")
-                elif op_type == "delete":
-                    entry_id = op.get("id")
-                    if entry_id is not None:
-                        try:
-                            task_manager.delete_entry(target, entry_id)
-                        except Exception as e:
-                            log.error(f"❌ delete_entry failed in manage_tasks_from_chat: {e}")
-                else:
-                    # 'list' 或其他无状态操作，不需要直接改数据库
-                    continue
-
-            reply_text = manage_res.get("reply_text") or "已根据你的指令更新任务。"
-            await msg.reply_text(f"🤖 {reply_text}")
+            if len(applied) == 1 and applied[0]["op"] == "create":
+                only = applied[0]
+                await msg.reply_text(
+                    _created_card(only["target"], only["data"]), parse_mode=ParseMode.MARKDOWN
+                )
+                return
+
+            reply_text = res.get("reply_text") or "已根据你的指令更新任务。"
+            with perf.span("reply"):
+                await msg.reply_text(f"🤖 {reply_text}")
             return
 
     # --- 2. 普通用户：根据 mode 切换 Chat / Forward ---
 
-    log.info(f"Private message mode for user {user.id}: {mode}")
+    log.info("Private message mode for user %s: %s", user.id, mode, extra={"stage": "private.receive", "user_id": user.id})
 
     # 2.1 Chat 模式：直接用 AI 回复用户，不再转发给管理员
     if mode == "chat":
-        try:
-            reply_text = await agent.chat_reply(text)
-        except Exception as e:
-            log.error(f"❌ chat_reply failed for user {user.id}: {e}")
-            reply_text = "⚠️ AI 聊天暂时不可用，请稍后再试。"
-        await msg.reply_text(reply_text, parse_mode=ParseMode.MARKDOWN)
-        return
-
-    # 2.2 Forward 模式（默认）：先做 AI 分类，再转发给管理员
-    analysis = await agent.analyze_private_message(text)
-
-    # Spam Enforcement
-    if analysis.get("is_spam"):
-        status = blacklist.add_strike(user.id)
-        if status == "banned":
-            await msg.reply_text("🚫 You have been banned for spam.")
+        perf.annotate(outcome="chat")
+        await _chat_mode_reply(msg, user.id, text)
         return
 
-    # 构造转发头信息
-    tags = " ".join([f"#{t}" for t in analysis.get("tags", [])])
-    category = analysis.get("category", "general").upper()
-    summary = analysis.get("summary", "No summary")
-
-    header = (
-        f"📨 **Private Message** [{category}]\n"
-        f"👤 **From**: {user.full_name} (`{user.id}`)\n"
-        f"🏷 **Tags**: {tags or '—'}\n"
-        f"📝 **Summary**: {summary}\n"
-        f"-----------------------------"
-    )
-
-    targets = settings.get_forward_targets()
-    for admin_id in targets:
-        try:
-            # Header
-            await context.bot.send_message(
-                chat_id=admin_id, text=header, parse_mode=ParseMode.MARKDOWN
-            )
-            # Forward 原始消息（保留上下文 / 媒体）
-            fwd_msg = await context.bot.forward_message(
-                chat_id=admin_id,
-                from_chat_id=user.id,
-                message_id=msg.message_id,
-            )
-            # 注册回复桥接
-            state_manager.register_forward(fwd_msg.message_id, user.id)
-
-        except Exception as e:
-            log.error(f"Failed to forward DM to {admin_id}: {e}")
+    # 2.2 Forward 模式（默认）：短时间内的连发消息合并后再做 AI 分类，并转发给管理员
+    perf.annotate(outcome="forward")
+    with perf.span("coalesce"):
+        await dm_coalescer.add(context.bot, user, msg)
 
     # 如需给普通用户一个确认，可以在这里打开：
     # await msg.reply_text("Your message has been received by support.")
@@ -336,12 +462,11 @@ async def handle_admin_reply(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # 3. 查找原始发送者
     original_user_id = state_manager.get_original_sender(msg.reply_to_message.message_id)
     if not original_user_id:
-        # 可能回复到了 header 或者非映射消息，忽略
+        # 回复的不是转发消息（header / Bot 自己的秘书回复等）：这条 update 已被本 handler 接走，
+        # 不会再轮到下面的私聊 handler，这里按它的过滤条件（文字 / 图片）手动交给它
+        if msg.text or msg.photo:
+            await handle_private_message(update, context)
         return
 
-    # 4. 回发给原始用户
-    try:
-        await context.bot.send_message(chat_id=original_user_id, text=msg.text)
-        await msg.reply_text(f"✅ Sent to user `{original_user_id}`")
-    except Exception as e:
-        await msg.reply_text(f"❌ Failed to send: {e}")
+    # 4. 回发给原始用户（copy_message 由服务端复制，文字 / 图片 / 语音 / 文件 / 相册都支持）
+    await media_relay.relay(context.bot, msg, original_user_id)
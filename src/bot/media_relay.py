@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from typing import Dict, List, Set, Tuple
+
+from telegram import Message
+
+log = logging.getLogger(__name__)
+
+
+class MediaRelay:
+    """
+    回复桥接的消息转发：用 copy_message / copy_messages 让 Telegram 服务端按 file_id 复制，
+    任何类型（文字、图片、语音、文件、贴纸…）都不经过 Bot 下载再上传，大附件也是瞬时完成。
+    相册（media_group_id 相同的多条 update）先攒 ALBUM_WAIT 秒，再用一次 copy_messages
+    整组发出，对方收到的仍然是一个相册。
+    """
+
+    ALBUM_WAIT = 1.0
+
+    def __init__(self):
+        # (admin_chat_id, media_group_id) -> (target_user_id, [messages])
+        self.albums: Dict[Tuple[int, str], Tuple[int, List[Message]]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def relay(self, bot, msg: Message, target_id: int) -> None:
+        if not msg.media_group_id:
+            await self._send(bot, msg, target_id, [msg.message_id])
+            return
+
+        key = (msg.chat_id, msg.media_group_id)
+        album = self.albums.get(key)
+        if album is None:
+            self.albums[key] = (target_id, [msg])
+            task = asyncio.create_task(self._flush_album(bot, key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            album[1].append(msg)
+
+    async def _flush_album(self, bot, key: Tuple[int, str]) -> None:
+        await asyncio.sleep(self.ALBUM_WAIT)
+        target_id, messages = self.albums.pop(key)
+        messages.sort(key=lambda m: m.message_id)
+        await self._send(bot, messages[0], target_id, [m.message_id for m in messages])
+
+    @staticmethod
+    async def _send(bot, anchor: Message, target_id: int, message_ids: List[int]) -> None:
+        try:
+            if len(message_ids) == 1:
+                await bot.copy_message(
+                    chat_id=target_id, from_chat_id=anchor.chat_id, message_id=message_ids[0]
+                )
+            else:
+                await bot.copy_messages(
+                    chat_id=target_id, from_chat_id=anchor.chat_id, message_ids=message_ids
+                )
+            suffix = f" ({len(message_ids)} items)" if len(message_ids) > 1 else ""
+            await anchor.reply_text(f"✅ Sent to user `{target_id}`{suffix}")
+        except Exception as e:
+            log.error(f"❌ Reply relay to {target_id} failed: {e}")
+            await anchor.reply_text(f"❌ Failed to send: {e}")
+
+
+media_relay = MediaRelay()
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, List, Optional
+
+from telegram import Message
+from telegram.constants import ChatAction, MessageLimit, ParseMode
+from telegram.error import BadRequest, RetryAfter
+
+from src.config import settings
+
+log = logging.getLogger(__name__)
+
+# 留一点余量：Telegram 按 UTF-16 计长度，emoji 等字符会占 2 个单位
+_CHUNK_LIMIT = MessageLimit.MAX_TEXT_LENGTH - 96
+_PLACEHOLDER = "💭 …"
+
+
+def _split_point(text: str, limit: int) -> int:
+    """在 limit 之内找一个自然的断点（优先换行，其次空格）。"""
+    if len(text) <= limit:
+        return len(text)
+    for sep in ("\n\n", "\n", "。", ". ", " "):
+        idx = text.rfind(sep, 0, limit)
+        if idx > limit // 2:
+            return idx + len(sep)
+    return limit
+
+
+class StreamingReply:
+    """
+    把流式 AI 输出渐进地呈现在 Telegram 里：
+    - 立刻发 typing 状态和一条占位消息
+    - 按 STREAM_EDIT_INTERVAL 节流编辑（Telegram 对同一 chat 的编辑有频率限制）
+    - 超过单条长度上限时，把当前消息定稿，剩余内容接到新的后续消息
+    - 中间编辑用纯文本（半截 Markdown 会解析失败），最后一次再按 Markdown 渲染
+    """
+
+    FINAL_EDIT_ATTEMPTS = 5
+
+    def __init__(self, msg: Message):
+        self.msg = msg
+        self.sent: List[Message] = []
+        self.buffer = ""        # 当前这条消息对应的全部文本
+        self._shown = ""        # 当前这条消息已显示的文本
+        self._last_edit = 0.0
+
+    async def _typing_loop(self) -> None:
+        while True:
+            try:
+                await self.msg.get_bot().send_chat_action(self.msg.chat_id, ChatAction.TYPING)
+            except Exception:
+                pass
+            await asyncio.sleep(4.5)
+
+    async def _edit(self, text: str, markdown: bool = False, final: bool = False) -> None:
+        """
+        final=False：中间编辑，触发限流就跳过，下次再追上。
+        final=True ：定稿（最后一次 / 写满换条），内容不能丢，按 retry_after 等待后重试。
+        """
+        current = self.sent[-1]
+        for _ in range(self.FINAL_EDIT_ATTEMPTS):
+            try:
+                await current.edit_text(text, parse_mode=ParseMode.MARKDOWN if markdown else None)
+            except RetryAfter as e:
+                if not final:
+                    self._last_edit = time.monotonic() + e.retry_after
+                    return
+                await asyncio.sleep(e.retry_after)
+                continue
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    pass
+                elif markdown:
+                    # Markdown 解析失败：退回纯文本重发（同样可能遇到限流，交给下一轮循环）
+                    markdown = False
+                    continue
+                else:
+                    raise
+            self._shown = text
+            self._last_edit = time.monotonic()
+            return
+        log.error(f"❌ Giving up editing streamed reply after {self.FINAL_EDIT_ATTEMPTS} attempts")
+
+    async def _rollover(self) -> None:
+        """当前消息写满：定稿前半段，剩余部分开一条新消息。"""
+        cut = _split_point(self.buffer, _CHUNK_LIMIT)
+        head, tail = self.buffer[:cut], self.buffer[cut:]
+        await self._edit(head.rstrip(), markdown=True, final=True)
+        self.buffer = tail.lstrip()
+        self.sent.append(await self.msg.reply_text(self.buffer or _PLACEHOLDER))
+        self._shown = self.buffer
+
+    async def run(self, deltas: AsyncIterator[str], fallback: str) -> str:
+        """消费增量并渲染；返回完整文本。出错时把 fallback 显示出来。"""
+        typing = asyncio.create_task(self._typing_loop())
+        full: List[str] = []
+        try:
+            self.sent.append(await self.msg.reply_text(_PLACEHOLDER))
+            try:
+                async for delta in deltas:
+                    if typing and not typing.done():
+                        typing.cancel()
+                    full.append(delta)
+                    self.buffer += delta
+                    while len(self.buffer) > _CHUNK_LIMIT:
+                        await self._rollover()
+                    if time.monotonic() - self._last_edit >= settings.STREAM_EDIT_INTERVAL:
+                        if self.buffer.strip() and self.buffer != self._shown:
+                            await self._edit(self.buffer)
+            except Exception as e:
+                log.error(f"❌ Streaming chat reply failed: {e}")
+                if not "".join(full).strip():
+                    self.buffer = fallback
+                    full = [fallback]
+                else:
+                    self.buffer = self.buffer.rstrip() + "\n\n⚠️ （回复中断）"
+                    full = []  # 半截回复不算成功（调用方不会把它写进会话记忆）
+
+            final = self.buffer.strip() or fallback
+            await self._edit(final, markdown=True, final=True)
+            return "".join(full).strip()
+        finally:
+            typing.cancel()
+
+
+async def stream_reply(msg: Message, deltas: AsyncIterator[str], fallback: str) -> Optional[str]:
+    """handler 入口：把增量流渲染成（一条或多条）逐步更新的回复消息。"""
+    return await StreamingReply(msg).run(deltas, fallback)
@@ -0,0 +1,163 @@
+import bisect
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
+
+from src.services.task_index import format_tags
+from src.services.task_manager import task_manager
+
+# 排序 / 游标键：(类别序号, 任务 id)
+PageKey = Tuple[int, int]
+
+CATEGORIES = ("todo", "reminder", "days", "annis")
+SECTION_TITLES = {
+    "todo": "✅ *Todos*",
+    "reminder": "⏰ *Reminders*",
+    "days": "📅 *Days*",
+    "annis": "🎉 *Anniversaries*",
+}
+BUTTON_LABELS = {"all": "📋 All", "todo": "✅", "reminder": "⏰", "days": "📅", "annis": "🎉"}
+
+
+def _clip(text: str, limit: int) -> str:
+    text = str(text)
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+def format_entry(category: str, entry: dict) -> str:
+    eid = entry.get("id", "?")
+    # 标题 / 备注是用户写的（URL、snake_case 里的 '_' / '*' 很常见），先截断再转义，否则整条 Markdown 消息发不出去
+    title = escape_markdown(_clip(entry.get("title") or "(no title)", 80))
+    note = escape_markdown(_clip(entry.get("note") or "", 120))
+    if category == "todo":
+        line = f"- [`{eid}`] **{title}**"
+        if note:
+            line += f" — {note}"
+    else:
+        if category == "reminder":
+            when = entry.get("datetime", "N/A")
+        else:
+            when = entry.get("date") or entry.get("datetime") or "N/A"
+        line = f"- [`{eid}`] **{title}** — {escape_markdown(str(when))}"
+        if note:
+            line += f" | {note}"
+    # clean_tag 会把空格 / 连字符变成 '_'，legacy Markdown 里必须转义
+    tags = escape_markdown(format_tags(entry.get("tags")))
+    return line + (f" | Tags: {tags}" if tags else "")
+
+
+class TaskPager:
+    """
+    /listall 的分页视图：
+    - 视图 = all 或单个类别；按 (类别, id) 排好序的游标键只在任务库变化时重建
+    - 游标分页：callback 里带上一页的边界键，翻页只做一次 bisect + 切片，与任务总量无关
+    - 渲染好的页面按 (视图, 方向, 游标) 缓存，task_manager.version 变化时整体失效
+    """
+
+    PAGE_SIZE = 15
+    MAX_CACHED_PAGES = 256
+
+    def __init__(self):
+        self._version = -1
+        self._keys: Dict[str, List[PageKey]] = {}
+        self._pages: "OrderedDict[Tuple[str, str, Optional[PageKey]], Tuple[str, InlineKeyboardMarkup]]" = OrderedDict()
+
+    def _sync(self) -> None:
+        # 先让文档按 STATE_SYNC_INTERVAL 对一次版本：其它副本改过任务库时这里会重读，version 随之变化
+        task_manager.load()
+        if self._version == task_manager.version:
+            return
+        self._version = task_manager.version
+        self._pages.clear()
+        self._keys = {}
+        for rank, category in enumerate(CATEGORIES):
+            ids = sorted(e["id"] for e in task_manager.get_entries(category) if e.get("id") is not None)
+            self._keys[category] = [(rank, i) for i in ids]
+        self._keys["all"] = [k for c in CATEGORIES for k in self._keys[c]]
+
+    def page(self, view: str = "all", direction: str = "f", cursor: Optional[PageKey] = None):
+        """
+        返回 (text, reply_markup)。
+        direction: "f" = cursor 之后的一页（cursor 为空即首页），"b" = cursor 之前的一页。
+        """
+        if view not in BUTTON_LABELS:
+            view = "all"
+        self._sync()
+        cache_key = (view, direction, cursor)
+        cached = self._pages.get(cache_key)
+        if cached:
+            self._pages.move_to_end(cache_key)
+            return cached
+
+        keys = self._keys[view]
+        if cursor is None:
+            start = 0
+        elif direction == "b":
+            start = max(0, bisect.bisect_left(keys, cursor) - self.PAGE_SIZE)
+        else:
+            start = bisect.bisect_right(keys, cursor)
+        chunk = keys[start:start + self.PAGE_SIZE]
+
+        rendered = (self._render(view, chunk, start, len(keys)), self._keyboard(view, chunk, start, len(keys)))
+        self._pages[cache_key] = rendered
+        while len(self._pages) > self.MAX_CACHED_PAGES:
+            self._pages.popitem(last=False)
+        return rendered
+
+    def _render(self, view: str, chunk: List[PageKey], start: int, total: int) -> str:
+        counts = " · ".join(f"{BUTTON_LABELS[c]} {len(self._keys[c])}" for c in CATEGORIES)
+        lines = ["📋 **All Stored Tasks**", counts]
+        if not chunk:
+            title = SECTION_TITLES.get(view, "📋 *Tasks*")
+            lines.append(f"\n{title}: _none_")
+            return "\n".join(lines)
+
+        current = None
+        for rank, entry_id in chunk:
+            category = CATEGORIES[rank]
+            if category != current:
+                current = category
+                lines.append(f"\n{SECTION_TITLES[category]}")
+            entry = task_manager.index.docs.get((category, entry_id)) or {"id": entry_id}
+            lines.append(format_entry(category, entry))
+
+        pages = (total + self.PAGE_SIZE - 1) // self.PAGE_SIZE
+        lines.append(f"\n_Page {start // self.PAGE_SIZE + 1}/{pages} · {total} items_")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _cursor_data(view: str, direction: str, key: PageKey) -> str:
+        return f"la:{view}:{direction}:{key[0]}.{key[1]}"
+
+    def _keyboard(self, view: str, chunk: List[PageKey], start: int, total: int) -> InlineKeyboardMarkup:
+        nav = []
+        if chunk and start > 0:
+            nav.append(InlineKeyboardButton("◀️ Prev", callback_data=self._cursor_data(view, "b", chunk[0])))
+        if chunk and start + len(chunk) < total:
+            nav.append(InlineKeyboardButton("Next ▶️", callback_data=self._cursor_data(view, "f", chunk[-1])))
+        filters_row = [
+            InlineKeyboardButton(
+                f"• {label} •" if v == view else label, callback_data=f"la:{v}:f:"
+            )
+            for v, label in BUTTON_LABELS.items()
+        ]
+        rows = [nav, filters_row] if nav else [filters_row]
+        return InlineKeyboardMarkup(rows)
+
+    @staticmethod
+    def parse_callback(data: str) -> Tuple[str, str, Optional[PageKey]]:
+        """解析 'la:<view>:<f|b>:<rank>.<id>'（游标可为空）。"""
+        _, view, direction, raw = (data.split(":", 3) + ["", "", ""])[:4]
+        cursor = None
+        if raw:
+            try:
+                rank, entry_id = raw.split(".", 1)
+                cursor = (int(rank), int(entry_id))
+            except ValueError:
+                cursor = None
+        return view or "all", direction or "f", cursor
+
+
+task_pager = TaskPager()
@@ -0,0 +1,126 @@
+import time
+
+from telegram.request import HTTPXRequest
+
+from src.services.metrics import metrics, telegram_errors_total, telegram_latency
+from src.services.perf import perf
+from src.services.ai_usage import usage_stats
+from src.services.overload import overload
+from src.services.ai_agent import agent
+from src.services.task_manager import task_manager
+from src.services.fast_intent import fast_intent
+from src.services.vision import image_pipeline
+from src.services.conversation_memory import conversation_memory
+from src.services.scheduler import scheduler_service
+from src.services.shared_state import scheduler_leader
+from src.services.executors import cpu_executor, io_executor
+from src.bot.task_pages import CATEGORIES
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """Bot API 出站请求：按 endpoint（sendMessage / copyMessage …）记录耗时与失败数。"""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            telegram_errors_total.labels(endpoint).inc()
+            raise
+        finally:
+            telegram_latency.labels(endpoint).observe((time.perf_counter() - started) * 1000)
+
+
+_registered = False
+
+
+def register_collectors() -> None:
+    """抓取时才读取的指标：直接读各服务已有的计数 / 状态，不在热路径上重复记账。"""
+    global _registered
+    if _registered:
+        return
+    _registered = True
+
+    metrics.callback(
+        "atrioly_ai_tokens_total", "Tokens per AIAgent method (prompt / cached / completion).",
+        ("method", "kind"),
+        lambda: [
+            ((method, kind), b[f"{kind}_tokens"])
+            for method, b in usage_stats.methods.items()
+            for kind in ("prompt", "cached", "completion")
+        ],
+        kind="counter",
+    )
+    metrics.callback(
+        "atrioly_ai_parse_failures_total", "Structured-output parse failures per AIAgent method.",
+        ("method",),
+        lambda: [((method,), b["parse_failures"]) for method, b in usage_stats.methods.items()],
+        kind="counter",
+    )
+    metrics.callback(
+        "atrioly_cache_hits_total", "Local cache hits (answered without an AI call).", ("cache",),
+        lambda: [(("image",), image_pipeline.hits), (("fast_intent",), fast_intent.hits)],
+        kind="counter",
+    )
+    metrics.callback(
+        "atrioly_cache_misses_total", "Local cache misses (fell through to the AI).", ("cache",),
+        lambda: [(("image",), image_pipeline.misses), (("fast_intent",), fast_intent.misses)],
+        kind="counter",
+    )
+    metrics.callback(
+        "atrioly_stage_duration_seconds", "Per-stage latency of the message pipelines (see /perf).",
+        ("pipeline", "stage"),
+        lambda: [(tuple(key.split(".", 1)), h) for key, h in perf.hists.items()],
+        kind="histogram",
+    )
+    metrics.callback(
+        "atrioly_ai_in_flight", "OpenAI calls currently in flight.", (),
+        lambda: [((), overload.in_flight)],
+    )
+    metrics.callback(
+        "atrioly_overload_level", "Adaptive load-shedding level (0 = normal).", (),
+        lambda: [((), overload.level)],
+    )
+    metrics.callback(
+        "atrioly_ai_circuit_state", "AI upstream circuit breaker state (1 = current).", ("state",),
+        lambda: [((s,), int(agent.breaker.state == s)) for s in ("closed", "half_open", "open")],
+    )
+    metrics.callback(
+        "atrioly_tasks", "Stored tasks per category.", ("category",),
+        lambda: [((c,), len(task_manager.get_entries(c))) for c in CATEGORIES],
+    )
+    metrics.callback(
+        "atrioly_chat_sessions_active", "Chat-mode conversations held in memory.", (),
+        lambda: [((), len(conversation_memory.active))],
+    )
+    metrics.callback(
+        "atrioly_scheduler_running", "1 if the job scheduler is running.", (),
+        lambda: [((), int(scheduler_service.started))],
+    )
+    metrics.callback(
+        "atrioly_scheduler_leader", "1 if this replica holds the scheduler lease.", (),
+        lambda: [((), int(scheduler_leader.is_leader))],
+    )
+    metrics.callback(
+        "atrioly_scheduler_jobs", "Jobs currently scheduled (reminders + daily jobs).", (),
+        lambda: [((), scheduler_service.job_count)],
+    )
+    metrics.callback(
+        "atrioly_executor_in_flight", "Tasks in flight (cpu) / writes queued (io) per executor pool.", ("pool",),
+        lambda: [(("cpu",), cpu_executor.in_flight), (("io",), io_executor.pending)],
+    )
+    metrics.callback(
+        "atrioly_executor_tasks_total", "Tasks completed per executor pool.", ("pool",),
+        lambda: [(("cpu",), cpu_executor.completed), (("io",), io_executor.completed)],
+        kind="counter",
+    )
+    metrics.callback(
+        "atrioly_io_writes_coalesced_total", "Whole-file writes replaced by a newer write before hitting disk.", (),
+        lambda: [((), io_executor.coalesced)],
+        kind="counter",
+    )
+    metrics.callback(
+        "atrioly_start_time_seconds", "Process start time (unix seconds).", (),
+        lambda: [((), metrics.started)],
+    )
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from src.services.perf import perf
+from src.services.metrics import updates_total
+from src.services.cost_ledger import set_caller
+
+log = logging.getLogger(__name__)
+
+# update 类型 -> 预先绑定的计数器（按 Telegram 字段顺序匹配第一个非空字段）
+_UPDATE_COUNTERS = tuple((str(t), updates_total.labels(str(t))) for t in Update.ALL_TYPES)
+_OTHER_UPDATES = updates_total.labels("other")
+
+
+def _count_update(update: object) -> None:
+    if isinstance(update, Update):
+        for field, counter in _UPDATE_COUNTERS:
+            if getattr(update, field) is not None:
+                counter.value += 1
+                return
+    _OTHER_UPDATES.value += 1
+
+
+class ChatSequencedUpdateProcessor(BaseUpdateProcessor):
+    """
+    并发处理 update，但同一个 chat 内保持严格顺序：
+      - 不同 chat 之间并行，最多 max_concurrent_updates 个 handler 同时运行
+      - 同一个 chat 的 update 按到达顺序逐条处理（asyncio.Lock 是 FIFO 的）
+      - 非 chat 类 update（inline query 等）不排队，直接并发
+
+    注意：PTB 的 process_update 会先拿基类的 semaphore 再调 do_process_update，
+    如果把并发上限放在那里，某个刷屏 chat 排队的 update 会把所有名额占满。
+    所以基类 semaphore 只作为「在途 update 总数」的上限（max_pending_updates），
+    真正的 worker 并发数在拿到 chat 锁之后才申请。
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int = 4096):
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.max_workers = max_concurrent_updates
+        self._workers = asyncio.Semaphore(max_concurrent_updates)
+        # chat_id -> [lock, 持有/等待该锁的 update 数]，计数归零即回收，避免 dict 无限增长
+        self._chat_locks: Dict[int, list] = {}
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        _count_update(update)
+        if isinstance(update, Update):
+            # AI 调用按发起的 chat / 用户记账（contextvar 随 coroutine 传下去）
+            set_caller(update.effective_chat, update.effective_user)
+        chat_id = self._chat_key(update)
+        queued = time.perf_counter()
+        if chat_id is None:
+            async with self._workers:
+                perf.observe("dispatch.wait", (time.perf_counter() - queued) * 1000)
+                await coroutine
+            return
+
+        slot = self._chat_locks.get(chat_id)
+        if slot is None:
+            slot = self._chat_locks[chat_id] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                async with self._workers:
+                    # 排队时间：等 chat 锁 + 等 worker 名额
+                    perf.observe("dispatch.wait", (time.perf_counter() - queued) * 1000)
+                    await coroutine
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                self._chat_locks.pop(chat_id, None)
+
+    @property
+    def active_chats(self) -> int:
+        """当前有 update 在处理或排队的 chat 数。"""
+        return len(self._chat_locks)
+
+    async def initialize(self) -> None:
+        log.info(f"⚙️ Update processor ready (workers={self.max_workers}, per-chat ordering).")
+
+    async def shutdown(self) -> None:
+        self._chat_locks.clear()
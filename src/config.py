@@ -1,5 +1,5 @@
 import os
-from typing import List, Set, Union
+from typing import Dict, List, Set, Union
 from pydantic import field_validator
 from pydantic_settings import BaseSettings
 
@@ -7,6 +7,9 @@ class Settings(BaseSettings):
     # Credentials
     TELEGRAM_BOT_TOKEN: str
     OPENAI_API_KEY: str | None = None
+    # 可选：自建 Bot API server / OpenAI 兼容网关（bench 里指向本地假 server）
+    TELEGRAM_API_BASE_URL: str | None = None
+    OPENAI_BASE_URL: str | None = None
     
     # --- UPDATE: Changed default model to gpt-5-mini ---
     DEFAULT_MODEL: str = "gpt-5-mini"
@@ -20,13 +23,126 @@ class Settings(BaseSettings):
     
     # Logging
     LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"                # text | json（结构化，一行一个对象）
+    LOG_TEXT_MAX: int = 80                  # 日志里的消息正文 / AI 结果最多保留多少字符（0 = 不截断）
+    LOG_REDACT_TEXT: bool = False           # 完全隐藏正文，只记录长度和指纹
+    LOG_SAMPLING: Dict[str, float] = {}     # 按 stage 采样 INFO 日志，例如 {"group.receive": 0.1, "group.skip": 0.05}
+
+    # AI Upstream Resilience
+    AI_TIMEOUT: float = 30.0                # 单次 OpenAI 请求超时（秒）
+    AI_MAX_RETRIES: int = 1                 # 客户端自带重试次数
+    AI_BREAKER_FAILURES: int = 5            # 连续失败多少次后熔断
+    AI_BREAKER_COOLDOWN: float = 30.0       # 熔断后多久放一个探测请求（秒）
+    AI_HEDGE_ENABLED: bool = False          # 超过 p95 延迟时再发一个对冲请求
+    AI_HEDGE_MODEL: str | None = None       # 对冲请求使用的模型（留空 = 同一模型）
+    AI_HEDGE_MIN_SAMPLES: int = 20          # 至少积累多少次延迟样本才启用对冲
+    AI_STRUCTURED_OUTPUT: bool = True       # 使用 strict JSON schema（关闭则退回 json_object）
+
+    # Owner Task Context
+    TASK_CONTEXT_TOP_K: int = 20            # process_owner_command 只带入最相关的 K 条任务
+    TASK_CONTEXT_RECENT: int = 5            # 每类额外带入最近创建的几条（处理「刚才那个」）
+
+    # Chat Streaming
+    CHAT_STREAMING: bool = True             # chat 模式边生成边编辑消息
+    STREAM_EDIT_INTERVAL: float = 1.0       # 两次编辑之间的最小间隔（秒），避免触发 Telegram 限流
+
+    # Chat Memory (chat 模式的按用户会话记忆)
+    CHAT_MEMORY_TOKEN_BUDGET: int = 1500    # 摘要 + 历史原文的 token 上限，超出就压缩最旧的几轮
+    CHAT_MEMORY_KEEP_TURNS: int = 4         # 压缩时至少保留的最近消息条数（user + assistant 各算一条）
+    CHAT_MEMORY_MAX_ACTIVE: int = 500       # 内存里最多保留的会话数，其余按 LRU 落盘
+    CHAT_MEMORY_TTL: int = 7 * 24 * 3600    # 超过这么久没说话，会话记忆作废（秒，0 = 永不过期）
+
+    # DM Coalescing (forward 模式下合并用户的连发私聊)
+    DM_COALESCE_DELAY: float = 3.0          # 安静多少秒后处理这一段（0 = 关闭，逐条处理）
+    DM_COALESCE_MAX_WAIT: float = 15.0      # 从第一条算起最多等待多久
+    DM_COALESCE_MAX_MESSAGES: int = 10      # 攒满多少条立即处理
+
+    # Image Pipeline (私聊图片)
+    IMAGE_MIN_SIDE: int = 512               # 选用短边不小于该值的最小 PhotoSize
+    IMAGE_CACHE_SIZE: int = 2048            # 视觉结果缓存条数（LRU）
+    IMAGE_HASH_MAX_DISTANCE: int = 6        # dHash 汉明距离不超过该值视为同一张图
+
+    # Update Ingestion
+    # 配置了 WEBHOOK_URL 就走 webhook 模式，否则退回 long polling
+    WEBHOOK_URL: str | None = None          # 公网地址，例如 https://bot.example.com
+    WEBHOOK_LISTEN: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8443
+    WEBHOOK_PATH: str = "telegram"
+    WEBHOOK_SECRET: str | None = None       # Telegram 回调时带的 X-Telegram-Bot-Api-Secret-Token
+    # 同时处理的 update 数（不同 chat 并行，同一 chat 内保持顺序）
+    CONCURRENT_UPDATES: int = 32
+
+    # Startup Catch-up
+    # 发送时间早于 CATCHUP_MAX_AGE 秒的群消息走廉价路径，最后只发一条汇总（0 = 关闭）
+    CATCHUP_MAX_AGE: int = 120
+    CATCHUP_MODE: str = "batch"             # skip | keyword | sample | batch
+    CATCHUP_SAMPLE_RATE: float = 0.2        # sample 模式的抽样比例
+    CATCHUP_BATCH_SIZE: int = 30            # 每次批量 AI 判定的消息数
+    CATCHUP_FLUSH_DELAY: float = 5.0        # 积压安静多少秒后发送 digest
+
+    # Overload Control (群消息扫描自适应降载)
+    OVERLOAD_MAX_INFLIGHT: int = 8          # 同时在途的 AI 调用数上限
+    OVERLOAD_MAX_LATENCY: float = 8.0       # AI 平均延迟上限（秒）
+    OVERLOAD_MAX_QUEUE_AGE: float = 10.0    # update 排队时间上限（秒）
+    OVERLOAD_MAX_ERROR_RATE: float = 0.3    # 最近 AI 调用错误率上限
+    OVERLOAD_SAMPLE_RATE: float = 0.25      # sample 等级下非优先群进入 AI 的比例
+    OVERLOAD_COOLDOWN: float = 30.0         # 压力回落后每降一级的等待时间（秒）
+    PRIORITY_GROUP_IDS: Set[int] = set()    # 核心群：降载时不抽样
+
+    # Performance Tracing (/perf)
+    PERF_SLOW_MS: float = 2000.0            # 总耗时超过该值（毫秒）的 update 记为慢 trace
+    PERF_TRACE_SAMPLE: float = 1.0          # 慢 trace 的保留比例
+    PERF_TRACE_FILE: str | None = None      # 慢 trace 追加写入的 jsonl 文件（留空 = 只保留在内存）
+
+    # AI Cost Ledger (按 method / 群 / 用户记账)
+    # 每百万 token 的美元价格 [input, cached input, output]，按模型名前缀匹配
+    AI_PRICES: Dict[str, List[float]] = {
+        "gpt-5-mini": [0.25, 0.025, 2.0],
+        "gpt-5-nano": [0.05, 0.005, 0.4],
+        "gpt-5": [1.25, 0.125, 10.0],
+        "gpt-4o-mini": [0.15, 0.075, 0.6],
+        "gpt-4o": [2.5, 1.25, 10.0],
+    }
+    LEDGER_FLUSH_INTERVAL: float = 300.0    # 账本最多每隔多少秒落盘一次
+    LEDGER_RETENTION_DAYS: int = 62         # 小时桶保留天数
+    GROUP_MONTHLY_BUDGET: float = 0.0       # 每个群每月的 AI 预算（美元，0 = 不限），超出后只做关键词判定
+    GROUP_BUDGETS: Dict[int, float] = {}    # 单独指定某些群的预算，例如 {"-1001234567890": 5}
+
+    # Runtime Profiling
+    LOOP_STALL_THRESHOLD: float = 0.5       # 事件循环被阻塞超过这么多秒就打印卡住的栈（0 = 关闭）
+    PROFILE_SAMPLE_INTERVAL: float = 0.005  # /profile 采样间隔（秒）
+    PROFILE_MAX_SECONDS: int = 120          # /profile 最长时长
+
+    # Executors (CPU 进程池 / 写盘线程池)
+    CPU_WORKERS: int = -1                   # 图片哈希等 CPU 密集步骤的 worker 进程数（-1 = 核数 - 1；0 = 不开进程，用线程）
+    CPU_QUEUE_DEPTH: int = 4                # 每个 worker 最多排队的任务数，超出后调用方等待（背压）
+    CPU_SHM_MIN_BYTES: int = 65536          # 不小于该大小的 bytes 参数经共享内存传给 worker
+    IO_WORKERS: int = 4                     # JSON 存储 / trace 文件写盘线程数
+
+    # Metrics (Prometheus 文本格式，GET /metrics)
+    METRICS_PORT: int = 0                   # 0 = 关闭
+    METRICS_HOST: str = "127.0.0.1"         # 容器里需要被抓取时改成 0.0.0.0
+
+    # Group Profiles (按群配置，见 DATA_DIR/group_config.json 与 /groupcfg)
+    # 档位 -> 模型名；standard 未配置时用 DEFAULT_MODEL，另有 none = 不调 AI
+    MODEL_TIERS: Dict[str, str] = {"cheap": "gpt-5-nano"}
+    GROUP_CONFIG_RELOAD_INTERVAL: float = 5.0   # 多久检查一次 group_config.json 是否被手工修改（秒）
+
+    # Shared State / Multi-instance
+    STATE_BACKEND: str = "file"             # file = DATA_DIR 下的 JSON 文件（单实例）；sqlite = 多副本共享的 SQLite 文件
+    STATE_DB_PATH: str | None = None        # SQLite 文件路径（默认 DATA_DIR/state.db，多副本挂同一个卷）
+    STATE_SYNC_INTERVAL: float = 1.0        # 多久检查一次其它副本写入的新版本（秒）
+    STATE_BUSY_TIMEOUT: float = 0.5         # SQLite 等其它副本释放写锁的上限（秒），超时本次修改失败并记日志
+    INSTANCE_ID: str | None = None          # 副本标识（默认 hostname:pid）
+    LEADER_LEASE_TTL: float = 15.0          # 调度 leader 租约时长（秒）：leader 崩溃后最多这么久被接管
+    LEADER_RENEW_INTERVAL: float = 3.0      # 续约 / 抢占间隔（秒）：leader 正常退出会释放租约，备机一个间隔内接管
 
     class Config:
         env_file = ".env"
         case_sensitive = True
 
     # Validator to handle single IDs or lists automatically
-    @field_validator("OWNER_IDS", "FORWARD_TO", mode="before")
+    @field_validator("OWNER_IDS", "FORWARD_TO", "PRIORITY_GROUP_IDS", mode="before")
     @classmethod
     def parse_ids(cls, v: Union[str, int, list, set]) -> Union[List[int], Set[int]]:
         if isinstance(v, int):
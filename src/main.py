@@ -1,8 +1,11 @@
+import asyncio
+import importlib
 import logging
 from telegram.ext import (
     ApplicationBuilder,
     MessageHandler,
     CommandHandler,
+    CallbackQueryHandler,
     TypeHandler,
     filters,
 )
@@ -14,6 +17,7 @@ from src.bot.handlers import (
     handle_group_message,
     handle_private_message,
     handle_admin_reply,
+    handle_error,
 )
 from src.bot.commands import (
     cmd_start,
@@ -26,25 +30,112 @@ from src.bot.commands import (
     cmd_ping,
     cmd_status,
     cmd_listall,  # NEW
+    cb_listall,
+    cmd_search,
+    cmd_tag,
+    cmd_ai_usage,
+    cmd_perf,
+    cmd_spend,
+    cmd_profile,
+    cmd_groupcfg,
 )
+from src.bot.update_processor import ChatSequencedUpdateProcessor
+from src.bot.dm_coalescer import dm_coalescer
+from src.bot.telemetry import InstrumentedRequest, register_collectors
+from src.services.metrics import metrics_server
+from src.services.cost_ledger import cost_ledger
+from src.services.blacklist_manager import blacklist
+from src.services.membership import manager
+from src.services.state_manager import state_manager
+from src.services.task_manager import task_manager
+from src.services.group_config import group_config
+from src.services.shared_state import INSTANCE_ID, scheduler_leader, storage
+from src.utils.log_setup import setup_logging
+from src.services.profiler import loop_monitor
 from src.services.scheduler import scheduler_service  # 调度服务（建议使用 BackgroundScheduler）
+from src.services.conversation_memory import conversation_memory
+from src.services.executors import shutdown_executors
 
-# 全局日志配置
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=getattr(settings, "LOG_LEVEL", logging.INFO),
-)
+# 全局日志配置：队列 + 后台线程写出，事件循环里不做格式化和 IO
+setup_logging()
 log = logging.getLogger(__name__)
 
 
-def main() -> None:
-    """Entry point for AtriolyTgbot."""
-    if not settings.TELEGRAM_BOT_TOKEN:
-        log.error("❌ Error: TELEGRAM_BOT_TOKEN missing.")
-        return
+def load_services() -> None:
+    """
+    启动钩子：import 时各服务只是空壳（不读盘、不碰调度器），这里统一读入 JSON 存储、重挂 reminder。
+    不调用也能工作——各存储首次被访问时自己加载，只是代价落到第一条 update 上。
+    """
+    for store in (blacklist, manager, state_manager, task_manager, cost_ledger, group_config):
+        store.load()
+
 
+def start_scheduler(application) -> None:
+    """成为调度 leader 时：启动调度器并挂上库里未来的 reminder（单实例下启动时直接成为 leader）。"""
+    scheduler_service.start(application)
+    task_manager.reschedule_reminders()
+
+
+async def _post_init(application) -> None:
+    """事件循环启动后：加载服务、参加调度 leader 选举，让调度器的 job 回到 PTB 主 loop 上执行。"""
+    scheduler_service.loop = asyncio.get_running_loop()
+    load_services()
+    # 多副本时只有持有租约的副本跑 reminder / 每日祝福；其它副本增删的 reminder 在续约时对齐
+    await scheduler_leader.start(
+        on_elected=lambda: start_scheduler(application),
+        on_demoted=scheduler_service.stop,
+        on_renewed=task_manager.sync_reminders,
+    )
+    # openai SDK 在线程里预先 import，第一条需要 AI 的消息不必在事件循环里等它
+    application.create_task(asyncio.to_thread(importlib.import_module, "openai"))
+    loop_monitor.start(scheduler_service.loop)
+    if settings.METRICS_PORT:
+        await metrics_server.start(settings.METRICS_HOST, settings.METRICS_PORT)
+
+
+async def _post_stop(application) -> None:
+    """
+    停止拉取 update 之后、Bot 的 HTTP 客户端关闭之前：把还在合并窗口里的私聊立即转发出去，
+    否则重启 / 发版时最多 DM_COALESCE_MAX_WAIT 秒内的用户私聊会直接丢失。
+    （post_shutdown 时 Bot 已经不能再发请求，所以放在这里。）
+    """
+    await dm_coalescer.flush_all()
+
+
+async def _post_shutdown(application) -> None:
+    """退出前把内存中的 chat 会话记忆、AI 费用账本落盘（等写线程排队的写入全部完成），交出调度 leader 租约（备机随即接管）。"""
+    await scheduler_leader.stop()
+    conversation_memory.save_all()
+    cost_ledger.flush(force=True)
+    await asyncio.to_thread(shutdown_executors)
+    await loop_monitor.stop()
+    await metrics_server.stop()
+
+
+def build_application(builder: ApplicationBuilder | None = None):
+    """
+    创建 Application 并注册全部 handler（不启动调度器、不开始拉取 update）。
+    builder 可由调用方预先配置（例如 bench 里替换 request / base_url）。
+    """
     # 1. 创建 Application（PTB 自己管理事件循环）
-    application = ApplicationBuilder().token(settings.TELEGRAM_BOT_TOKEN).build()
+    #    并发处理 update：不同 chat 并行，同一 chat 内按顺序
+    if builder is None:
+        # 出站 Bot API 请求按 endpoint 记录耗时（连接池大小同 PTB 默认值）
+        builder = ApplicationBuilder().request(InstrumentedRequest(connection_pool_size=256))
+    builder = builder.token(settings.TELEGRAM_BOT_TOKEN)
+    if settings.TELEGRAM_API_BASE_URL:
+        # 自建 Bot API server（或本地假 server）
+        builder = builder.base_url(settings.TELEGRAM_API_BASE_URL)
+    application = (
+        builder
+        .concurrent_updates(ChatSequencedUpdateProcessor(settings.CONCURRENT_UPDATES))
+        .post_init(_post_init)
+        .post_stop(_post_stop)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
+
+    register_collectors()
 
     # 2. Middleware (Priority -1)
     application.add_handler(TypeHandler(Update, gatekeeper_middleware), group=-1)
@@ -60,13 +151,25 @@ def main() -> None:
     application.add_handler(CommandHandler("whitelist", cmd_whitelist))
     application.add_handler(CommandHandler("ai_test", cmd_ai_test))
     application.add_handler(CommandHandler("listall", cmd_listall))  # NEW
+    application.add_handler(CallbackQueryHandler(cb_listall, pattern=r"^la:"))
+    application.add_handler(CommandHandler("search", cmd_search))
+    application.add_handler(CommandHandler("tag", cmd_tag))
+    application.add_handler(CommandHandler("ai_usage", cmd_ai_usage))
+    application.add_handler(CommandHandler("perf", cmd_perf))
+    application.add_handler(CommandHandler("spend", cmd_spend))
+    application.add_handler(CommandHandler("profile", cmd_profile))
+    application.add_handler(CommandHandler("groupcfg", cmd_groupcfg))
 
     # 4. Message Logic
 
-    # A. 管理员在私聊里「回复转发消息」→ Bot 再转回原用户
+    # A. 管理员在私聊里「回复转发消息」→ Bot 再转回原用户（任意消息类型）
+    #    只匹配 Owner，普通用户的回复消息继续走下面的私聊逻辑
     application.add_handler(
         MessageHandler(
-            filters.ChatType.PRIVATE & filters.REPLY & filters.TEXT,
+            filters.ChatType.PRIVATE
+            & filters.REPLY
+            & ~filters.COMMAND
+            & filters.User(user_id=settings.OWNER_IDS),
             handle_admin_reply,
         )
     )
@@ -87,13 +190,46 @@ def main() -> None:
         )
     )
 
-    # 5. 启动调度器（注意：scheduler_service 内部请使用 BackgroundScheduler）
-    scheduler_service.start(application)
+    # Error handler：handler 里没接住的异常记堆栈，私聊里提示用户重试
+    application.add_error_handler(handle_error)
+
+    return application
 
-    log.info("🟢 Atrioly · Wanatring Agent v3.0.2 Online (with scheduler).")
+
+def main() -> None:
+    """Entry point for AtriolyTgbot."""
+    if not settings.TELEGRAM_BOT_TOKEN:
+        log.error("❌ Error: TELEGRAM_BOT_TOKEN missing.")
+        return
+
+    application = build_application()
+
+    # 5. 调度器在 post_init 里随 leader 选举启动（单实例时总是 leader）
+    if storage.shared and not settings.WEBHOOK_URL:
+        log.warning(
+            "⚠️ Shared state with polling: Telegram allows only one getUpdates consumer, "
+            "run extra replicas in webhook mode."
+        )
+
+    log.info(f"🟢 Atrioly · Wanatring Agent v3.0.2 Online (instance {INSTANCE_ID}).")
 
     # 6. 阻塞运行，PTB 自己创建/管理 asyncio 事件循环
-    application.run_polling()
+    if settings.WEBHOOK_URL:
+        # Webhook 模式：PTB 内置的 tornado 异步 HTTP server 接收 Telegram 推送
+        path = settings.WEBHOOK_PATH.strip("/")
+        log.info(
+            f"🌐 Webhook mode | listen={settings.WEBHOOK_LISTEN}:{settings.WEBHOOK_PORT} "
+            f"path=/{path}"
+        )
+        application.run_webhook(
+            listen=settings.WEBHOOK_LISTEN,
+            port=settings.WEBHOOK_PORT,
+            url_path=path,
+            webhook_url=f"{settings.WEBHOOK_URL.rstrip('/')}/{path}",
+            secret_token=settings.WEBHOOK_SECRET,
+        )
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
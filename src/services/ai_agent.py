@@ -1,11 +1,18 @@
+import asyncio
 import json
 import logging
 import base64
-from typing import Dict, Any, List, Optional
+import time
+from typing import AsyncIterator, Dict, Any, List, Optional
 from datetime import datetime
 
-from openai import OpenAI
 from src.config import settings
+from src.services.overload import overload
+from src.services.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker
+from src.services import ai_schemas
+from src.services.ai_usage import usage_stats
+from src.services.metrics import ai_calls_total, ai_latency
+from src.services.cost_ledger import cost_ledger
 
 log = logging.getLogger(__name__)
 
@@ -21,44 +28,208 @@ class AIAgent:
     """
 
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
+        self._client = None
+        # 上游不健康时快速失败，交给各方法原有的兜底逻辑
+        self.breaker = CircuitBreaker(
+            "openai", settings.AI_BREAKER_FAILURES, settings.AI_BREAKER_COOLDOWN
+        )
+        self.latency = LatencyTracker()
+
+    @property
+    def client(self):
+        """
+        异步客户端：AI 调用期间不阻塞事件循环，其它 chat 的 update 可以并行处理。
+        首次使用时才 import openai 并创建（import 本身要几百毫秒），未配置 key 时为 None。
+        """
+        if self._client is None and settings.OPENAI_API_KEY:
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                timeout=settings.AI_TIMEOUT,
+                max_retries=settings.AI_MAX_RETRIES,
+            )
+        return self._client
 
     # ========== Common Helper ==========
 
+    async def _complete(self, method: str, hedge: bool = True, **kwargs):
+        """
+        所有 chat.completions 调用的统一出口：
+        - 熔断器 open 时直接抛 CircuitOpenError（不等客户端超时）
+        - 可选对冲：首个请求超过观测到的 p95 仍未返回时，再发一个（可换更便宜的模型），先到先用
+        - 记录延迟 / 成败给熔断器和降载控制器，token 用量按 method 记账
+        """
+        if not self.breaker.allow():
+            ai_calls_total.labels(method, "circuit_open").inc()
+            raise CircuitOpenError(f"circuit '{self.breaker.name}' is open")
+
+        started = time.monotonic()
+        overload.ai_started()
+        try:
+            response = await self._hedged_create(kwargs, hedge)
+        except asyncio.CancelledError:
+            overload.ai_finished(time.monotonic() - started, ok=False)
+            self.breaker.release()
+            ai_calls_total.labels(method, "cancelled").inc()
+            raise
+        except Exception:
+            overload.ai_finished(time.monotonic() - started, ok=False)
+            self.breaker.record_failure()
+            ai_calls_total.labels(method, "error").inc()
+            raise
+
+        elapsed = time.monotonic() - started
+        overload.ai_finished(elapsed, ok=True)
+        self.breaker.record_success()
+        self.latency.record(elapsed)
+        usage_stats.record_usage(method, getattr(response, "usage", None))
+        cost_ledger.record(
+            method, getattr(response, "usage", None), getattr(response, "model", None) or kwargs.get("model")
+        )
+        ai_calls_total.labels(method, "ok").inc()
+        ai_latency.labels(method).observe(elapsed * 1000)
+        return response
+
+    async def _stream(self, method: str, **kwargs) -> AsyncIterator[str]:
+        """
+        流式 completion：与 _complete 共用熔断 / 降载 / 用量统计，但不做对冲。
+        消费方提前退出（GeneratorExit / 取消）不算上游故障。
+        """
+        if not self.breaker.allow():
+            ai_calls_total.labels(method, "circuit_open").inc()
+            raise CircuitOpenError(f"circuit '{self.breaker.name}' is open")
+
+        started = time.monotonic()
+        overload.ai_started()
+        outcome = "cancelled"
+        usage = None
+        model = kwargs.get("model")
+        try:
+            stream = await self.client.chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, **kwargs
+            )
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                    model = getattr(chunk, "model", None) or model
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            outcome = "ok"
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            overload.ai_finished(elapsed, ok=outcome == "ok")
+            ai_calls_total.labels(method, outcome).inc()
+            if outcome == "ok":
+                self.breaker.record_success()
+                usage_stats.record_usage(method, usage)
+                cost_ledger.record(method, usage, model)
+                ai_latency.labels(method).observe(elapsed * 1000)
+            elif outcome == "error":
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+
+    async def _hedged_create(self, kwargs: Dict[str, Any], hedge: bool):
+        create = self.client.chat.completions.create
+        delay = self.latency.percentile(0.95)
+        if (
+            not hedge
+            or not settings.AI_HEDGE_ENABLED
+            or delay is None
+            or len(self.latency.samples) < settings.AI_HEDGE_MIN_SAMPLES
+        ):
+            return await create(**kwargs)
+
+        primary = asyncio.create_task(create(**kwargs))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+
+        hedge_kwargs = dict(kwargs)
+        if settings.AI_HEDGE_MODEL:
+            hedge_kwargs["model"] = settings.AI_HEDGE_MODEL
+        log.info(f"🪃 AI call exceeded p95 ({delay:.2f}s), hedging with {hedge_kwargs['model']}")
+        secondary = asyncio.create_task(create(**hedge_kwargs))
+
+        pending = {primary, secondary}
+        error: Exception | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
     async def _call_gpt(
         self,
         system_prompt: str,
         user_text: str,
         model: str | None = None,
+        *,
+        method: str,
+        schema: Dict[str, Any] | None = None,
+        context: str | None = None,
     ) -> Dict[str, Any]:
         """
         Helper to call OpenAI and parse JSON.
         Returns a dict; if error, it will contain {"error": "..."}.
+
+        Prompt 布局：[静态 system_prompt] + [动态 context] + [用户消息]。
+        system_prompt 必须是不含时间 / 任务列表等变量的固定文本，
+        这样同一方法的请求前缀完全一致，可以命中 OpenAI 的 prompt caching。
         """
         if not self.client:
             return {"error": "No API Key configured"}
 
+        messages = [{"role": "system", "content": system_prompt}]
+        if context:
+            messages.append({"role": "system", "content": context})
+        messages.append({"role": "user", "content": user_text})
+
+        if schema is not None and settings.AI_STRUCTURED_OUTPUT:
+            response_format = ai_schemas.response_format(method, schema)
+        else:
+            # 要求 JSON 输出，方便后续解析
+            response_format = {"type": "json_object"}
+
         try:
-            response = self.client.chat.completions.create(
+            response = await self._complete(
+                method,
                 model=model or settings.DEFAULT_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_text},
-                ],
-                # 要求 JSON 输出，方便后续解析
-                response_format={"type": "json_object"},
+                messages=messages,
+                response_format=response_format,
             )
-            content = response.choices[0].message.content
-            return json.loads(content)
         except Exception as e:
             log.error(f"❌ AI call failed: {e}")
             return {"error": str(e)}
 
+        content = response.choices[0].message.content
+        try:
+            return json.loads(content)
+        except (TypeError, ValueError) as e:
+            usage_stats.record_parse_failure(method)
+            log.error(f"❌ AI returned invalid JSON ({method}): {e}")
+            return {"error": f"Invalid JSON: {e}"}
+
     # ========== Group Logic (Streaming + Spam) ==========
 
-    async def analyze_message(self, text: str) -> Dict[str, Any]:
+    async def analyze_message(self, text: str, model: str | None = None) -> Dict[str, Any]:
         """
-        分析【群消息】：
+        分析【群消息】（model 由群档位决定，默认 DEFAULT_MODEL）：
         - is_spam: bool
         - spam_reason: str | null
         - is_membership: bool
@@ -99,30 +270,90 @@ class AIAgent:
         )
 
         try:
-            result = await self._call_gpt(system_prompt, text)
+            result = await self._call_gpt(
+                system_prompt, text, model, method="analyze_message", schema=ai_schemas.GROUP_VERDICT
+            )
             if "error" in result:
                 raise RuntimeError(result["error"])
             return result
         except Exception as e:
             log.error(f"❌ AI Analysis Failed (group): {e}")
-            keywords = ["hbo", "netflix", "disney", "share", "上车", "合租", "车位"]
-            if any(k in text.lower() for k in keywords):
-                log.warning(
-                    "⚠️ AI failed, but membership keywords detected. Fallback to manual flag."
-                )
-                return {
-                    "is_spam": False,
-                    "is_membership": True,
-                    "platform": "Unknown (AI Fail)",
-                    "summary": f"AI error: {str(e)}. Keywords detected in text.",
-                }
+            return self.keyword_verdict(text, f"AI error: {str(e)}")
+
+    # 不走 AI 时的关键词兜底判定（AI 故障 / 积压追赶 / 降级模式共用）
+    FALLBACK_KEYWORDS = ["hbo", "netflix", "disney", "share", "上车", "合租", "车位"]
 
+    def keyword_verdict(self, text: str, reason: str) -> Dict[str, Any]:
+        """
+        纯关键词的群消息判定，返回结构与 analyze_message 一致。
+        reason 说明为什么没有走 AI（会写进 summary / error）。
+        """
+        if any(k in text.lower() for k in self.FALLBACK_KEYWORDS):
+            log.warning(
+                f"⚠️ {reason}, but membership keywords detected. Fallback to manual flag."
+            )
             return {
                 "is_spam": False,
-                "is_membership": False,
-                "error": str(e),
+                "is_membership": True,
+                "platform": "Unknown (Keyword)",
+                "summary": f"{reason}. Keywords detected in text.",
             }
 
+        return {
+            "is_spam": False,
+            "is_membership": False,
+            "error": reason,
+        }
+
+    async def classify_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """
+        一次调用批量判定多条【群消息】（用于重启后的积压追赶，比逐条 analyze_message 便宜得多）。
+        返回与 texts 等长的列表，每项结构同 analyze_message；AI 失败时逐条退回 keyword_verdict。
+        """
+        if not texts:
+            return []
+        if not self.client:
+            return [self.keyword_verdict(t, "No API Key configured") for t in texts]
+
+        system_prompt = (
+            "You are the Atrioly Intelligent Filter running in bulk mode.\n"
+            "You receive a JSON list of group messages, each with an index 'i' and 'text'.\n"
+            "For EACH message decide: is it SPAM (phishing, crypto, ads, NSFW, scams)? "
+            "Is it about sharing / requesting a streaming membership slot "
+            "(Netflix, HBO, Disney+, YouTube, Spotify, 合租, 车位, 上车, 拼车)?\n"
+            "Output PURE JSON exactly as:\n"
+            "{'results': [{'i': int, 'is_spam': bool, 'is_membership': bool, "
+            "'platform': str | null, 'summary': str}]}\n"
+            "Keep each summary under 20 words."
+        )
+        payload = json.dumps(
+            [{"i": i, "text": t[:500]} for i, t in enumerate(texts)], ensure_ascii=False
+        )
+
+        res = await self._call_gpt(
+            system_prompt, payload, method="classify_batch", schema=ai_schemas.BATCH_VERDICT
+        )
+        verdicts: List[Dict[str, Any]] = [
+            self.keyword_verdict(t, "Batch AI missing verdict") for t in texts
+        ]
+        if "error" in res or not isinstance(res.get("results"), list):
+            log.error(f"❌ AI batch classification failed: {res.get('error', res)}")
+            return [self.keyword_verdict(t, "Batch AI failed") for t in texts]
+
+        for item in res["results"]:
+            try:
+                i = int(item.get("i"))
+            except (TypeError, ValueError):
+                continue
+            if 0 <= i < len(texts):
+                verdicts[i] = {
+                    "is_spam": bool(item.get("is_spam", False)),
+                    "is_membership": bool(item.get("is_membership", False)),
+                    "platform": item.get("platform"),
+                    "summary": item.get("summary") or "",
+                }
+        return verdicts
+
     # ========== Private Logic (DM 分类 / 标签 / Summary) ==========
 
     async def analyze_private_message(self, text: str) -> Dict[str, Any]:
@@ -158,7 +389,12 @@ class AIAgent:
             "}"
         )
 
-        result = await self._call_gpt(system_prompt, text)
+        result = await self._call_gpt(
+            system_prompt,
+            text,
+            method="analyze_private_message",
+            schema=ai_schemas.PRIVATE_CLASSIFICATION,
+        )
 
         if "error" in result:
             log.error(f"❌ AI Analysis Failed (private): {result['error']}")
@@ -184,108 +420,16 @@ class AIAgent:
             "summary": summary,
         }
 
-    # ========== Owner Intent (todo / reminder / days / annis) ==========
-
-    async def analyze_owner_intent(self, text: str) -> Dict[str, Any]:
-        """
-        分析 Owner 发来的“一句话”，判断是否需要创建任务：
-        - 'todo'     : 普通待办
-        - 'reminder' : 带具体时间点的提醒
-        - 'days'     : 一次性的特殊日子/倒计时
-        - 'annis'    : 纪念日（生日、周年）
-        - 'none'     : 不创建任务
-
-        返回示例：
-        {
-          "action": "todo" | "reminder" | "days" | "annis" | "none",
-          "title": "字符串标题",
-          "note": "补充说明",
-          "datetime": "YYYY-MM-DD HH:MM" 或 null,
-          "date": "YYYY-MM-DD" 或 null,
-          "tags": ["标签1", "标签2"]
-        }
-        """
-        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        system_prompt = (
-            f"你是一个严谨的中文私人秘书，现在时间是 {now_str}。\n"
-            "用户会用自然语言描述自己的计划或想法，请你判断这句话是否需要“创建一条任务”。\n"
-            "任务类型说明：\n"
-            "1) 'todo'：普通待办，没有明确的具体时间点，只是要做的事情。\n"
-            "2) 'reminder'：在某个具体时间点需要提醒的事件（例如“明天早上 9 点提醒我复习心内科”）。\n"
-            "3) 'days'：某个一次性的特殊日子/倒计时（例如“6 月 20 号考研初试那天记一下”）。\n"
-            "4) 'annis'：纪念日/重复有意义的日子（例如“我的生日是 5 月 6 号，帮我记一下”）。\n"
-            "5) 'none'：只是正常聊天或者跟任务无关，不需要创建任何记录。\n\n"
-            "如果需要创建任务，请帮我结构化信息。\n"
-            "输出一个 JSON，格式为：\n"
-            "{\n"
-            "  'action': 'todo' | 'reminder' | 'days' | 'annis' | 'none',\n"
-            "  'title': '简短标题，10~30 字为宜',\n"
-            "  'note': '补充说明，可以为空字符串',\n"
-            "  'datetime': 'YYYY-MM-DD HH:MM' 或 null,   # 对于 reminder 使用\n"
-            "  'date': 'YYYY-MM-DD' 或 null,             # 对于 days / annis 使用\n"
-            "  'tags': ['标签1', '标签2']                 # 简短标签数组，例如 ['study','exam']\n"
-            "}\n"
-            "注意：\n"
-            "- 如果判断是 'none'，其他字段可以给空字符串或 null 即可。\n"
-            "- 如果是 'todo'，可以只填 title 和 note，datetime/date 可以为 null。\n"
-            "- 如果用户没有给出明确时间，但明显是提醒类，也可以尝试根据语义推断一个合理时间。"
-        )
-
-        res = await self._call_gpt(system_prompt, text, model=settings.DEFAULT_MODEL)
-        if not res or not isinstance(res, dict) or "error" in res:
-            log.error(f"❌ AI owner-intent analysis failed: {res}")
-            return {"action": "none"}
-
-        res.setdefault("action", "none")
-        res.setdefault("title", "")
-        res.setdefault("note", "")
-        res.setdefault("datetime", None)
-        res.setdefault("date", None)
-        res.setdefault("tags", [])
-
-        # tags 兜底成 list
-        if not isinstance(res["tags"], list):
-            res["tags"] = [str(res["tags"])]
-
-        return res
-
     # ========== Owner Task Management (create / update / delete / list) ==========
 
-    async def manage_tasks_from_chat(
-        self,
-        text: str,
+    @staticmethod
+    def _task_context(
         todos: List[dict],
         reminders: List[dict],
-        days: Optional[List[dict]] = None,
-        annis: Optional[List[dict]] = None,
-    ) -> Dict[str, Any]:
-        """
-        上下文感知的任务管理：
-        - 支持四种 target: 'todo' | 'reminder' | 'days' | 'annis'
-        - 支持四种 op: 'create' | 'update' | 'delete' | 'list'
-        返回结构：
-        {
-          "ok": bool,
-          "operations": [
-            {
-              "op": "create" | "update" | "delete" | "list",
-              "target": "todo" | "reminder" | "days" | "annis",
-              "id": int 或 null,
-              "data": { ... 需要写入的字段 ... }
-            },
-            ...
-          ],
-          "reply_text": "给用户看的自然语言说明"
-        }
-        """
-        if days is None:
-            days = []
-        if annis is None:
-            annis = []
-
-        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
+        days: List[dict],
+        annis: List[dict],
+    ) -> str:
+        """把任务列表压缩成只含 id / title / 时间的 JSON，作为 prompt 的动态上下文。"""
         context_obj = {
             "todos": [
                 {"id": t.get("id"), "title": t.get("title")}
@@ -304,56 +448,66 @@ class AIAgent:
                 for a in annis
             ],
         }
-        context_str = json.dumps(context_obj, ensure_ascii=False)
+        return json.dumps(context_obj, ensure_ascii=False)
+
+    # ========== Unified Owner Pipeline (intent + task management, one round trip) ==========
+
+    async def process_owner_command(self, text: str, tasks: Dict[str, List[dict]]) -> Dict[str, Any]:
+        """
+        Owner 指令的单次调用管线：新建 / 改 / 删 / 查在一次 completion 里解析，返回：
+        {"ok": bool, "operations": [...], "reply_text": str}
+        tasks 为检索后的相关任务 {"todo": [...], "reminder": [...], "days": [...], "annis": [...]}。
+        """
+        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        context_str = self._task_context(
+            tasks.get("todo", []),
+            tasks.get("reminder", []),
+            tasks.get("days", []),
+            tasks.get("annis", []),
+        )
 
         system_prompt = (
-            f"你是一个会直接操作数据库的中文私人秘书助手，现在时间是 {now_str}。\n"
-            f"下面是当前已经存在的任务列表（仅供参考，不要重复创建）：\n"
-            f"{context_str}\n\n"
-            "用户会用中文跟你说一些“管理任务”的话，你需要把它们转化为一组结构化的操作。\n"
-            "支持的 target 类型：'todo' | 'reminder' | 'days' | 'annis'。\n"
-            "支持的 op 类型：\n"
-            "- create：创建新任务\n"
-            "- update：根据 id 更新已有任务\n"
+            "你是一个严谨、会直接操作任务数据库的中文私人秘书。\n"
+            "当前时间和与本条消息相关的已有任务会在上下文里单独给出。\n"
+            "请把用户这句话转化为一组结构化操作（可以为空）。\n\n"
+            "任务类型 target：\n"
+            "1) 'todo'：普通待办，没有明确的具体时间点。\n"
+            "2) 'reminder'：在某个具体时间点需要提醒的事件（例如“明天早上 9 点提醒我复习心内科”），必须给出 datetime。\n"
+            "3) 'days'：一次性的特殊日子/倒计时（例如“6 月 20 号考研初试那天记一下”），给出 date。\n"
+            "4) 'annis'：纪念日/每年重复的日子（例如“我的生日是 5 月 6 号”），给出 date。\n\n"
+            "操作类型 op：\n"
+            "- create：创建新任务（id 为 null）\n"
+            "- update：根据 id 更新已有任务，data 里只填需要修改的字段，其余为 null\n"
             "- delete：根据 id 删除已有任务\n"
-            "- list  ：仅用于查询，不修改任何数据\n\n"
-            "每条操作的 JSON 格式为：\n"
-            "  {\n"
-            "    'op': 'create'|'update'|'delete'|'list',\n"
-            "    'target': 'todo'|'reminder'|'days'|'annis',\n"
-            "    'id': 整数 或 null,            # create 可以是 null，其他必须有\n"
-            "    'data': {\n"
-            "       'title': str 或 null,\n"
-            "       'note': str 或 null,\n"
-            "       'datetime': 'YYYY-MM-DD HH:MM' 或 null,  # reminder 或特殊需要\n"
-            "       'date': 'YYYY-MM-DD' 或 null,            # days / annis 使用\n"
-            "       'tags': [str] 或 null\n"
-            "    }\n"
-            "  }\n\n"
-            "整体输出一个 JSON：\n"
-            "{\n"
-            "  'ok': true 或 false,\n"
-            "  'operations': [ 上述操作对象数组 ],\n"
-            "  'reply_text': '给用户的中文说明，比如“已新增 1 条提醒，已删除 2 条 todo”'\n"
-            "}\n"
+            "- list  ：仅查询，不修改数据，在 reply_text 里直接回答\n\n"
+            "每条操作：{'op', 'target', 'id': 整数或 null, 'data': {'title', 'note', "
+            "'datetime': 'YYYY-MM-DD HH:MM' 或 null, 'date': 'YYYY-MM-DD' 或 null, 'tags': [str] 或 null}}\n"
+            "整体输出：{'ok': bool, 'operations': [...], 'reply_text': '给用户的中文说明'}\n\n"
             "注意：\n"
-            "- 如果用户只是闲聊，不涉及任务，请返回 ok=false，operations 为空数组，reply_text 简短说明即可；\n"
-            "- id 只能使用 context 里已经存在的 id，不要自己杜撰新的 id；\n"
-            "- 如果用户说“把刚才那个 xxx 删掉”，请根据最相近的 title 去匹配已有任务，然后给出 delete 操作。"
+            "- 只是闲聊、与任务无关时：ok=false，operations 为空，reply_text 简短回应；\n"
+            "- id 只能使用上下文里已有的 id，不要杜撰；“刚才那个 xxx”按最相近的 title 匹配；\n"
+            "- 新建任务时 title 10~30 字为宜，并给出 1~3 个简短 tags；\n"
+            "- 用户没有给出明确时间但明显是提醒类，可以根据语义推断一个合理时间；\n"
+            "- 不要重复创建上下文里已经存在的任务。"
         )
 
-        res = await self._call_gpt(system_prompt, text, model=settings.DEFAULT_MODEL)
+        res = await self._call_gpt(
+            system_prompt,
+            text,
+            model=settings.DEFAULT_MODEL,
+            method="process_owner_command",
+            schema=ai_schemas.TASK_OPERATIONS,
+            context=f"当前时间：{now_str}\n相关的已有任务：\n{context_str}",
+        )
         if not res or not isinstance(res, dict) or "error" in res:
-            log.error(f"❌ AI manage-tasks analysis failed: {res}")
+            log.error(f"❌ AI owner-command pipeline failed: {res}")
             return {"ok": False, "operations": [], "reply_text": "AI 解析失败，未对任务做任何修改。"}
 
         res.setdefault("ok", False)
         res.setdefault("operations", [])
         res.setdefault("reply_text", "")
-
         if not isinstance(res["operations"], list):
             res["operations"] = []
-
         return res
 
     # ========== Greeting Generation ==========
@@ -372,7 +526,9 @@ class AIAgent:
             "输出 JSON：{\"text\": \"...\"}"
         )
 
-        result = await self._call_gpt(system_prompt, event_name)
+        result = await self._call_gpt(
+            system_prompt, event_name, method="generate_greeting", schema=ai_schemas.GREETING
+        )
 
         if not result or "error" in result:
             log.error(f"❌ AI greeting generation failed: {result}")
@@ -385,9 +541,9 @@ class AIAgent:
 
     # ========== Image Analysis (Vision) ==========
 
-    async def analyze_image(self, image_path: str, caption: str | None = None) -> Dict[str, Any]:
+    async def analyze_image(self, image: bytes | str, caption: str | None = None) -> Dict[str, Any]:
         """
-        使用 GPT-4o 对图片进行分析：
+        使用 GPT-4o 对图片进行分析（image 可以是内存中的 bytes，也可以是本地文件路径）：
         返回结构示例：
         {
           'summary': '对图片内容的一两句中文描述',
@@ -399,8 +555,10 @@ class AIAgent:
             return {"error": "No API Key configured"}
 
         try:
-            with open(image_path, "rb") as f:
-                base64_image = base64.b64encode(f.read()).decode("utf-8")
+            if isinstance(image, str):
+                with open(image, "rb") as f:
+                    image = f.read()
+            base64_image = base64.b64encode(image).decode("utf-8")
         except Exception as e:
             log.error(f"❌ Image read failed: {e}")
             return {"error": f"Image read failed: {e}"}
@@ -423,21 +581,33 @@ class AIAgent:
             {"type": "text", "text": caption or "请帮我分析这张图片。"},
             {
                 "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
+                # 传进来的已经是挑过的小尺寸图，low detail 固定按一张 512px 瓦片计费
+                "image_url": {"url": f"data:image/jpeg;base64,{base64_image}", "detail": "low"},
             },
         ]
 
         try:
-            response = self.client.chat.completions.create(
+            # 视觉模型没有更便宜的替身，不做对冲
+            response = await self._complete(
+                "analyze_image",
+                hedge=False,
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_content},
                 ],
-                response_format={"type": "json_object"},
+                response_format=(
+                    ai_schemas.response_format("analyze_image", ai_schemas.IMAGE_ANALYSIS)
+                    if settings.AI_STRUCTURED_OUTPUT
+                    else {"type": "json_object"}
+                ),
             )
             content = response.choices[0].message.content
-            data = json.loads(content)
+            try:
+                data = json.loads(content)
+            except (TypeError, ValueError):
+                usage_stats.record_parse_failure("analyze_image")
+                raise
         except Exception as e:
             log.error(f"❌ Vision API Error: {e}")
             return {
@@ -462,29 +632,44 @@ class AIAgent:
 
     # ========== Simple Chat Reply (for Chat Mode) ==========
 
-    async def chat_reply(self, user_text: str) -> str:
+    CHAT_SYSTEM_PROMPT = (
+        "You are AtriolyTgbot's private chat assistant.\n"
+        "Try to reply in the same language as the user.\n"
+        "答案要简洁、有条理，可以使用少量 Markdown（如列表、加粗），"
+        "但不要输出 JSON 或代码块，直接给出自然语言回复。"
+    )
+
+    def _chat_messages(self, user_text: str, history: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+        """
+        静态 system prompt 在最前（前缀缓存友好），之后是滚动摘要、最近几轮原文、当前消息。
+        history 来自 conversation_memory.context()：{"summary": str, "turns": [{"role", "content"}]}
+        """
+        messages = [{"role": "system", "content": self.CHAT_SYSTEM_PROMPT}]
+        if history:
+            if history.get("summary"):
+                messages.append({
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation with this user:\n{history['summary']}",
+                })
+            messages.extend(history.get("turns") or [])
+        messages.append({"role": "user", "content": user_text})
+        return messages
+
+    async def chat_reply(self, user_text: str, history: Optional[Dict[str, Any]] = None) -> str:
         """
         Chat 模式下的简单对话接口：
         - 不要求 JSON 输出，直接返回一段自然语言文本。
         - 尽量用用户的语言回复（中/英均可）。
+        - history 为该用户的会话记忆（可选）。
         """
         if not self.client:
             return "⚠️ 当前未配置 OpenAI API Key，无法进行 AI 对话。"
 
-        system_prompt = (
-            "You are AtriolyTgbot's private chat assistant.\n"
-            "Try to reply in the same language as the user.\n"
-            "答案要简洁、有条理，可以使用少量 Markdown（如列表、加粗），"
-            "但不要输出 JSON 或代码块，直接给出自然语言回复。"
-        )
-
         try:
-            response = self.client.chat.completions.create(
+            response = await self._complete(
+                "chat_reply",
                 model=settings.DEFAULT_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_text},
-                ],
+                messages=self._chat_messages(user_text, history),
             )
             content = response.choices[0].message.content or ""
             return content.strip()
@@ -492,5 +677,48 @@ class AIAgent:
             log.error(f"❌ Chat reply failed: {e}")
             return "⚠️ 调用 AI 聊天接口失败，请稍后再试。"
 
+    async def chat_reply_stream(self, user_text: str, history: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """
+        chat_reply 的流式版本：逐段 yield 文本增量。
+        出错时直接抛异常（由调用方决定兜底文案）；未配置 API Key 时 yield 一条提示。
+        """
+        if not self.client:
+            yield "⚠️ 当前未配置 OpenAI API Key，无法进行 AI 对话。"
+            return
+
+        async for delta in self._stream(
+            "chat_reply",
+            model=settings.DEFAULT_MODEL,
+            messages=self._chat_messages(user_text, history),
+        ):
+            yield delta
+
+    SUMMARY_SYSTEM_PROMPT = (
+        "You maintain a running memory of a private chat between a user and an assistant.\n"
+        "Merge the previous summary and the new dialogue turns into one updated summary.\n"
+        "Keep facts about the user, their preferences, open questions and decisions; drop small talk.\n"
+        "Write in the user's language, plain text, at most 120 words."
+    )
+
+    async def summarize_conversation(self, summary: str, turns: List[Dict[str, str]]) -> Optional[str]:
+        """把「旧摘要 + 被挤出预算的若干轮对话」合并成新的滚动摘要；失败返回 None。"""
+        if not self.client or not turns:
+            return None
+        dialogue = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+        try:
+            response = await self._complete(
+                "summarize_conversation",
+                hedge=False,
+                model=settings.DEFAULT_MODEL,
+                messages=[
+                    {"role": "system", "content": self.SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": f"Previous summary:\n{summary or '(none)'}\n\nNew turns:\n{dialogue}"},
+                ],
+            )
+            content = (response.choices[0].message.content or "").strip()
+            return content or None
+        except Exception as e:
+            log.error(f"❌ Conversation summary failed: {e}")
+            return None
 
 agent = AIAgent()
@@ -0,0 +1,91 @@
+"""
+AIAgent 各方法的 JSON 输出 schema（OpenAI Structured Outputs, strict 模式）。
+
+strict 模式要求：
+- 每个 object 都写明 additionalProperties: False
+- 所有字段都列进 required；可选字段用 ["xxx", "null"] 表示
+"""
+from typing import Any, Dict
+
+_STR = {"type": "string"}
+_NSTR = {"type": ["string", "null"]}
+_BOOL = {"type": "boolean"}
+_TAGS = {"type": "array", "items": _STR}
+_TASK_TARGET = {"type": "string", "enum": ["todo", "reminder", "days", "annis"]}
+
+
+def _obj(**props: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": props,
+        "required": list(props),
+        "additionalProperties": False,
+    }
+
+
+GROUP_VERDICT = _obj(
+    is_spam=_BOOL,
+    spam_reason=_NSTR,
+    is_membership=_BOOL,
+    platform=_NSTR,
+    summary=_STR,
+)
+
+BATCH_VERDICT = _obj(
+    results={
+        "type": "array",
+        "items": _obj(
+            i={"type": "integer"},
+            is_spam=_BOOL,
+            is_membership=_BOOL,
+            platform=_NSTR,
+            summary=_STR,
+        ),
+    }
+)
+
+PRIVATE_CLASSIFICATION = _obj(
+    is_spam=_BOOL,
+    category={
+        "type": "string",
+        "enum": ["membership_sharing", "general_chat", "support", "billing", "other"],
+    },
+    tags=_TAGS,
+    summary=_STR,
+)
+
+TASK_OPERATIONS = _obj(
+    ok=_BOOL,
+    operations={
+        "type": "array",
+        "items": _obj(
+            op={"type": "string", "enum": ["create", "update", "delete", "list"]},
+            target=_TASK_TARGET,
+            id={"type": ["integer", "null"]},
+            data=_obj(
+                title=_NSTR,
+                note=_NSTR,
+                datetime=_NSTR,
+                date=_NSTR,
+                tags={"type": ["array", "null"], "items": _STR},
+            ),
+        ),
+    },
+    reply_text=_STR,
+)
+
+GREETING = _obj(text=_STR)
+
+IMAGE_ANALYSIS = _obj(
+    summary=_STR,
+    tags=_TAGS,
+    risk={"type": "string", "enum": ["safe", "nsfw", "sensitive"]},
+)
+
+
+def response_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """包装成 chat.completions 的 response_format 参数。"""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": schema},
+    }
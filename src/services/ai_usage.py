@@ -0,0 +1,52 @@
+import logging
+from typing import Any, Dict
+
+log = logging.getLogger(__name__)
+
+
+class AIUsageStats:
+    """
+    按 AIAgent 方法统计：调用次数、prompt / cached / completion tokens、JSON 解析失败次数。
+    cached_tokens 来自 usage.prompt_tokens_details.cached_tokens（命中 OpenAI 前缀缓存的部分），
+    用来观察 prompt 布局调整后的缓存命中率。
+    """
+
+    FIELDS = ("calls", "prompt_tokens", "cached_tokens", "completion_tokens", "parse_failures")
+
+    def __init__(self):
+        self.methods: Dict[str, Dict[str, int]] = {}
+
+    def _bucket(self, method: str) -> Dict[str, int]:
+        bucket = self.methods.get(method)
+        if bucket is None:
+            bucket = self.methods[method] = dict.fromkeys(self.FIELDS, 0)
+        return bucket
+
+    def record_usage(self, method: str, usage: Any) -> None:
+        bucket = self._bucket(method)
+        bucket["calls"] += 1
+        if usage is None:
+            return
+        bucket["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+        bucket["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        bucket["cached_tokens"] += getattr(details, "cached_tokens", 0) or 0
+
+    def record_parse_failure(self, method: str) -> None:
+        self._bucket(method)["parse_failures"] += 1
+
+    def render(self) -> str:
+        if not self.methods:
+            return "No AI calls recorded yet."
+        lines = []
+        for method, b in sorted(self.methods.items()):
+            cache_rate = b["cached_tokens"] / b["prompt_tokens"] if b["prompt_tokens"] else 0.0
+            fail_rate = b["parse_failures"] / b["calls"] if b["calls"] else 0.0
+            lines.append(
+                f"• `{method}`: {b['calls']} calls | prompt {b['prompt_tokens']} "
+                f"(cached {cache_rate:.0%}) | out {b['completion_tokens']} | parse-fail {fail_rate:.0%}"
+            )
+        return "\n".join(lines)
+
+
+usage_stats = AIUsageStats()
@@ -1,50 +1,49 @@
-import json
-import os
 import logging
 from typing import Dict
 
+from src.services.metrics import bans_total, strikes_total
+from src.services.shared_state import Document
+
 log = logging.getLogger(__name__)
-DB_FILE = "/app/data/blacklist.json"
 
 class BlacklistManager:
 	def __init__(self):
-		self.data = self._load_db()
+		# DATA_DIR/blacklist.json（或共享后端里的同名文档）；首次访问才读（启动钩子里会调 load() 提前读好）
+		self.doc = Document("blacklist", lambda: {"banned": [], "warnings": {}})
 
-	def _load_db(self) -> Dict:
-		if not os.path.exists(DB_FILE):
-			return {"banned": [], "warnings": {}}
-		try:
-			with open(DB_FILE, 'r') as f: return json.load(f)
-		except: return {"banned": [], "warnings": {}}
+	@property
+	def data(self) -> Dict:
+		return self.doc.get()
 
-	def _save_db(self):
-		os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
-		with open(DB_FILE, 'w') as f: json.dump(self.data, f, indent=2)
+	def load(self):
+		self.doc.get()
 
 	def is_banned(self, user_id: int) -> bool:
 		return user_id in self.data["banned"]
 
 	def ban_user(self, user_id: int):
-		if user_id not in self.data["banned"]:
-			self.data["banned"].append(user_id)
-			if str(user_id) in self.data["warnings"]: del self.data["warnings"][str(user_id)]
-			self._save_db()
+		with self.doc.edit() as data:
+			if user_id not in data["banned"]:
+				bans_total.inc()
+				data["banned"].append(user_id)
+				if str(user_id) in data["warnings"]: del data["warnings"][str(user_id)]
 
 	def unban_user(self, user_id: int):
-		if user_id in self.data["banned"]:
-			self.data["banned"].remove(user_id)
-			self._save_db()
-			return True
+		with self.doc.edit() as data:
+			if user_id in data["banned"]:
+				data["banned"].remove(user_id)
+				return True
 		return False
 
 	def add_strike(self, user_id: int, max_strikes: int = 3) -> str:
+		strikes_total.inc()
 		uid_str = str(user_id)
-		current = self.data["warnings"].get(uid_str, 0) + 1
-		if current >= max_strikes:
-			self.ban_user(user_id)
-			return "banned"
-		self.data["warnings"][uid_str] = current
-		self._save_db()
+		with self.doc.edit() as data:
+			current = data["warnings"].get(uid_str, 0) + 1
+			if current >= max_strikes:
+				self.ban_user(user_id)
+				return "banned"
+			data["warnings"][uid_str] = current
 		return "warned"
 
 	def get_strike_count(self, user_id: int) -> int:
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
+
+from src.config import settings
+from src.services.ai_agent import agent
+from src.services.group_config import group_config
+
+log = logging.getLogger(__name__)
+
+
+class CatchupManager:
+    """
+    重启后的积压追赶：
+    - 发送时间早于 CATCHUP_MAX_AGE 秒的群消息视为「过期」，不走逐条 AI 流程
+    - 按 CATCHUP_MODE 处理：
+        skip    : 只计数，不做任何判定
+        keyword : 只用关键词兜底判定（零成本）
+        sample  : 按 CATCHUP_SAMPLE_RATE 抽样后再批量判定
+        batch   : 全部进入批量 AI 判定（一次调用处理 CATCHUP_BATCH_SIZE 条）
+    - 积压处理完（安静 CATCHUP_FLUSH_DELAY 秒）后，只给管理员发一条汇总 digest：
+      会员机会按来源群的档位发给它的 alert_targets()，总体统计发给 FORWARD_TO
+    过期消息在 handler 里立刻返回，所以实时消息不会被排在积压后面。
+    """
+
+    MAX_BUFFER = 500     # 缓冲上限，超出部分只计数
+    MAX_DIGEST_ITEMS = 20
+
+    def __init__(self):
+        self.buffer: List[Dict] = []
+        self.stats = self._empty_stats()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._bot = None
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, int]:
+        return {"stale": 0, "skipped": 0, "classified": 0, "spam": 0, "membership": 0}
+
+    # ---------- 判定 ----------
+
+    def is_stale(self, msg_date: Optional[datetime]) -> bool:
+        if not msg_date or settings.CATCHUP_MAX_AGE <= 0:
+            return False
+        if msg_date.tzinfo is None:
+            msg_date = msg_date.replace(tzinfo=timezone.utc)
+        age = (datetime.now(timezone.utc) - msg_date).total_seconds()
+        return age > settings.CATCHUP_MAX_AGE
+
+    def add(self, bot, chat_id: int, chat_title: str, user_name: str, text: str, link: Optional[str]) -> None:
+        """登记一条过期群消息（已通过 safety + 关键词预筛），并重置 digest 定时器。"""
+        self._bot = bot
+        self.stats["stale"] += 1
+
+        mode = settings.CATCHUP_MODE
+        keep = mode in ("keyword", "batch") or (
+            mode == "sample" and random.random() < settings.CATCHUP_SAMPLE_RATE
+        )
+        if not keep or len(self.buffer) >= self.MAX_BUFFER:
+            self.stats["skipped"] += 1
+        else:
+            self.buffer.append(
+                {"chat_id": chat_id, "chat": chat_title, "user": user_name, "text": text, "link": link, "ts": time.time()}
+            )
+
+        loop = asyncio.get_running_loop()
+        if self._flush_handle:
+            self._flush_handle.cancel()
+        self._flush_handle = loop.call_later(settings.CATCHUP_FLUSH_DELAY, self._spawn_flush)
+
+    def _spawn_flush(self) -> None:
+        # 保留 task 引用：事件循环只持有弱引用，digest 发送途中可能被 GC 掉
+        task = asyncio.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # ---------- 汇总 ----------
+
+    async def _classify(self, items: List[Dict]) -> List[Dict]:
+        texts = [it["text"] for it in items]
+        if settings.CATCHUP_MODE == "keyword":
+            return [agent.keyword_verdict(t, "Catch-up keyword mode") for t in texts]
+
+        verdicts: List[Dict] = []
+        size = max(1, settings.CATCHUP_BATCH_SIZE)
+        for i in range(0, len(texts), size):
+            verdicts.extend(await agent.classify_batch(texts[i:i + size]))
+        return verdicts
+
+    async def flush(self) -> None:
+        self._flush_handle = None
+        items, self.buffer = self.buffer, []
+        stats, self.stats = self.stats, self._empty_stats()
+        if not stats["stale"]:
+            return
+
+        hits = []
+        try:
+            verdicts = await self._classify(items)
+        except Exception as e:
+            log.error(f"❌ Catch-up classification failed: {e}")
+            verdicts = [agent.keyword_verdict(it["text"], "Catch-up failed") for it in items]
+
+        for item, v in zip(items, verdicts):
+            stats["classified"] += 1
+            if v.get("is_spam"):
+                stats["spam"] += 1
+            elif v.get("is_membership"):
+                stats["membership"] += 1
+                hits.append((item, v))
+
+        log.info(f"📦 CATCH-UP DONE | {stats}")
+
+        header = [
+            "📦 **Catch-up Digest**",
+            f"Stale group messages: `{stats['stale']}` "
+            f"(classified `{stats['classified']}`, skipped `{stats['skipped']}`)",
+            f"🤖 Spam: `{stats['spam']}` | 💎 Membership: `{stats['membership']}`",
+        ]
+        # 管理员 -> 发给他的会员机会；FORWARD_TO 即使没有命中也要收到总体统计
+        per_admin: Dict[int, List[str]] = {admin: [] for admin in settings.get_forward_targets()}
+        for item, v in hits:
+            # 群名 / 消息原文 / AI 给的平台名都是外部输入，legacy Markdown 里要转义，否则整条 digest 发不出去
+            platform = escape_markdown(v.get("platform") or "Unknown")
+            chat = escape_markdown(item["chat"] or "")
+            link = f" [link]({item['link']})" if item.get("link") else ""
+            line = f"• {platform} · {chat}: {escape_markdown(item['text'][:60])}{link}"
+            for admin in group_config.resolve(item["chat_id"]).alert_targets():
+                per_admin.setdefault(admin, []).append(line)
+
+        if not self._bot:
+            return
+        for admin, items_for_admin in per_admin.items():
+            lines = header + items_for_admin[: self.MAX_DIGEST_ITEMS]
+            if len(items_for_admin) > self.MAX_DIGEST_ITEMS:
+                lines.append(f"… and {len(items_for_admin) - self.MAX_DIGEST_ITEMS} more")
+            try:
+                await self._bot.send_message(
+                    chat_id=admin, text="\n".join(lines), parse_mode=ParseMode.MARKDOWN,
+                    disable_web_page_preview=True,
+                )
+            except Exception as e:
+                log.error(f"❌ Failed to send catch-up digest to {admin}: {e}")
+
+catchup = CatchupManager()
@@ -0,0 +1,143 @@
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from src.config import settings
+from src.services.ai_agent import agent
+from src.services.shared_state import storage
+
+log = logging.getLogger(__name__)
+
+MEMORY_DIR = "conversations"
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 token 数（不引入 tiktoken）：中日文字符约 1 token/字，其余约 4 字符/token。
+    只用于预算控制，偏差 20% 以内就够用。
+    """
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4 + 4  # +4: 每条消息的 role / 分隔开销
+
+
+class Conversation:
+    def __init__(self, summary: str = "", turns: Optional[List[Dict[str, str]]] = None, updated: float = 0.0):
+        self.summary = summary
+        self.turns: List[Dict[str, str]] = turns or []
+        self.updated = updated or time.time()
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(t["content"]) for t in self.turns)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"summary": self.summary, "turns": self.turns, "updated": self.updated}
+
+
+class ConversationMemory:
+    """
+    Chat 模式的按用户会话记忆：
+    - 每次请求带入「滚动摘要 + 最近若干轮原文」，总量不超过 CHAT_MEMORY_TOKEN_BUDGET
+    - 超出预算时，把最旧的几轮交给 AI 合并进摘要（失败则直接丢弃），最近 CHAT_MEMORY_KEEP_TURNS 条原文始终保留
+    - 内存里最多保留 CHAT_MEMORY_MAX_ACTIVE 个会话（LRU），多出的冷会话只留在 DATA_DIR/conversations/<user_id>.json，
+      下次对话时再读回；超过 CHAT_MEMORY_TTL 未活跃的会话（不管在内存还是盘上）直接作废
+    - 每轮写回：file 后端由 io_executor 的写线程落盘（同一文件连续写入会合并），进程被 kill 也只丢正在写的那一轮
+    - 共享后端（多副本）下同一用户的消息可能落在任一副本：每次都从库里读
+    """
+
+    def __init__(self):
+        self.active: "OrderedDict[int, Conversation]" = OrderedDict()
+
+    # ---------- 落盘 / 读回 ----------
+
+    @staticmethod
+    def _name(user_id: int) -> str:
+        return f"{MEMORY_DIR}/{user_id}"
+
+    def _load(self, user_id: int) -> Conversation:
+        try:
+            data, _ = storage.read(self._name(user_id))
+            if data is None:
+                return Conversation()
+            conv = Conversation(data.get("summary", ""), data.get("turns", []), data.get("updated", 0.0))
+        except Exception as e:
+            log.error(f"❌ Failed to load conversation {user_id}: {e}")
+            return Conversation()
+        return Conversation() if self._expired(conv) else conv
+
+    @staticmethod
+    def _expired(conv: Conversation) -> bool:
+        return bool(settings.CHAT_MEMORY_TTL) and time.time() - conv.updated > settings.CHAT_MEMORY_TTL
+
+    def _save(self, user_id: int, conv: Conversation) -> None:
+        try:
+            storage.write(self._name(user_id), conv.to_dict(), compact=True)
+        except Exception as e:
+            log.error(f"❌ Failed to save conversation {user_id}: {e}")
+
+    def _get(self, user_id: int) -> Conversation:
+        conv = self.active.get(user_id)
+        if conv is None or storage.shared:
+            conv = self.active[user_id] = self._load(user_id)
+        elif self._expired(conv):
+            # 一直留在内存里的会话也要过期（下一轮写回时盘上的旧内容随之被覆盖）
+            conv = self.active[user_id] = Conversation()
+        self.active.move_to_end(user_id)
+        while len(self.active) > settings.CHAT_MEMORY_MAX_ACTIVE:
+            # 每轮都已经写回过，冷会话直接移出内存
+            self.active.popitem(last=False)
+        return conv
+
+    def save_all(self) -> None:
+        """关闭前把内存中的会话全部落盘。"""
+        for user_id, conv in self.active.items():
+            self._save(user_id, conv)
+
+    # ---------- 对外接口 ----------
+
+    def context(self, user_id: int) -> Dict[str, Any]:
+        conv = self._get(user_id)
+        return {"summary": conv.summary, "turns": list(conv.turns)}
+
+    def clear(self, user_id: int) -> None:
+        self.active.pop(user_id, None)
+        try:
+            storage.delete(self._name(user_id))
+        except Exception as e:
+            log.error(f"❌ Failed to delete conversation {user_id}: {e}")
+
+    async def record(self, user_id: int, user_text: str, reply: str) -> None:
+        """追加一轮对话；超出 token 预算时压缩最旧的几轮到摘要。"""
+        conv = self._get(user_id)
+        conv.turns.append({"role": "user", "content": user_text})
+        conv.turns.append({"role": "assistant", "content": reply})
+        conv.updated = time.time()
+        self._save(user_id, conv)
+
+        if conv.tokens <= settings.CHAT_MEMORY_TOKEN_BUDGET:
+            return
+
+        # 从最旧的开始挤出，直到剩余原文回到预算的一半（避免每条新消息都触发一次摘要）
+        keep = max(2, settings.CHAT_MEMORY_KEEP_TURNS)
+        target = settings.CHAT_MEMORY_TOKEN_BUDGET // 2
+        evicted: List[Dict[str, str]] = []
+        while len(conv.turns) > keep and conv.tokens > target:
+            evicted.append(conv.turns.pop(0))
+        if not evicted:
+            return
+
+        summary = await agent.summarize_conversation(conv.summary, evicted)
+        if summary:
+            conv.summary = summary
+        self._save(user_id, conv)
+        log.info(
+            f"🧠 Compacted conversation {user_id}: {len(evicted)} turns → summary "
+            f"({'ok' if summary else 'dropped'}), now ~{conv.tokens} tokens"
+        )
+
+
+conversation_memory = ConversationMemory()
@@ -0,0 +1,226 @@
+import datetime
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from src.config import settings
+from src.services.shared_state import Document
+
+log = logging.getLogger(__name__)
+
+_TZ = ZoneInfo("Asia/Shanghai")
+
+# 当前 update 的 (chat_id, user_id, 群名, 用户名)；由 update processor 在分发前设置，
+# asyncio.create_task 会复制 context，所以合并 / 后台任务里也能拿到发起者（调度器里的调用记为 0）
+_caller: ContextVar[Tuple[int, int, str, str]] = ContextVar("ai_caller", default=(0, 0, "", ""))
+
+# (小时桶, method, chat_id, user_id)
+LedgerKey = Tuple[int, str, int, int]
+# [calls, prompt, cached, completion, cost_usd]
+LedgerRow = List[float]
+
+
+def _add(rows: Dict[LedgerKey, LedgerRow], key: LedgerKey, delta: LedgerRow) -> None:
+    row = rows.get(key)
+    if row is None:
+        rows[key] = list(delta)
+    else:
+        for i, value in enumerate(delta):
+            row[i] += value
+
+
+def set_caller(chat, user) -> None:
+    """chat / user 为 telegram 的 Chat / User（可为 None）。"""
+    _caller.set((
+        chat.id if chat else 0,
+        user.id if user else 0,
+        (chat.title or "") if chat else "",
+        user.full_name if user else "",
+    ))
+
+
+def _month(hour: int) -> str:
+    return datetime.datetime.fromtimestamp(hour * 3600, tz=_TZ).strftime("%Y-%m")
+
+
+def month_start_hour() -> int:
+    """本月 1 日 0 点（Asia/Shanghai）对应的小时桶。"""
+    now = datetime.datetime.now(tz=_TZ)
+    start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return int(start.timestamp() // 3600)
+
+
+class CostLedger:
+    """
+    OpenAI 费用账本：每次 AIAgent 调用按 (小时, method, chat, user) 聚合 token 与估算费用。
+    - 价格来自 AI_PRICES（每百万 token 的美元价，按模型名前缀匹配）
+    - 每 LEDGER_FLUSH_INTERVAL 秒最多落盘一次，退出时再落一次；只保留 LEDGER_RETENTION_DAYS 天
+    - 落盘时把本进程自上次落盘以来的增量合并进共享文档，多副本各记各的，不会互相覆盖
+    - 群的本月花费单独累计，超过预算（GROUP_MONTHLY_BUDGET / GROUP_BUDGETS）后 over_budget() 为 True，
+      群消息扫描改走 keyword-only
+    """
+
+    def __init__(self):
+        # 合并视图：已落盘的（含其它副本的）+ 本进程未落盘的增量
+        self.rows: Dict[LedgerKey, LedgerRow] = {}
+        # 本进程自上次落盘以来的增量
+        self.pending: Dict[LedgerKey, LedgerRow] = {}
+        self.names: Dict[int, str] = {}
+        self.month = _month(int(time.time() // 3600))
+        self.month_spend: Dict[int, float] = {}
+        # chat_id -> 已发过超预算提醒的月份
+        self.alerted: Dict[int, str] = {}
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        # DATA_DIR/ai_ledger.json（或共享后端里的同名文档）；load() 时才读（启动钩子调用，或首次记账 / 查询时）
+        self.doc = Document("ai_ledger", dict, self._on_load, compact=True)
+
+    # ---------- 落盘 / 读回 ----------
+
+    def load(self) -> None:
+        self.doc.get()
+
+    def _on_load(self, data: Dict[str, Any]) -> None:
+        self.rows = {}
+        for hour, method, chat, user, *values in data.get("rows", []):
+            self.rows[(hour, method, chat, user)] = values
+        for key, delta in self.pending.items():
+            _add(self.rows, key, delta)
+        self.names = {**{int(k): v for k, v in data.get("names", {}).items()}, **self.names}
+        for k, month in data.get("alerted", {}).items():
+            self.alerted[int(k)] = max(month, self.alerted.get(int(k), ""))
+        self._rebuild_month()
+
+    def _rebuild_month(self) -> None:
+        self.month_spend = {}
+        for (hour, _, chat, _), row in self.rows.items():
+            if chat < 0 and _month(hour) == self.month:
+                self.month_spend[chat] = self.month_spend.get(chat, 0.0) + row[4]
+
+    def flush(self, force: bool = False) -> None:
+        if not self._dirty or (
+            not force and time.monotonic() - self._last_flush < settings.LEDGER_FLUSH_INTERVAL
+        ):
+            return
+        cutoff = int(time.time() // 3600) - settings.LEDGER_RETENTION_DAYS * 24
+        try:
+            # edit() 会先读入最新版本（_on_load 把未落盘的增量叠加上去），这里再整体写回
+            with self.doc.edit() as data:
+                self.rows = {k: v for k, v in self.rows.items() if k[0] >= cutoff}
+                data["rows"] = [[*k, *(round(x, 6) for x in v)] for k, v in self.rows.items()]
+                data["names"] = self.names
+                data["alerted"] = self.alerted
+        except Exception as e:
+            log.error(f"❌ Failed to save AI ledger: {e}")
+            return
+        self.pending = {}
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+    # ---------- 记账 ----------
+
+    @staticmethod
+    def price(model: Optional[str]) -> List[float]:
+        """[input, cached_input, output]，每百万 token 美元；按最长前缀匹配，未知模型按 DEFAULT_MODEL 计。"""
+        prices = settings.AI_PRICES
+        for name in (model or "", settings.DEFAULT_MODEL):
+            matches = [k for k in prices if name.startswith(k)]
+            if matches:
+                return prices[max(matches, key=len)]
+        return [0.0, 0.0, 0.0]
+
+    def record(self, method: str, usage: Any, model: Optional[str] = None) -> None:
+        if usage is None:
+            return
+        self.load()
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", 0) or 0
+        p_in, p_cached, p_out = self.price(model)
+        cost = ((prompt - cached) * p_in + cached * p_cached + completion * p_out) / 1_000_000
+
+        chat, user, chat_name, user_name = _caller.get()
+        self._remember_name(chat, chat_name)
+        self._remember_name(user, user_name)
+        hour = int(time.time() // 3600)
+        key = (hour, method, chat, user)
+        delta = [1, prompt, cached, completion, cost]
+        _add(self.rows, key, delta)
+        _add(self.pending, key, delta)
+
+        month = _month(hour)
+        if month != self.month:
+            self.month = month
+            self._rebuild_month()
+        elif chat < 0:
+            self.month_spend[chat] = self.month_spend.get(chat, 0.0) + cost
+        self._dirty = True
+        self.flush()
+
+    def _remember_name(self, chat_id: int, name: str) -> None:
+        if name and self.names.get(chat_id) != name:
+            self.names[chat_id] = name
+
+    # ---------- 预算 ----------
+
+    @staticmethod
+    def budget(chat_id: int) -> float:
+        return settings.GROUP_BUDGETS.get(chat_id, settings.GROUP_MONTHLY_BUDGET)
+
+    def over_budget(self, chat_id: int) -> bool:
+        limit = self.budget(chat_id)
+        if limit <= 0:
+            return False
+        self.load()
+        if _month(int(time.time() // 3600)) != self.month:
+            # 跨月后第一次检查：重新起算
+            self.month = _month(int(time.time() // 3600))
+            self._rebuild_month()
+        return self.month_spend.get(chat_id, 0.0) >= limit
+
+    def take_budget_alert(self, chat_id: int) -> bool:
+        """每个群每月只提醒一次超预算。"""
+        self.load()
+        if self.alerted.get(chat_id) == self.month:
+            return False
+        self.alerted[chat_id] = self.month
+        self._dirty = True
+        return True
+
+    # ---------- 查询 ----------
+
+    def totals(self, since_hour: int) -> Dict[str, Any]:
+        """since_hour 之后的汇总：总计 + 按 method / 群 / 用户的 [calls, tokens, cost]。"""
+        self.load()
+        total = [0, 0, 0.0]
+        by: Dict[str, Dict[int | str, List[float]]] = {"method": {}, "group": {}, "user": {}}
+        for (hour, method, chat, user), row in self.rows.items():
+            if hour < since_hour:
+                continue
+            tokens = row[1] + row[3]
+            keys = [("method", method)]
+            if chat < 0:
+                keys.append(("group", chat))
+            if user:
+                keys.append(("user", user))
+            for dim, key in keys:
+                agg = by[dim].setdefault(key, [0, 0, 0.0])
+                agg[0] += row[0]
+                agg[1] += tokens
+                agg[2] += row[4]
+            total[0] += row[0]
+            total[1] += tokens
+            total[2] += row[4]
+        return {"total": total, **by}
+
+    def top(self, since_hour: int, limit: int = 5) -> Dict[str, Any]:
+        data = self.totals(since_hour)
+        for dim in ("method", "group", "user"):
+            data[dim] = sorted(data[dim].items(), key=lambda kv: kv[1][2], reverse=True)[:limit]
+        return data
+
+
+cost_ledger = CostLedger()
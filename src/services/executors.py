@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from src.config import settings
+from src.utils.offload import SharedBytes, call_shared
+
+log = logging.getLogger(__name__)
+
+# worker 进程由 forkserver 派生时预先 import 的模块：只放纯计算、不依赖 settings 的工具模块
+_WORKER_PRELOAD = ["src.utils.imaging", "src.utils.offload"]
+
+
+class CpuExecutor:
+    """
+    CPU 密集步骤（图片解码 / dHash 等）的进程池：
+    - CPU_WORKERS 个 worker 进程（-1 = 核数 - 1，至少 1 个；0 = 不开进程，退回线程池，适合不允许 fork 的环境）
+    - 第一次提交时才启动（forkserver，worker 里不会带着父进程的事件循环、socket、调度器线程）
+    - 有界队列：最多 workers × CPU_QUEUE_DEPTH 个任务在途，再多的调用方在 run() 里排队等，
+      不会把无限多的大块 bytes 堆进进程池的管道里
+    - bytes 参数不小于 CPU_SHM_MIN_BYTES 时放进共享内存，worker 直接拿 memoryview，不走 pickle + 管道复制
+    提交的函数必须能按模块路径 pickle（模块级函数），且不能依赖父进程里的单例状态。
+    """
+
+    def __init__(self):
+        self._pool: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.workers = 0
+        self.processes = False
+        self.in_flight = 0
+        self.completed = 0
+
+    def _start(self) -> None:
+        workers = settings.CPU_WORKERS
+        if workers < 0:
+            workers = max(1, (os.cpu_count() or 1) - 1)
+        if workers == 0:
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cpu")
+            self.workers, self.processes = 1, False
+        else:
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload(_WORKER_PRELOAD)
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+            self.workers, self.processes = workers, True
+        self._slots = asyncio.Semaphore(self.workers * max(1, settings.CPU_QUEUE_DEPTH))
+        log.info(f"🧮 CPU executor started: {self.workers} {'process' if self.processes else 'thread'} worker(s)")
+
+    def _share(self, arg: Any, segments: List[shared_memory.SharedMemory]) -> Any:
+        if not self.processes or not isinstance(arg, (bytes, bytearray, memoryview)):
+            return arg
+        size = len(arg) if not isinstance(arg, memoryview) else arg.nbytes
+        if size < settings.CPU_SHM_MIN_BYTES:
+            return arg
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        segments.append(shm)
+        shm.buf[:size] = arg
+        return SharedBytes(shm.name, size)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """在池里执行 fn(*args)，返回结果；异常原样抛回调用方。"""
+        if self._slots is None:
+            self._start()
+        async with self._slots:
+            self.in_flight += 1
+            segments: List[shared_memory.SharedMemory] = []
+            try:
+                payload = tuple(self._share(arg, segments) for arg in args)
+                loop = asyncio.get_running_loop()
+                pool = self._pool
+                try:
+                    return await loop.run_in_executor(pool, call_shared, fn, payload)
+                except BrokenProcessPool:
+                    # worker 被 OOM kill / forkserver 起不来：这个池永久不可用，丢掉，下次调用重建
+                    self._discard(pool)
+                    raise
+            finally:
+                self.in_flight -= 1
+                self.completed += 1
+                # worker 用完就断开了；这里 unlink 后段才真正释放（被取消时 worker 可能还连着，POSIX 下也安全）
+                for shm in segments:
+                    shm.close()
+                    shm.unlink()
+
+    def _discard(self, pool: Executor) -> None:
+        if self._pool is not pool:
+            return  # 并发的其它调用已经处理过
+        log.error("❌ CPU process pool is broken, it will be rebuilt on the next call")
+        self._pool = None
+        self._slots = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+            self._slots = None
+
+
+class IoExecutor:
+    """
+    阻塞文件 I/O 的线程池（IO_WORKERS 个线程）：
+    - run(fn, *args)         : 在池里跑一次阻塞调用并等结果
+    - submit_write(key, fn)  : 不等结果的写盘。同一个 key（通常是文件路径）严格按提交顺序执行；
+      coalesce=True 表示整文件覆盖写，还没开始执行的上一次写入会被这一次直接替换（连续保存只落最后一版），
+      追加写之类每次都要落的操作传 coalesce=False
+    - wait(key) / drain()    : 读盘前 / 关机前等待排队中的写入完成
+    写入里的异常只记日志，不会传回提交方。
+    """
+
+    def __init__(self):
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        # key -> 排队中（尚未开始）的 (fn, coalesce)；key 存在即表示该 key 有写入在排队或正在执行
+        self._queues: Dict[str, Deque[Tuple[Callable[[], Any], bool]]] = {}
+        self.completed = 0
+        self.coalesced = 0
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=max(1, settings.IO_WORKERS), thread_name_prefix="io")
+        return self._pool
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    def submit_write(self, key: str, fn: Callable[[], Any], coalesce: bool = True) -> None:
+        with self._lock:
+            queue = self._queues.get(key)
+            start = queue is None
+            if start:
+                queue = self._queues[key] = deque()
+            if coalesce and queue and queue[-1][1]:
+                queue[-1] = (fn, True)
+                self.coalesced += 1
+            else:
+                queue.append((fn, coalesce))
+        if start:
+            self.pool.submit(self._run_key, key)
+
+    def _run_key(self, key: str) -> None:
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    self._idle.notify_all()
+                    return
+                fn, _ = queue.popleft()
+            try:
+                fn()
+            except Exception as e:
+                log.error(f"❌ Background write failed ({key}): {e}")
+            with self._lock:
+                self.completed += 1
+
+    def wait(self, key: str, timeout: float | None = None) -> bool:
+        """阻塞到 key 的写入全部落盘（读文件前调用，保证读到自己刚写的内容）。"""
+        with self._idle:
+            return self._idle.wait_for(lambda: key not in self._queues, timeout)
+
+    def drain(self, timeout: float | None = None) -> bool:
+        """阻塞到所有排队的写入完成；超时返回 False。"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._queues, timeout)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+cpu_executor = CpuExecutor()
+io_executor = IoExecutor()
+
+
+def shutdown_executors(timeout: float = 10.0) -> None:
+    """关机钩子：先等写盘队列清空，再关两个池。阻塞调用，放在 to_thread 里跑。"""
+    if not io_executor.drain(timeout):
+        log.warning(f"⚠️ {io_executor.pending} background writes still pending at shutdown")
+    io_executor.shutdown()
+    cpu_executor.shutdown()
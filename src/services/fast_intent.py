@@ -0,0 +1,301 @@
+"""
+Owner 常见指令的本地快速解析（不调 LLM，单条 < 1 ms）：
+- 创建提醒："明天9点提醒我交报告" / "提醒我后天下午3点半开组会" / "30分钟后提醒我关火"
+           "remind me to call mom tomorrow at 9pm" / "remind me in 20 minutes to stretch"
+- 创建待办："待办：买牛奶" / "todo: buy milk"
+- 删除："删掉 123" / "delete 123"
+- 列出："列出所有提醒" / "list todos"
+只在「完全确定」时返回结果；有任何歧义（例如没写上午/下午且时间已过）都返回 None，交给 AI。
+
+没有使用 dateparser：它单次解析就要数毫秒、import 更慢，而这里只需要覆盖几种固定句式。
+"""
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+_CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+              "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+_WEEKDAYS = {"一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6}
+
+_NUM = r"(?:\d{1,2}|[零〇一二两三四五六七八九十]{1,3})"
+
+# ---------- 中文 ----------
+_CN_RELATIVE = re.compile(rf"(?P<n>{_NUM}|半)个?(?P<unit>分钟|小时|钟头)(?:之?后|以后)")
+_CN_DAY = re.compile(
+    r"(?P<day>今天|今日|今早|今晚|明天|明日|明早|明晚|后天|大后天"
+    r"|(?P<next>下个?)?(?:周|星期|礼拜)(?P<wd>[一二三四五六日天])"
+    r"|(?:(?P<month>\d{1,2})月(?P<mday>\d{1,2})[日号]))"
+)
+_CN_PERIOD = re.compile(r"(?P<period>凌晨|早上|早晨|上午|中午|下午|傍晚|晚上|夜里|今晚|明晚|今早|明早)")
+_CN_CLOCK = re.compile(
+    rf"(?P<hour>{_NUM})\s*(?:点|时|:|：)\s*(?:(?P<half>半)|(?P<quarter>[一三])刻|(?P<minute>\d{{1,2}}|[零〇一二两三四五六七八九十]{{1,3}})分?)?"
+)
+_CN_REMIND = re.compile(r"(?:提醒我|提醒一下我?|叫我|记得提醒我)")
+
+# ---------- English ----------
+_EN_REMIND = re.compile(r"^\s*remind me\s+(?:to\s+)?", re.I)
+_EN_RELATIVE = re.compile(r"\bin\s+(?P<n>\d+)\s*(?P<unit>minutes?|mins?|hours?|hrs?|h)\b", re.I)
+# 相对时间后面还跟着一段时长（"in 1 hour 30 minutes"）：只吃掉第一段会得到错的时间和标题，交给 AI
+_EN_DURATION = re.compile(r"^(?:and\s+)?\d+\s*(?:minutes?|mins?|hours?|hrs?|h)\b", re.I)
+_EN_DAY = re.compile(r"\b(?P<day>today|tonight|tomorrow)\b", re.I)
+_EN_CLOCK = re.compile(r"\b(?:at\s+)?(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ampm>am|pm)\b|\bat\s+(?P<hour24>\d{1,2}):(?P<minute24>\d{2})\b", re.I)
+
+# ---------- CRUD ----------
+_TODO = re.compile(r"^\s*(?:待办|新增待办|添加待办|加个待办|todo)\s*[:：]?\s*(?P<title>.+)$", re.I)
+_DELETE = re.compile(r"^\s*(?:删掉|删除|删了|去掉|delete|remove|del)\s*#?(?P<id>\d{3,})\s*$", re.I)
+_LIST = re.compile(
+    r"^\s*(?:列出|查看|看看|看下|list|show)\s*(?:一下)?\s*(?:所有|全部|all)?\s*(?:的)?\s*"
+    r"(?P<what>待办|todos?|提醒|reminders?|纪念日|annis|anniversaries|倒数日|特殊日子|days)\s*$",
+    re.I,
+)
+_LIST_TARGETS = {
+    "待办": "todo", "todo": "todo", "todos": "todo",
+    "提醒": "reminder", "reminder": "reminder", "reminders": "reminder",
+    "纪念日": "annis", "annis": "annis", "anniversaries": "annis",
+    "倒数日": "days", "特殊日子": "days", "days": "days",
+}
+
+_TRIM = " \t，,。.!！~～：:"
+
+
+def _cn_int(s: str) -> Optional[int]:
+    if s.isdigit():
+        return int(s)
+    if s == "半":
+        return None
+    if "十" in s:
+        tens, _, ones = s.partition("十")
+        t = _CN_DIGITS.get(tens, 1) if tens else 1
+        o = _CN_DIGITS.get(ones, 0) if ones else 0
+        return t * 10 + o
+    value = 0
+    for ch in s:
+        if ch not in _CN_DIGITS:
+            return None
+        value = value * 10 + _CN_DIGITS[ch]
+    return value
+
+
+class FastIntentParser:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def coverage(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def parse(self, text: str, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        返回：
+          {"kind": "create", "action": "reminder"|"todo", "title", "note", "datetime", "date", "tags"}
+          {"kind": "delete", "id": int}
+          {"kind": "list", "target": "todo"|"reminder"|"days"|"annis"}
+        无法确定时返回 None。
+        """
+        now = now or datetime.now()
+        res = (
+            self._parse_crud(text)
+            or self._parse_cn_reminder(text, now)
+            or self._parse_en_reminder(text, now)
+        )
+        if res:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return res
+
+    def fell_through(self) -> None:
+        """本地解析出了结果但执行不了（例如要删的 id 不存在），交回 AI：这次不算命中。"""
+        self.hits -= 1
+        self.misses += 1
+
+    # ---------- CRUD ----------
+
+    @staticmethod
+    def _parse_crud(text: str) -> Optional[Dict[str, Any]]:
+        m = _DELETE.match(text)
+        if m:
+            return {"kind": "delete", "id": int(m.group("id"))}
+        m = _LIST.match(text)
+        if m:
+            return {"kind": "list", "target": _LIST_TARGETS[m.group("what").lower()]}
+        m = _TODO.match(text)
+        if m:
+            title = m.group("title").strip(_TRIM)
+            # 待办里夹了具体时间，多半是想要提醒，交给 AI 判断
+            if title and not (_CN_CLOCK.search(title) or _EN_CLOCK.search(title)):
+                return _create("todo", title, None)
+        return None
+
+    # ---------- 中文提醒 ----------
+
+    def _parse_cn_reminder(self, text: str, now: datetime) -> Optional[Dict[str, Any]]:
+        if not _CN_REMIND.search(text):
+            return None
+        rest = text
+
+        rel = _CN_RELATIVE.search(rest)
+        if rel:
+            n = 0.5 if rel.group("n") == "半" else _cn_int(rel.group("n"))
+            if not n:
+                return None
+            minutes = n if rel.group("unit") == "分钟" else n * 60
+            when = now + timedelta(minutes=minutes)
+            rest = _cut(rest, rel)
+            if _CN_CLOCK.search(rest) or _CN_DAY.search(rest):
+                return None
+            return self._finish_cn(rest, when, now)
+
+        clock = _CN_CLOCK.search(rest)
+        if not clock or len(_CN_CLOCK.findall(rest)) != 1:
+            return None
+        hour = _cn_int(clock.group("hour"))
+        if hour is None or hour > 24:
+            return None
+        if clock.group("half"):
+            minute = 30
+        elif clock.group("quarter"):
+            minute = 15 if clock.group("quarter") == "一" else 45
+        elif clock.group("minute"):
+            minute = _cn_int(clock.group("minute"))
+        else:
+            minute = 0
+        if minute is None or minute > 59:
+            return None
+        rest = _cut(rest, clock)
+
+        day_m = _CN_DAY.search(rest)
+        period_m = _CN_PERIOD.search(rest)
+        period = period_m.group("period") if period_m else ""
+
+        date = now.date()
+        explicit_day = False
+        if day_m:
+            explicit_day = True
+            day = day_m.group("day")
+            if day.startswith("明"):
+                date += timedelta(days=1)
+            elif day == "后天":
+                date += timedelta(days=2)
+            elif day == "大后天":
+                date += timedelta(days=3)
+            elif day_m.group("wd"):
+                target = _WEEKDAYS[day_m.group("wd")]
+                delta = (target - date.weekday()) % 7
+                if day_m.group("next"):
+                    # 下周X：下周一起算的那一周
+                    delta = (7 - date.weekday()) + target
+                date += timedelta(days=delta)
+            elif day_m.group("month"):
+                try:
+                    date = date.replace(month=int(day_m.group("month")), day=int(day_m.group("mday")))
+                except ValueError:
+                    return None
+                if date < now.date():
+                    date = date.replace(year=date.year + 1)
+            rest = _cut(rest, day_m)
+        if period_m and period_m.group("period") in rest:
+            rest = rest.replace(period_m.group("period"), "", 1)
+
+        if period in ("晚上", "夜里", "今晚", "明晚") and hour == 12:
+            # 「今晚12点」是当晚结束时的 0 点（次日 00:00），不是中午
+            hour = 24
+        elif period == "傍晚" and hour == 12:
+            return None
+        elif period in ("下午", "傍晚", "晚上", "夜里", "今晚", "明晚") and hour < 12:
+            hour += 12
+        elif period == "中午" and hour < 6:
+            hour += 12
+        elif not period and hour <= 12:
+            # 没写上午/下午：只在 13 点以后或明确的 0 点才确定；否则 9 点可能是 21 点，交给 AI
+            if not (hour == 0 or (explicit_day and 7 <= hour <= 11)):
+                return None
+        if hour == 24:
+            hour = 0
+            date += timedelta(days=1)
+
+        when = datetime.combine(date, datetime.min.time()).replace(hour=hour, minute=minute)
+        if when <= now:
+            return None
+        return self._finish_cn(rest, when, now)
+
+    @staticmethod
+    def _finish_cn(rest: str, when: datetime, now: datetime) -> Optional[Dict[str, Any]]:
+        title = _CN_REMIND.sub("", rest, count=1)
+        title = re.sub(r"^(?:在|于|到时候?|的时候)", "", title.strip(_TRIM)).strip(_TRIM)
+        if not title or len(title) > 60 or _CN_CLOCK.search(title) or _CN_DAY.search(title):
+            return None
+        return _create("reminder", title, when)
+
+    # ---------- English reminder ----------
+
+    @staticmethod
+    def _parse_en_reminder(text: str, now: datetime) -> Optional[Dict[str, Any]]:
+        head = _EN_REMIND.match(text)
+        if not head:
+            return None
+        rest = text[head.end():]
+
+        rel = _EN_RELATIVE.search(rest)
+        if rel:
+            n = int(rel.group("n"))
+            unit = rel.group("unit").lower()
+            when = now + (timedelta(minutes=n) if unit.startswith("m") else timedelta(hours=n))
+            rest = _cut(rest, rel)
+            if _EN_DURATION.match(rest) or _EN_RELATIVE.search(rest):
+                return None
+        else:
+            clock = _EN_CLOCK.search(rest)
+            if not clock or len(_EN_CLOCK.findall(rest)) != 1:
+                return None
+            if clock.group("hour24"):
+                hour, minute = int(clock.group("hour24")), int(clock.group("minute24"))
+            else:
+                hour = int(clock.group("hour"))
+                minute = int(clock.group("minute") or 0)
+                if not 1 <= hour <= 12:
+                    return None
+                hour = hour % 12 + (12 if clock.group("ampm").lower() == "pm" else 0)
+            if hour > 23 or minute > 59:
+                return None
+            rest = _cut(rest, clock)
+
+            date = now.date()
+            day_m = _EN_DAY.search(rest)
+            if day_m:
+                if day_m.group("day").lower() == "tomorrow":
+                    date += timedelta(days=1)
+                rest = _cut(rest, day_m)
+            when = datetime.combine(date, datetime.min.time()).replace(hour=hour, minute=minute)
+            if when <= now:
+                return None
+
+        title = re.sub(r"^\s*to\s+", "", rest.strip(_TRIM), flags=re.I).strip(_TRIM)
+        title = re.sub(r"\s+(?:at|on)$", "", title, flags=re.I).strip(_TRIM)
+        if (
+            not title or len(title) > 120 or _EN_CLOCK.search(title) or _EN_DAY.search(title)
+            or _EN_DURATION.match(title) or _EN_RELATIVE.search(title)
+        ):
+            return None
+        return _create("reminder", title, when)
+
+
+def _cut(text: str, m: "re.Match") -> str:
+    return (text[: m.start()] + " " + text[m.end():]).strip()
+
+
+def _create(action: str, title: str, when: Optional[datetime]) -> Dict[str, Any]:
+    return {
+        "kind": "create",
+        "action": action,
+        "title": re.sub(r"\s{2,}", " ", title),
+        "note": "",
+        "datetime": when.strftime("%Y-%m-%d %H:%M") if when else None,
+        "date": None,
+        "tags": [],
+    }
+
+
+fast_intent = FastIntentParser()
@@ -0,0 +1,223 @@
+import logging
+import re
+import time
+from typing import Any, Dict, List, Optional, Pattern
+
+from src.config import settings
+from src.services.safety import safety_filter
+from src.services.shared_state import Document, storage
+
+log = logging.getLogger(__name__)
+
+# 群消息进入 AI 之前的相关性关键词（standard 档）
+MEMBERSHIP_TRIGGERS = [
+    "车", "合租", "会员", "Netflix", "奈飞", "Disney", "迪士尼",
+    "YouTube", "HBO", "Prime", "sub", "share", "Apple", "Spotify",
+]
+# 降载 strict 等级下只认这些强关键词（去掉 "车" / "sub" / "share" 这类误报高的词）
+STRICT_TRIGGERS = [
+    "合租", "车位", "上车", "拼车", "Netflix", "奈飞", "Disney", "迪士尼",
+    "YouTube", "HBO", "Spotify",
+]
+
+# 内置档位。group_config.json 的 "profiles" 可以覆盖其中的字段或新增档位，没写的字段取 standard 的值：
+#   triggers        : 进入 AI 的相关性关键词
+#   strict_triggers : 降载 strict 等级下的强关键词
+#   spam_rules      : 第一层规则集名（见 SafetyFilter.RULE_SETS），或直接写一组正则
+#   sample_rate     : 命中关键词的消息里有多大比例进 AI，其余走关键词兜底判定
+#   model_tier      : 模型档位（见 MODEL_TIERS）；none = 完全不调 AI
+#   alert_to        : 会员机会 / 预算告警发给谁（留空 = FORWARD_TO）
+#   priority        : 降载 sample 等级下不抽样（同 PRIORITY_GROUP_IDS）
+BUILTIN_PROFILES: Dict[str, Dict[str, Any]] = {
+    "standard": {
+        "triggers": MEMBERSHIP_TRIGGERS,
+        "strict_triggers": STRICT_TRIGGERS,
+        "spam_rules": "default",
+        "sample_rate": 1.0,
+        "model_tier": "standard",
+        "alert_to": [],
+        "priority": False,
+    },
+    "core": {"priority": True},
+    "cheap": {"triggers": STRICT_TRIGGERS, "sample_rate": 0.3, "model_tier": "cheap"},
+    "keyword": {"triggers": STRICT_TRIGGERS, "model_tier": "none"},
+}
+
+
+class GroupProfile:
+    """一个档位编译后的形态：关键词预先转小写、规则集预先编译，handler 里只做查表和一次 search。"""
+
+    __slots__ = ("name", "triggers", "strict_triggers", "spam_re", "sample_rate", "tier", "model",
+                 "alert_to", "priority")
+
+    def __init__(self, name: str, spec: Dict[str, Any]):
+        self.name = name
+        self.triggers = tuple(t.lower() for t in spec["triggers"])
+        self.strict_triggers = tuple(t.lower() for t in spec["strict_triggers"])
+        rules = spec["spam_rules"]
+        if isinstance(rules, str):
+            if rules not in safety_filter.RULE_SETS:
+                raise ValueError(f"unknown spam_rules '{rules}'")
+            rules = safety_filter.RULE_SETS[rules]
+        self.spam_re: Optional[Pattern] = safety_filter.compile(rules)
+        self.sample_rate = min(1.0, max(0.0, float(spec["sample_rate"])))
+        self.tier = spec["model_tier"]
+        if self.tier == "none":
+            self.model = None
+        elif self.tier in settings.MODEL_TIERS or self.tier == "standard":
+            self.model = settings.MODEL_TIERS.get(self.tier) or settings.DEFAULT_MODEL
+        else:
+            raise ValueError(f"unknown model_tier '{self.tier}'")
+        self.alert_to: List[int] = [int(x) for x in spec["alert_to"] or []]
+        self.priority = bool(spec["priority"])
+
+    @property
+    def keyword_only(self) -> bool:
+        return self.model is None
+
+    def is_spam(self, text: str) -> bool:
+        return self.spam_re is not None and safety_filter.is_obvious_spam(text, self.spam_re)
+
+    def matches(self, text: str, strict: bool = False) -> bool:
+        lowered = text.lower()
+        return any(t in lowered for t in (self.strict_triggers if strict else self.triggers))
+
+    def alert_targets(self) -> List[int]:
+        return self.alert_to or settings.get_forward_targets()
+
+    def describe(self) -> str:
+        return (
+            f"tier={self.tier} sample={self.sample_rate:g} triggers={len(self.triggers)} "
+            f"rules={'off' if self.spam_re is None else 'on'}" + (" priority" if self.priority else "")
+        )
+
+
+class GroupConfigRegistry:
+    """
+    按群的配置档位（DATA_DIR/group_config.json，或共享后端里的同名文档）：
+        {"default": "standard",
+         "profiles": {"cheap": {"sample_rate": 0.1}},
+         "chats": {"-1001234567890": "cheap",
+                   "-1009876543210": {"profile": "core", "alert_to": [123]}}}
+    chats 的值是档位名，或 {"profile": 档位名, 其它字段覆盖}。
+    读入时把每个群编译成 GroupProfile 放进 dict，resolve(chat_id) 是一次查表。
+    热加载：共享后端跟随文档版本号；file 后端每 GROUP_CONFIG_RELOAD_INTERVAL 秒看一次文件 mtime，
+    手改文件后无需重启；/groupcfg 修改会立即生效。
+    """
+
+    NAME = "group_config"
+
+    def __init__(self):
+        self.doc = Document(self.NAME, lambda: {"default": "standard", "profiles": {}, "chats": {}}, self._on_load)
+        self.profiles: Dict[str, GroupProfile] = {}
+        self.specs: Dict[str, Dict[str, Any]] = {}
+        self.by_chat: Dict[int, GroupProfile] = {}
+        self.default: Optional[GroupProfile] = None
+        self._checked = 0.0
+        self._watching = False
+        self._mtime: Optional[int] = None
+
+    def _on_load(self, data: Dict[str, Any]) -> None:
+        try:
+            self._build(data)
+        except Exception as e:
+            # 文件结构整体坏掉（不是 dict 之类）：保留上一份编译好的配置；第一次加载就坏了则只用内置档位
+            log.error(f"❌ Invalid group_config, keeping the last good config: {e}")
+            if self.default is None:
+                self._build({})
+
+    def _build(self, data: Dict[str, Any]) -> None:
+        specs = {name: {**BUILTIN_PROFILES["standard"], **spec} for name, spec in BUILTIN_PROFILES.items()}
+        for name, spec in (data.get("profiles") or {}).items():
+            specs[name] = {**specs.get(name, BUILTIN_PROFILES["standard"]), **spec}
+
+        profiles: Dict[str, GroupProfile] = {}
+        for name, spec in specs.items():
+            try:
+                profiles[name] = GroupProfile(name, spec)
+            except (KeyError, TypeError, ValueError, re.error) as e:
+                log.error(f"❌ Invalid group profile '{name}': {e}")
+        if "standard" not in profiles:
+            # 内置 standard 被改坏了：退回内置值，保证总有一个可用的默认档
+            specs["standard"] = dict(BUILTIN_PROFILES["standard"])
+            profiles["standard"] = GroupProfile("standard", specs["standard"])
+        default = profiles.get(data.get("default") or "standard")
+        if default is None:
+            log.warning(f"⚠️ Unknown default group profile '{data.get('default')}', using standard")
+            default = profiles["standard"]
+
+        by_chat: Dict[int, GroupProfile] = {}
+        for chat_id, entry in (data.get("chats") or {}).items():
+            overrides = {}
+            if isinstance(entry, dict):
+                overrides = {k: v for k, v in entry.items() if k not in ("profile", "title")}
+                entry = entry.get("profile") or default.name
+            if entry not in profiles:
+                log.warning(f"⚠️ Group {chat_id}: unknown profile '{entry}', using {default.name}")
+                entry = default.name
+            try:
+                by_chat[int(chat_id)] = (
+                    GroupProfile(entry, {**specs[entry], **overrides}) if overrides else profiles[entry]
+                )
+            except (KeyError, TypeError, ValueError, re.error) as e:
+                log.error(f"❌ Invalid group config for {chat_id}: {e}")
+
+        self.profiles, self.specs, self.by_chat, self.default = profiles, specs, by_chat, default
+        log.info(f"🎛 Group config loaded: {len(profiles)} profiles, {len(by_chat)} configured groups")
+
+    def load(self) -> None:
+        self.doc.get()
+
+    def _maybe_reload(self) -> None:
+        self.doc.get()
+        if storage.shared:
+            return
+        now = time.monotonic()
+        if now - self._checked < settings.GROUP_CONFIG_RELOAD_INTERVAL:
+            return
+        self._checked = now
+        mtime = storage.mtime(self.NAME)
+        if self._watching and mtime != self._mtime:
+            log.info("🔄 group_config.json changed on disk, reloading")
+            self.doc.reload()
+        self._watching, self._mtime = True, mtime
+
+    def resolve(self, chat_id: int) -> GroupProfile:
+        """群消息热路径：热加载出任何问题都只记日志，继续用手上最后一份可用的配置。"""
+        try:
+            self._maybe_reload()
+        except Exception as e:
+            log.error(f"❌ Group config reload failed: {e}")
+        if self.default is None:
+            self._on_load({})
+        return self.by_chat.get(chat_id, self.default)
+
+    def assign(self, chat_id: int, profile: Optional[str], title: str | None = None) -> bool:
+        """把群切到某个档位（None = 回到默认档）；保留该群已有的字段覆盖。"""
+        self.load()
+        if profile is not None and profile not in self.profiles:
+            return False
+        with self.doc.edit() as data:
+            chats = data.setdefault("chats", {})
+            entry = chats.get(str(chat_id))
+            if profile is None:
+                if isinstance(entry, dict) and set(entry) - {"profile", "title"}:
+                    # 还有 alert_to 之类的字段覆盖：只去掉档位，回到默认档
+                    entry.pop("profile", None)
+                else:
+                    chats.pop(str(chat_id), None)
+            elif isinstance(entry, dict):
+                entry["profile"] = profile
+            else:
+                chats[str(chat_id)] = {"profile": profile, "title": title} if title else profile
+        self._on_load(self.doc.data)
+        # 自己写的文件不算外部修改：下次检查只记下新的 mtime
+        self._watching = False
+        return True
+
+    def reload(self) -> None:
+        self.doc.reload()
+        self._watching = False
+
+
+group_config = GroupConfigRegistry()
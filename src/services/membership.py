@@ -1,27 +1,23 @@
-import json
-import os
 from datetime import datetime, timedelta
 from typing import List, Dict
 
-DB_FILE = "/app/data/memberships.json"
+from src.services.shared_state import Document
 
 class MembershipManager:
 	def __init__(self):
-		self.memberships = self._load_db()
+		# DATA_DIR/memberships.json（或共享后端里的同名文档）；首次访问才读（启动钩子里会调 load() 提前读好）
+		self.doc = Document("memberships", list)
 
-	def _load_db(self) -> List[Dict]:
-		if not os.path.exists(DB_FILE): return []
-		try:
-			with open(DB_FILE, 'r') as f: return json.load(f)
-		except: return []
+	@property
+	def memberships(self) -> List[Dict]:
+		return self.doc.get()
 
-	def save_db(self):
-		os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
-		with open(DB_FILE, 'w') as f: json.dump(self.memberships, f, indent=2)
+	def load(self):
+		self.doc.get()
 
 	def add_membership(self, platform: str, expiry: str):
-		self.memberships.append({"platform": platform, "expiry": expiry, "status": "active"})
-		self.save_db()
+		with self.doc.edit() as memberships:
+			memberships.append({"platform": platform, "expiry": expiry, "status": "active"})
 
 	def get_active(self) -> List[Dict]:
 		return [m for m in self.memberships if m['status'] == 'active']
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.services.perf import BUCKETS_MS, Histogram
+
+log = logging.getLogger(__name__)
+
+# 回调型指标：返回 [(label 值元组, 数值), ...]
+Sample = Tuple[Tuple[str, ...], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+
+    @abstractmethod
+    def expose(self) -> Iterable[str]:
+        """Prometheus 文本格式的样本行（不含 HELP / TYPE）。"""
+
+
+class _ChildMetric(_Metric):
+    """按 label 值分子指标累计的指标（Counter / LatencyHistogram）。"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        # 单个 label 时直接用字符串做 key，热路径上不构造元组
+        self.children: Dict[object, object] = {}
+
+    @abstractmethod
+    def _new_child(self):
+        """新 label 组合第一次出现时创建的子指标。"""
+
+    def labels(self, *values: str):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        key = values[0] if len(values) == 1 else values
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = self._new_child()
+        return child
+
+    def _items(self):
+        for key, child in self.children.items():
+            yield (key,) if isinstance(key, str) else key, child
+
+
+class Counter(_ChildMetric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        if not labelnames:
+            self._solo = self.labels()
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if self.labelnames:
+            raise ValueError(f"{self.name} has labels {self.labelnames}, use .labels(...).inc()")
+        self._solo.value += amount
+
+    def expose(self) -> Iterable[str]:
+        for values, child in self._items():
+            yield f"{self.name}{_labels(self.labelnames, values)} {_fmt(child.value)}"
+
+
+class LatencyHistogram(_ChildMetric):
+    """
+    复用 perf.Histogram 的固定毫秒桶；对外按 Prometheus 约定以秒暴露。
+    用法：hist.labels("analyze_message").observe(ms)
+    """
+
+    kind = "histogram"
+
+    def _new_child(self):
+        return Histogram()
+
+    def expose(self) -> Iterable[str]:
+        yield from expose_histograms(self.name, self.labelnames, self._items())
+
+
+_INF = 'le="+Inf"'
+
+
+def expose_histograms(name: str, labelnames: Tuple[str, ...], items) -> Iterable[str]:
+    for values, hist in items:
+        cumulative = 0
+        for bound, n in zip(BUCKETS_MS, hist.counts):
+            cumulative += n
+            le = 'le="%g"' % (bound / 1000)
+            yield f"{name}_bucket{_labels(labelnames, values, le)} {cumulative}"
+        yield f"{name}_bucket{_labels(labelnames, values, _INF)} {hist.count}"
+        yield f"{name}_sum{_labels(labelnames, values)} {_fmt(hist.total / 1000)}"
+        yield f"{name}_count{_labels(labelnames, values)} {hist.count}"
+
+
+class Callback(_Metric):
+    """抓取时才读取的指标（任务数、缓存命中、熔断状态…），平时零开销。"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...],
+                 fn: Callable[[], Iterable[Sample]], kind: str = "gauge"):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+        self.kind = kind
+
+    def labels(self, *values: str):
+        raise TypeError(f"{self.name} is a callback metric, its samples come from fn() at scrape time")
+
+    def expose(self) -> Iterable[str]:
+        if self.kind == "histogram":
+            # fn 返回 [(label 值元组, perf.Histogram), ...]
+            yield from expose_histograms(self.name, self.labelnames, self.fn())
+            return
+        for values, value in self.fn():
+            yield f"{self.name}{_labels(self.labelnames, values)} {_fmt(value)}"
+
+
+class MetricsRegistry:
+    """
+    进程内指标，/metrics 以 Prometheus 文本格式导出。
+    - 计数都在事件循环线程上累加（调度器线程的事件会先 call_soon_threadsafe 回到 loop），
+      单线程内的 += 就是原子的，不需要锁
+    - 固定 label 的子指标在模块加载时预先绑定（例如 SPAM_SAFETY = spam_verdicts_total.labels("safety")），
+      热路径上只是一次属性加法，不分配对象
+    """
+
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.started = time.time()
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> LatencyHistogram:
+        return self.register(LatencyHistogram(name, help_text, labelnames))
+
+    def callback(self, name: str, help_text: str, labelnames: Tuple[str, ...],
+                 fn: Callable[[], Iterable[Sample]], kind: str = "gauge") -> Callback:
+        return self.register(Callback(name, help_text, labelnames, fn, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.expose())
+            except Exception as e:
+                # 某个回调出错不影响其它指标
+                log.error(f"❌ Metric {metric.name} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# ---------- 指标定义（各模块直接 import 使用） ----------
+
+updates_total = metrics.counter(
+    "atrioly_updates_total", "Updates dispatched to handlers, by update type.", ("type",)
+)
+ai_calls_total = metrics.counter(
+    "atrioly_ai_calls_total", "OpenAI calls per AIAgent method and outcome.", ("method", "outcome")
+)
+ai_latency = metrics.histogram(
+    "atrioly_ai_latency_seconds", "Latency of successful OpenAI calls per AIAgent method.", ("method",)
+)
+spam_verdicts_total = metrics.counter(
+    "atrioly_spam_verdicts_total", "Messages judged spam, by detection layer.", ("layer",)
+)
+strikes_total = metrics.counter("atrioly_strikes_total", "Spam strikes issued.")
+bans_total = metrics.counter("atrioly_bans_total", "Users added to the blacklist.")
+telegram_latency = metrics.histogram(
+    "atrioly_telegram_request_seconds", "Bot API request latency by endpoint.", ("endpoint",)
+)
+telegram_errors_total = metrics.counter(
+    "atrioly_telegram_errors_total", "Failed Bot API requests by endpoint.", ("endpoint",)
+)
+scheduler_lag = metrics.histogram(
+    "atrioly_scheduler_job_lag_seconds", "Delay between a job's scheduled and actual start.", ("job",)
+)
+scheduler_jobs_total = metrics.counter(
+    "atrioly_scheduler_jobs_total", "Scheduler job runs by job and outcome.", ("job", "outcome")
+)
+
+SPAM_SAFETY = spam_verdicts_total.labels("safety")
+SPAM_AI = spam_verdicts_total.labels("ai")
+SPAM_KEYWORD = spam_verdicts_total.labels("keyword")
+
+
+class MetricsServer:
+    """
+    本地 asyncio HTTP server，只响应 GET /metrics 和 GET /healthz，供 Prometheus 抓取。
+    在 PTB 的事件循环里运行（post_init 启动、post_shutdown 关闭）。
+    """
+
+    def __init__(self):
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str, port: int) -> None:
+        self._server = await asyncio.start_server(self._serve, host, port)
+        log.info(f"📈 Metrics endpoint on http://{host}:{port}/metrics")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            request_line = head.split(b"\r\n", 1)[0].decode("latin-1").split()
+            path = request_line[1].split("?", 1)[0] if len(request_line) > 1 else "/"
+            if path == "/metrics":
+                status, ctype, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", metrics.render()
+            elif path == "/healthz":
+                status, ctype, body = "200 OK", "text/plain", "ok\n"
+            else:
+                status, ctype, body = "404 Not Found", "text/plain", "not found\n"
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+metrics_server = MetricsServer()
@@ -0,0 +1,129 @@
+import logging
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+from src.config import settings
+
+log = logging.getLogger(__name__)
+
+
+class OverloadController:
+    """
+    群消息扫描的自适应降载：
+    根据「在途 AI 调用数 / AI 延迟 / AI 错误率 / update 排队时间」算出压力值，
+    映射成降级等级：
+      0 normal   : 正常流程
+      1 strict   : 只有强关键词才进入 AI
+      2 sample   : 非优先群按 OVERLOAD_SAMPLE_RATE 抽样进入 AI
+      3 keyword  : 完全不调 AI，使用 analyze_message 的关键词兜底判定
+    压力升高时立即升级；压力回落后每隔 OVERLOAD_COOLDOWN 秒降一级，避免来回抖动。
+    """
+
+    LEVEL_NAMES = ("normal", "strict", "sample", "keyword")
+    WINDOW = 50          # 错误率统计的滑动窗口（最近 N 次 AI 调用）
+    EWMA_ALPHA = 0.2
+    # keyword 等级下群消息不再调 AI，AI 指标不会再有新样本；一阵积压过后也可能很久没有新 update：
+    # 延迟和排队时间按时间半衰、错误窗口按时间过期，否则压力值冻结在升级那一刻，流量恢复前降不下来
+    DECAY_HALF_LIFE = 30.0     # 秒
+    OUTCOME_MAX_AGE = 120.0    # 秒
+
+    def __init__(self):
+        self.level = 0
+        self.in_flight = 0
+        self.latency_ewma = 0.0
+        self.queue_age_ewma = 0.0
+        self._outcomes: Deque[Tuple[float, bool]] = deque(maxlen=self.WINDOW)
+        self._calm_since = time.monotonic()
+        self._decayed_at = self._calm_since
+
+    # ---------- 观测 ----------
+
+    def ai_started(self) -> None:
+        self.in_flight += 1
+        self._update()
+
+    def ai_finished(self, latency: float, ok: bool) -> None:
+        self.in_flight = max(0, self.in_flight - 1)
+        self._decay(time.monotonic())
+        self.latency_ewma += self.EWMA_ALPHA * (latency - self.latency_ewma)
+        self._outcomes.append((time.monotonic(), ok))
+        self._update()
+
+    def observe_queue_age(self, age: float) -> None:
+        """update 从 Telegram 发出到 handler 开始处理的耗时（秒）。"""
+        self._decay(time.monotonic())
+        self.queue_age_ewma += self.EWMA_ALPHA * (max(0.0, age) - self.queue_age_ewma)
+        self._update()
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return 1 - sum(ok for _, ok in self._outcomes) / len(self._outcomes)
+
+    def _decay(self, now: float) -> None:
+        elapsed = now - self._decayed_at
+        self._decayed_at = now
+        if elapsed > 0:
+            factor = 0.5 ** (elapsed / self.DECAY_HALF_LIFE)
+            self.latency_ewma *= factor
+            self.queue_age_ewma *= factor
+        while self._outcomes and now - self._outcomes[0][0] > self.OUTCOME_MAX_AGE:
+            self._outcomes.popleft()
+
+    # ---------- 等级计算 ----------
+
+    def pressure(self) -> float:
+        """各项指标与阈值之比取最大值，>= 1 表示至少有一项超限。"""
+        return max(
+            self.in_flight / max(1, settings.OVERLOAD_MAX_INFLIGHT),
+            self.latency_ewma / settings.OVERLOAD_MAX_LATENCY,
+            self.queue_age_ewma / settings.OVERLOAD_MAX_QUEUE_AGE,
+            self.error_rate / settings.OVERLOAD_MAX_ERROR_RATE,
+        )
+
+    def _update(self) -> None:
+        now = time.monotonic()
+        self._decay(now)
+        p = self.pressure()
+        target = 0 if p < 1 else 1 if p < 1.5 else 2 if p < 2 else 3
+
+        if target > self.level:
+            log.warning(
+                f"🚦 OVERLOAD ↑ {self.LEVEL_NAMES[self.level]} → {self.LEVEL_NAMES[target]} "
+                f"(pressure={p:.2f})"
+            )
+            self.level = target
+            self._calm_since = now
+        elif target < self.level:
+            if now - self._calm_since >= settings.OVERLOAD_COOLDOWN:
+                self.level -= 1
+                self._calm_since = now
+                log.info(f"🚦 OVERLOAD ↓ recovered to {self.LEVEL_NAMES[self.level]} (pressure={p:.2f})")
+        else:
+            self._calm_since = now
+
+    # ---------- 给 handler 用的决策 ----------
+
+    def should_sample_out(self, chat_id: int, priority: bool = False) -> bool:
+        """sample 等级下，非优先群（PRIORITY_GROUP_IDS / 群档位 priority）按概率丢弃（不进 AI）。"""
+        if self.level < 2 or priority or chat_id in settings.PRIORITY_GROUP_IDS:
+            return False
+        return random.random() >= settings.OVERLOAD_SAMPLE_RATE
+
+    def snapshot(self) -> Dict[str, object]:
+        self._update()
+        return {
+            "level": self.level,
+            "name": self.LEVEL_NAMES[self.level],
+            "pressure": round(self.pressure(), 2),
+            "in_flight": self.in_flight,
+            "latency": round(self.latency_ewma, 2),
+            "queue_age": round(self.queue_age_ewma, 2),
+            "error_rate": round(self.error_rate, 2),
+        }
+
+
+overload = OverloadController()
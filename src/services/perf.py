@@ -0,0 +1,213 @@
+import bisect
+import functools
+import json
+import logging
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src.config import settings
+from src.services.executors import io_executor
+
+log = logging.getLogger(__name__)
+
+# 固定的毫秒桶边界（对数间隔），histogram 只存计数，内存与样本量无关
+BUCKETS_MS: Tuple[float, ...] = (
+    1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000,
+)
+
+
+def _append(path: str, line: str) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+class Histogram:
+    """固定桶的耗时直方图（毫秒），百分位按桶内线性插值估算。"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)   # 最后一个是 +Inf 桶
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = BUCKETS_MS[i - 1] if i > 0 else 0.0
+                hi = BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max
+                return min(lo + (hi - lo) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Trace:
+    """一次 update 的处理过程：按顺序记录各阶段 (stage, 起始偏移 ms, 耗时 ms)。"""
+
+    __slots__ = ("pipeline", "started", "wall", "spans", "meta")
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.started = time.perf_counter()
+        self.wall = time.time()
+        self.spans: List[Tuple[str, float, float]] = []
+        self.meta: Dict[str, Any] = {}
+
+    def to_dict(self, total_ms: float) -> Dict[str, Any]:
+        return {
+            "pipeline": self.pipeline,
+            "at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.wall)),
+            "total_ms": round(total_ms, 1),
+            "spans": [
+                {"stage": s, "offset_ms": round(o, 1), "ms": round(d, 1)} for s, o, d in self.spans
+            ],
+            **self.meta,
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("perf_trace", default=None)
+
+
+class PerfTracker:
+    """
+    消息处理管线的分阶段耗时：
+    - @perf.traced("group") 包住 handler，一次调用 = 一条 trace，总耗时记为 "<pipeline>.total"
+    - with perf.span("ai"): ... 记录当前 trace 里某个阶段的耗时，汇总到 "<pipeline>.<stage>" 直方图
+      （不在 trace 里调用时记到 "misc.<stage>"）
+    - 总耗时超过 PERF_SLOW_MS 的 trace 按 PERF_TRACE_SAMPLE 抽样保留最近若干条，
+      可选追加写到 PERF_TRACE_FILE（jsonl），用来看清慢 update 的时间到底花在哪
+    """
+
+    MAX_SLOW_TRACES = 50
+
+    def __init__(self):
+        self.hists: Dict[str, Histogram] = {}
+        self.slow: Deque[Dict[str, Any]] = deque(maxlen=self.MAX_SLOW_TRACES)
+        self.since = time.time()
+
+    def observe(self, key: str, ms: float) -> None:
+        hist = self.hists.get(key)
+        if hist is None:
+            hist = self.hists[key] = Histogram()
+        hist.observe(ms)
+
+    @contextmanager
+    def span(self, stage: str):
+        trace = _current.get()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            ms = (end - start) * 1000
+            if trace is None:
+                self.observe(f"misc.{stage}", ms)
+            else:
+                trace.spans.append((stage, (start - trace.started) * 1000, ms))
+                self.observe(f"{trace.pipeline}.{stage}", ms)
+
+    def annotate(self, **meta: Any) -> None:
+        """给当前 trace 附加信息（例如 outcome），只在慢 trace 里展示。"""
+        trace = _current.get()
+        if trace is not None:
+            trace.meta.update(meta)
+
+    def traced(self, pipeline: str):
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                trace = Trace(pipeline)
+                token = _current.set(trace)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _current.reset(token)
+                    self._finish(trace)
+            return wrapper
+        return decorator
+
+    def _finish(self, trace: Trace) -> None:
+        total = (time.perf_counter() - trace.started) * 1000
+        self.observe(f"{trace.pipeline}.total", total)
+        if total < settings.PERF_SLOW_MS or random.random() >= settings.PERF_TRACE_SAMPLE:
+            return
+        record = trace.to_dict(total)
+        self.slow.append(record)
+        breakdown = " ".join(f"{s}={d:.0f}ms" for s, _, d in trace.spans)
+        log.warning(f"🐢 SLOW {trace.pipeline} update {total:.0f}ms | {breakdown}")
+        if settings.PERF_TRACE_FILE:
+            # 追加写放到写线程里，不在事件循环上碰磁盘；每条都要落，不合并
+            path, line = settings.PERF_TRACE_FILE, json.dumps(record, ensure_ascii=False) + "\n"
+            io_executor.submit_write(path, lambda: _append(path, line), coalesce=False)
+
+    # ---------- 查看 / 导出 ----------
+
+    def reset(self) -> None:
+        self.hists.clear()
+        self.slow.clear()
+        self.since = time.time()
+
+    def export(self) -> Dict[str, Any]:
+        return {
+            "since": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.since)),
+            "buckets_ms": list(BUCKETS_MS),
+            "stages": {
+                key: {
+                    "count": h.count,
+                    "mean_ms": round(h.mean, 2),
+                    "p50_ms": round(h.percentile(0.5), 2),
+                    "p95_ms": round(h.percentile(0.95), 2),
+                    "p99_ms": round(h.percentile(0.99), 2),
+                    "max_ms": round(h.max, 2),
+                    "bucket_counts": h.counts,
+                }
+                for key, h in sorted(self.hists.items())
+            },
+            "slow_traces": list(self.slow),
+        }
+
+    def render(self) -> str:
+        if not self.hists:
+            return "No timings recorded yet."
+        lines = [f"{'stage (ms)':<22} {'n':>5} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7}"]
+        for key, h in sorted(self.hists.items()):
+            lines.append(
+                f"{key[:22]:<22} {h.count:>5} {h.percentile(0.5):>7.0f} {h.percentile(0.95):>7.0f} "
+                f"{h.percentile(0.99):>7.0f} {h.max:>7.0f}"
+            )
+        return "\n".join(lines)
+
+    def render_slow(self, limit: int = 5) -> str:
+        if not self.slow:
+            return "No slow updates captured."
+        blocks = []
+        for record in list(self.slow)[-limit:][::-1]:
+            spans = "\n".join(
+                f"  @{s['offset_ms']:>6.0f}ms  {s['stage']:<12} {s['ms']:>7.0f}ms" for s in record["spans"]
+            )
+            extra = " ".join(f"{k}={v}" for k, v in record.items() if k not in ("pipeline", "at", "total_ms", "spans"))
+            blocks.append(f"{record['at']} {record['pipeline']} {record['total_ms']:.0f}ms {extra}\n{spans}")
+        return "\n\n".join(blocks)
+
+
+perf = PerfTracker()
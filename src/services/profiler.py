@@ -0,0 +1,226 @@
+import asyncio
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Deque, List, Optional, Tuple
+
+from src.config import settings
+from src.services.metrics import metrics
+from src.services.perf import perf
+
+log = logging.getLogger(__name__)
+
+loop_stalls_total = metrics.counter(
+    "atrioly_loop_stalls_total", "Event-loop stalls longer than LOOP_STALL_THRESHOLD."
+)
+
+# 事件循环空闲时停在 selector 里，这些栈顶不算「忙」
+_IDLE_FUNCS = {"select", "poll"}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame, limit: int = 64) -> Tuple[str, ...]:
+    """从根到叶的调用栈标签。"""
+    labels = []
+    while frame is not None and len(labels) < limit:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+class LoopMonitor:
+    """
+    事件循环卡顿检测：
+    - loop 上的心跳协程每 HEARTBEAT 秒更新一次时间戳，顺带把调度延迟记到 /perf 的 loop.lag
+    - 后台线程发现心跳超过 LOOP_STALL_THRESHOLD 秒没更新，就抓一次 loop 线程的栈打 WARNING，
+      同一次卡顿只报一次，恢复后记录总时长
+    """
+
+    HEARTBEAT = 0.1
+    MAX_STALLS = 100
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_id: Optional[int] = None
+        self.last_beat = time.monotonic()
+        # (结束时间 monotonic, 时长秒, 栈摘要)
+        self.stalls: Deque[Tuple[float, float, str]] = deque(maxlen=self.MAX_STALLS)
+        self._beat_task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self.thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._beat_task = loop.create_task(self._heartbeat())
+        if settings.LOOP_STALL_THRESHOLD > 0:
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._beat_task:
+            self._beat_task.cancel()
+            self._beat_task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.HEARTBEAT
+            await asyncio.sleep(self.HEARTBEAT)
+            now = time.monotonic()
+            self.last_beat = now
+            perf.observe("loop.lag", max(0.0, now - expected) * 1000)
+
+    def _watch(self) -> None:
+        threshold = settings.LOOP_STALL_THRESHOLD
+        stalled_since: Optional[float] = None
+        stack = ""
+        while not self._stop.wait(threshold / 4):
+            now = time.monotonic()
+            behind = now - self.last_beat
+            if behind > threshold + self.HEARTBEAT:
+                if stalled_since is None:
+                    stalled_since = self.last_beat
+                    frame = sys._current_frames().get(self.thread_id)
+                    stack = "".join(traceback.format_stack(frame)) if frame else "(no frame)"
+                    log.warning(f"🧊 Event loop blocked for {behind:.2f}s, stack:\n{stack}")
+            elif stalled_since is not None:
+                duration = self.last_beat - stalled_since
+                log.warning(f"🧊 Event loop stall ended after {duration:.2f}s")
+                self.stalls.append((now, duration, _culprit(stack)))
+                if self.loop and self.loop.is_running():
+                    self.loop.call_soon_threadsafe(loop_stalls_total.inc)
+                stalled_since = None
+
+
+def _culprit(stack: str) -> str:
+    """卡住时最内层的 'File ..., line N, in f' 行；没有栈（"(no frame)"）时给出原文，不能让看门狗线程抛异常退出。"""
+    lines = [line.strip() for line in stack.splitlines() if line.strip()]
+    frames = [line for line in lines if line.startswith("File ")]
+    if frames:
+        return frames[-1]
+    return lines[-1] if lines else ""
+
+
+class ProfileReport:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.samples = 0
+        self.idle = 0
+        self.stacks: Counter = Counter()
+        self.coroutines: Counter = Counter()
+        self.cpu_text = ""
+        self.stalls: List[Tuple[float, float, str]] = []
+
+    def folded(self) -> str:
+        """flamegraph.pl / speedscope 可直接读取的 collapsed stack 格式。"""
+        return "\n".join(f"{';'.join(stack)} {n}" for stack, n in self.stacks.most_common()) + "\n"
+
+    def summary(self, top: int = 12) -> str:
+        busy = self.samples - self.idle
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, n in self.stacks.items():
+            if stack:
+                self_counts[stack[-1]] += n
+            for label in set(stack):
+                total_counts[label] += n
+
+        def pct(n: int) -> str:
+            return f"{n / self.samples:6.1%}" if self.samples else "   n/a"
+
+        lines = [
+            f"{self.seconds:.0f}s · {self.samples} samples · loop busy {pct(busy).strip()}",
+        ]
+        if self.stalls:
+            worst = max(d for _, d, _ in self.stalls)
+            lines.append(f"stalls: {len(self.stalls)} (worst {worst * 1000:.0f}ms)")
+            for _, duration, where in self.stalls[-3:]:
+                lines.append(f"  {duration * 1000:.0f}ms @ {where[:80]}")
+        lines.append("\n-- top functions (wall, self) --")
+        lines += [f"{pct(n)} {label[:90]}" for label, n in self_counts.most_common(top)]
+        lines.append("\n-- top functions (wall, incl.) --")
+        lines += [f"{pct(n)} {label[:90]}" for label, n in total_counts.most_common(top)]
+        if self.coroutines:
+            lines.append("\n-- top coroutines (wall) --")
+            lines += [f"{pct(n)} {name[:90]}" for name, n in self.coroutines.most_common(top)]
+        if self.cpu_text:
+            lines.append("\n-- top functions (CPU: self / cumulative / calls) --")
+            lines.append(self.cpu_text)
+        return "\n".join(lines)
+
+
+class Profiler:
+    """
+    /profile 的实现：在 loop 线程上开 cProfile（thread_time 计时 = CPU 时间），
+    同时起一个采样线程按 PROFILE_SAMPLE_INTERVAL 抓 loop 线程的栈和当前运行的 Task（墙钟时间）。
+    同一时间只允许一个 profile。
+    """
+
+    def __init__(self):
+        self.running = False
+
+    async def run(self, seconds: float) -> ProfileReport:
+        if self.running:
+            raise RuntimeError("a profile is already running")
+        self.running = True
+        loop = asyncio.get_running_loop()
+        report = ProfileReport(seconds)
+        started = time.monotonic()
+        done = threading.Event()
+        sampler = threading.Thread(
+            target=self._sample, args=(report, threading.get_ident(), loop, done), name="profiler", daemon=True
+        )
+        cpu = cProfile.Profile(time.thread_time)
+        try:
+            sampler.start()
+            cpu.enable()
+            await asyncio.sleep(seconds)
+        finally:
+            cpu.disable()
+            done.set()
+            self.running = False
+        await asyncio.to_thread(sampler.join)
+
+        cpu.create_stats()
+        # (file, line, func) -> (原始调用数, 调用数, 自身耗时, 累计耗时, callers)
+        heaviest = sorted(cpu.stats.items(), key=lambda kv: kv[1][2], reverse=True)[:12]
+        report.cpu_text = "\n".join(
+            f"{tt * 1000:8.1f}ms {ct * 1000:8.1f}ms {nc:>7} {func} ({os.path.basename(file)}:{line})"
+            for (file, line, func), (_, nc, tt, ct, _) in heaviest
+        )
+        report.stalls = [s for s in loop_monitor.stalls if s[0] >= started]
+        return report
+
+    @staticmethod
+    def _sample(report: ProfileReport, thread_id: int, loop, done: threading.Event) -> None:
+        interval = settings.PROFILE_SAMPLE_INTERVAL
+        while not done.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            report.samples += 1
+            if frame.f_code.co_name in _IDLE_FUNCS:
+                report.idle += 1
+                continue
+            stack = _stack(frame)
+            report.stacks[stack] += 1
+            task = asyncio.current_task(loop)
+            if task is not None:
+                coro = task.get_coro()
+                report.coroutines[getattr(coro, "__qualname__", task.get_name())] += 1
+
+
+loop_monitor = LoopMonitor()
+profiler = Profiler()
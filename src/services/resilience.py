@@ -0,0 +1,90 @@
+import logging
+import time
+from collections import deque
+from typing import Deque, Optional
+
+log = logging.getLogger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于 open 状态时直接抛出，调用方走原有兜底逻辑。"""
+
+
+class CircuitBreaker:
+    """
+    上游（OpenAI）健康状态的熔断器：
+      closed    : 正常放行；连续失败达到 failure_threshold 次 → open
+      open      : 直接拒绝（fail fast），cooldown 秒后进入 half_open
+      half_open : 只放行一个探测请求；成功 → closed，失败 → 重新 open（冷却时间翻倍，封顶 max_cooldown）
+    """
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float, max_cooldown: float = 300.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = "half_open"
+            log.info(f"🔌 Circuit '{self.name}' half-open, probing upstream...")
+        # half_open：同一时间只放一个探测请求
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            log.info(f"🔌 Circuit '{self.name}' closed, upstream recovered.")
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open":
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open()
+        elif self.state == "closed" and self.failures >= self.failure_threshold:
+            self._open()
+
+    def release(self) -> None:
+        """探测请求被取消（非上游故障）时归还探测名额。"""
+        self._probing = False
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self._probing = False
+        log.warning(
+            f"🔌 Circuit '{self.name}' OPEN after {self.failures} failures, "
+            f"failing fast for {self.cooldown:.0f}s."
+        )
+
+
+class LatencyTracker:
+    """最近 N 次成功调用的耗时，用于计算对冲（hedge）触发阈值 p95。"""
+
+    def __init__(self, size: int = 200):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[idx]
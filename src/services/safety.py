@@ -1,4 +1,5 @@
 import re
+from typing import Iterable, Optional, Pattern
 
 class SafetyFilter:
 	SPAM_PATTERNS = [
@@ -6,12 +7,30 @@ class SafetyFilter:
 		r"investment", r"casino|gambling", r"click here", r"hot.*girl"
 	]
 
+	# 群配置（group_config）里按名字选用的规则集
+	RULE_SETS = {
+		"default": SPAM_PATTERNS,
+		"strict": SPAM_PATTERNS + [
+			r"airdrop|空投", r"返利|刷单|兼职日结", r"(vx|wechat|微信)\s*[:：]?\s*[\w-]{5,}"
+		],
+		"off": [],
+	}
+
+	@staticmethod
+	def compile(patterns: Iterable[str]) -> Optional[Pattern]:
+		"""一组规则合成一个正则，一次 search 判完（没有规则时返回 None）。"""
+		patterns = list(patterns)
+		if not patterns:
+			return None
+		return re.compile("|".join(f"(?:{p})" for p in patterns))
+
 	@staticmethod
-	def is_obvious_spam(text: str) -> bool:
-		text = text.lower()
-		for pattern in SafetyFilter.SPAM_PATTERNS:
-			if re.search(pattern, text):
-				return True
-		return False
+	def is_obvious_spam(text: str, rules: Optional[Pattern] = None) -> bool:
+		"""rules 为 group_config 里编译好的规则集；不传时用默认规则。"""
+		if rules is None:
+			rules = _DEFAULT_RULES
+		return rules.search(text.lower()) is not None
+
+_DEFAULT_RULES = SafetyFilter.compile(SafetyFilter.SPAM_PATTERNS)
 
 safety_filter = SafetyFilter()
@@ -2,22 +2,31 @@ import logging
 import datetime
 import asyncio
 
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
 from apscheduler.jobstores.base import JobLookupError
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+)
+from telegram.helpers import escape_markdown
 
 from src.config import settings
 from src.utils.calendar_utils import get_today_holidays
+from src.services.task_index import format_tags
+from src.services.metrics import scheduler_jobs_total, scheduler_lag
 
 log = logging.getLogger(__name__)
 
 
 class SchedulerService:
     def __init__(self):
-        # 独立后台调度器，不占用 PTB 自己的事件循环
-        self.scheduler = BackgroundScheduler(timezone="Asia/Shanghai")
+        # 独立后台调度器，不占用 PTB 自己的事件循环；start() 时才创建（import 调度器 / cron 要上百毫秒）
+        self.scheduler = None
         self.context_app = None
         self.started = False
+        # PTB 主事件循环（post_init 时绑定）；job 里的协程优先丢回这个 loop 执行
+        self.loop = None
 
     def start(self, app):
         """
@@ -28,6 +37,11 @@ class SchedulerService:
             log.info("⏰ Scheduler already started, skip.")
             return
 
+        from apscheduler.schedulers.background import BackgroundScheduler
+        from apscheduler.triggers.cron import CronTrigger
+
+        self.scheduler = BackgroundScheduler(timezone="Asia/Shanghai")
+
         # 每天 7:00 统一做节日 & 特殊日子祝福
         self.scheduler.add_job(
             self._daily_greeting_job,
@@ -36,12 +50,34 @@ class SchedulerService:
             replace_existing=True,
         )
 
+        self.scheduler.add_listener(
+            self._on_job_event,
+            EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED,
+        )
         self.scheduler.start()
         self.started = True
         log.info("⏰ Scheduler started (Asia/Shanghai).")
 
+    def stop(self):
+        """失去调度 leader 身份 / 退出时停掉调度器（不等正在跑的 job）。"""
+        if not self.started:
+            return
+        self.started = False
+        self.scheduler.shutdown(wait=False)
+        log.info("⏰ Scheduler stopped.")
+
     # ---------- Reminder 管理 ----------
 
+    def reminder_jobs(self) -> dict:
+        """已挂载的 reminder：job id -> entry 里的 datetime 字符串。"""
+        if not self.started:
+            return {}
+        return {
+            job.id: job.args[0].get("datetime")
+            for job in self.scheduler.get_jobs()
+            if job.id != "daily_greeting" and job.args
+        }
+
     def schedule_reminder(self, entry: dict):
         """
         为单个 reminder 建立/更新调度任务。
@@ -51,7 +87,7 @@ class SchedulerService:
           - datetime: 事件发生时间（ISO 字符串，例 '2025-12-11T18:30:00'）
         实际提醒时间 = 事件时间 - 15 分钟
         """
-        if not self.context_app:
+        if not self.started:
             # 还没完成 start()，先不挂
             return
 
@@ -60,6 +96,9 @@ class SchedulerService:
         except Exception as e:
             log.error(f"schedule_reminder: invalid datetime in entry {entry}: {e}")
             return
+        if event_dt.tzinfo is None:
+            # 任务里存的是不带时区的本地时间（Asia/Shanghai）
+            event_dt = event_dt.replace(tzinfo=self.scheduler.timezone)
 
         # 提前 15 分钟提醒
         run_dt = event_dt - datetime.timedelta(minutes=15)
@@ -95,6 +134,8 @@ class SchedulerService:
         """
         删除指定 reminder 对应的调度任务。
         """
+        if not self.started:
+            return
         job_id = str(entry_id)
         try:
             self.scheduler.remove_job(job_id)
@@ -104,9 +145,51 @@ class SchedulerService:
         except Exception as e:
             log.error(f"Failed to cancel reminder {job_id}: {e}")
 
+    # ---------- 指标：job 延迟 / 结果 ----------
+
+    _EVENT_OUTCOMES = {
+        EVENT_JOB_EXECUTED: "executed",
+        EVENT_JOB_ERROR: "error",
+        EVENT_JOB_MISSED: "missed",
+    }
+
+    def _on_job_event(self, event):
+        """APScheduler 线程里回调；统计挪回主 loop 上做，计数器只在一个线程里累加。"""
+        # reminder 的 job id 是任务 id，统一归到一个 label 下
+        job = "reminder" if str(event.job_id).isdigit() else str(event.job_id)
+        if event.code == EVENT_JOB_SUBMITTED:
+            now = datetime.datetime.now(tz=self.scheduler.timezone)
+            lags = [(now - t).total_seconds() * 1000 for t in event.scheduled_run_times]
+
+            def record():
+                for lag in lags:
+                    scheduler_lag.labels(job).observe(max(lag, 0.0))
+        else:
+            outcome = self._EVENT_OUTCOMES.get(event.code, "other")
+
+            def record():
+                scheduler_jobs_total.labels(job, outcome).inc()
+
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(record)
+        else:
+            record()
+
+    @property
+    def job_count(self) -> int:
+        return len(self.scheduler.get_jobs()) if self.started else 0
+
     # ---------- 内部工具：在独立事件循环中跑协程 ----------
 
     def _run_coro(self, coro):
+        # bot 与 AsyncOpenAI 的 httpx 连接池都绑定在主 loop 上，跨 loop 复用会出错
+        if self.loop and self.loop.is_running():
+            future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+            try:
+                future.result()
+            except Exception as e:
+                log.error(f"Scheduled job failed: {e}")
+            return
         try:
             asyncio.run(coro)
         except RuntimeError:
@@ -128,17 +211,13 @@ class SchedulerService:
         async def _inner():
             text = (
                 f"🔔 **REMINDER**\n\n"
-                f"📌 **{entry.get('title', '(no title)')}**\n"
-                f"🕒 Event Time: {entry.get('datetime')}\n"
-                f"📝 {entry.get('note', '')}\n"
+                f"📌 **{escape_markdown(entry.get('title') or '(no title)')}**\n"
+                f"🕒 Event Time: {escape_markdown(str(entry.get('datetime')))}\n"
+                f"📝 {escape_markdown(entry.get('note') or '')}\n"
             )
-            tags = entry.get("tags")
+            tags = escape_markdown(format_tags(entry.get("tags")))
             if tags:
-                if isinstance(tags, (list, tuple)):
-                    tags_str = ", ".join(str(t) for t in tags)
-                else:
-                    tags_str = str(tags)
-                text += f"🏷 {tags_str}"
+                text += f"🏷 {tags}"
 
             for owner_id in settings.OWNER_IDS:
                 await self.context_app.bot.send_message(
@@ -208,7 +287,7 @@ class SchedulerService:
                 greeting = await agent.generate_greeting(name_for_ai)
                 text = (
                     f"🌅 **{kind} Reminder**\n\n"
-                    f"📌 {title}\n"
+                    f"📌 {escape_markdown(title)}\n"
                     f"📅 {entry.get('date') or entry.get('datetime') or today_str}\n\n"
                     f"{greeting}"
                 )
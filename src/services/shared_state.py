@@ -0,0 +1,444 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from src.config import settings
+from src.services.executors import io_executor
+
+log = logging.getLogger(__name__)
+
+INSTANCE_ID = settings.INSTANCE_ID or f"{socket.gethostname()}:{os.getpid()}"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (name TEXT PRIMARY KEY, version INTEGER NOT NULL, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS kv (ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL,
+                               PRIMARY KEY (ns, key));
+CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires REAL NOT NULL);
+"""
+
+
+class StateWriteError(RuntimeError):
+    """修改没能写进存储（SQLite 写锁等待超时 / 写入出错）：这次修改没有生效，本地缓存已丢弃，调用方可以提示稍后重试。"""
+
+
+def _dumps(data: Any, compact: bool) -> str:
+    if compact:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+class FileBackend:
+    """
+    默认后端：一个文档一个 DATA_DIR/<name>.json，格式和原来各 service 自己读写的文件一样。
+    只适合单进程：不检查外部修改（版本恒为 0），租约总能拿到，kv 只存在内存里。
+    写入在调用方线程里序列化成快照，落盘（tmp + replace）交给 io_executor 的写线程，按文件排队、合并连续保存；
+    读同一个文件前会先等它排队中的写入完成。
+    """
+
+    shared = False
+
+    def __init__(self, root: str):
+        self.root = root
+        self._kv: Dict[Tuple[str, str], Tuple[Any, float]] = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, f"{name}.json")
+
+    # ---------- 文档 ----------
+
+    def read(self, name: str) -> Tuple[Any, int]:
+        path = self._path(name)
+        io_executor.wait(path)
+        if not os.path.exists(path):
+            return None, 0
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f), 0
+
+    def version(self, name: str) -> int:
+        return 0
+
+    def mtime(self, name: str) -> Optional[int]:
+        """文件的修改时间（纳秒），不存在时为 None；用来发现手工改过的配置文件。"""
+        path = self._path(name)
+        io_executor.wait(path)
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def locked(self, name: str) -> Iterator[int]:
+        yield 0
+
+    def write(self, name: str, data: Any, compact: bool = False) -> int:
+        path = self._path(name)
+        text = _dumps(data, compact)
+        io_executor.submit_write(path, lambda: self._replace(path, text))
+        return 0
+
+    @staticmethod
+    def _replace(path: str, text: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def delete(self, name: str) -> None:
+        path = self._path(name)
+        io_executor.submit_write(path, lambda: self._remove(path))
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # ---------- 带过期时间的 kv ----------
+
+    def kv_put(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        self._kv[(ns, key)] = (value, time.time() + ttl)
+
+    def kv_get(self, ns: str, key: str) -> Any:
+        item = self._kv.get((ns, key))
+        if item is None or item[1] < time.time():
+            return None
+        return item[0]
+
+    # ---------- 租约 ----------
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        return True
+
+    def release_lease(self, name: str, holder: str) -> None:
+        pass
+
+    def lease_holder(self, name: str) -> Optional[str]:
+        return INSTANCE_ID
+
+
+class SqliteBackend:
+    """
+    多副本共享后端：同一个 SQLite 文件（WAL 模式，副本挂同一个卷）。
+    - docs   : 整份 JSON 文档 + 单调递增的版本号，副本按版本号判断要不要重读
+    - kv     : 小条目 + 过期时间（例如私聊转发的 reply bridge）
+    - leases : leader 租约
+    文档第一次被读到时，如果库里没有，会把 DATA_DIR 下原来的 JSON 文件导入进来。
+    """
+
+    shared = True
+
+    def __init__(self, path: str, legacy_root: str):
+        self.path = path
+        self.legacy = FileBackend(legacy_root)
+        self._conn: Optional[sqlite3.Connection] = None
+        # 调度器线程 / to_thread 里也可能访问，连接上的操作串行化
+        self._lock = threading.RLock()
+        self._kv_puts = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # 写锁等待上限要短：事务在事件循环线程里同步执行，等锁就是卡住整个 bot
+            conn = sqlite3.connect(
+                self.path, timeout=settings.STATE_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    # ---------- 文档 ----------
+
+    def read(self, name: str) -> Tuple[Any, int]:
+        with self._lock:
+            row = self.conn.execute("SELECT data, version FROM docs WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                data, _ = self.legacy.read(name)
+                if data is None:
+                    return None, 0
+                log.info(f"📥 Imported {name}.json into shared state")
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO docs (name, version, data) VALUES (?, 1, ?)", (name, _dumps(data, True))
+                )
+                row = self.conn.execute("SELECT data, version FROM docs WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]), row[1]
+
+    def version(self, name: str) -> int:
+        with self._lock:
+            row = self.conn.execute("SELECT version FROM docs WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    @contextmanager
+    def locked(self, name: str) -> Iterator[int]:
+        """写事务：拿到库的写锁后给出当前版本，期间的 read / write 对其它副本是原子的。"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.version(name)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def write(self, name: str, data: Any, compact: bool = False) -> int:
+        with self._lock:
+            row = self.conn.execute(
+                "INSERT INTO docs (name, version, data) VALUES (?, 1, ?) "
+                "ON CONFLICT(name) DO UPDATE SET version = version + 1, data = excluded.data "
+                "RETURNING version",
+                (name, _dumps(data, True)),
+            ).fetchone()
+        return row[0]
+
+    def delete(self, name: str) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM docs WHERE name = ?", (name,))
+        self.legacy.delete(name)
+
+    # ---------- 带过期时间的 kv ----------
+
+    def kv_put(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO kv (ns, key, value, expires) VALUES (?, ?, ?, ?)",
+                (ns, key, json.dumps(value), now + ttl),
+            )
+            self._kv_puts += 1
+            if self._kv_puts % 1000 == 0:
+                self.conn.execute("DELETE FROM kv WHERE expires < ?", (now,))
+
+    def kv_get(self, ns: str, key: str) -> Any:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM kv WHERE ns = ? AND key = ? AND expires >= ?", (ns, key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # ---------- 租约 ----------
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """续约（本来就是自己的）或抢占（已过期 / 已释放）；返回此刻是否持有。"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO leases (name, holder, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires "
+                "WHERE leases.holder = excluded.holder OR leases.expires < ?",
+                (name, holder, now + ttl, now),
+            )
+        return self.lease_holder(name) == holder
+
+    def release_lease(self, name: str, holder: str) -> None:
+        with self._lock:
+            self.conn.execute("UPDATE leases SET expires = 0 WHERE name = ? AND holder = ?", (name, holder))
+
+    def lease_holder(self, name: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT holder FROM leases WHERE name = ? AND expires >= ?", (name, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+
+def _make_backend():
+    if settings.STATE_BACKEND == "sqlite":
+        path = settings.STATE_DB_PATH or os.path.join(settings.DATA_DIR, "state.db")
+        return SqliteBackend(path, settings.DATA_DIR)
+    if settings.STATE_BACKEND != "file":
+        log.warning(f"⚠️ Unknown STATE_BACKEND={settings.STATE_BACKEND!r}, using file")
+    return FileBackend(settings.DATA_DIR)
+
+
+storage = _make_backend()
+
+
+class Document:
+    """
+    一份 JSON 文档（黑名单、任务库…）的本地缓存：
+    - get()  : 首次访问才读；共享后端下每 STATE_SYNC_INTERVAL 秒比一次版本号，其它副本写过就重读
+    - edit() : 读-改-写事务。共享后端下先拿库的写锁、必要时重读最新版本再交给调用方修改，
+               退出时整份写回；可嵌套，只有最外层提交。拿不到写锁 / 写回失败时抛 StateWriteError
+    on_load 在每次（重新）读入后调用，用来重建索引之类的派生数据。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        default: Callable[[], Any],
+        on_load: Optional[Callable[[Any], None]] = None,
+        compact: bool = False,
+    ):
+        self.name = name
+        self.default = default
+        self.on_load = on_load
+        self.compact = compact
+        self.data: Any = None
+        self.version = -1
+        self._checked = 0.0
+        self._depth = 0
+
+    def _load(self) -> None:
+        try:
+            data, self.version = storage.read(self.name)
+        except Exception as e:
+            log.error(f"❌ Failed to load {self.name}: {e}")
+            data, self.version = None, 0
+        self.data = self.default() if data is None else data
+        self._checked = time.monotonic()
+        if self.on_load:
+            self.on_load(self.data)
+
+    def get(self) -> Any:
+        if self.data is None:
+            self._load()
+        elif storage.shared and not self._depth:
+            now = time.monotonic()
+            if now - self._checked >= settings.STATE_SYNC_INTERVAL:
+                self._checked = now
+                try:
+                    if storage.version(self.name) != self.version:
+                        self._load()
+                except Exception as e:
+                    log.error(f"❌ Failed to check {self.name} version: {e}")
+        return self.data
+
+    @contextmanager
+    def edit(self) -> Iterator[Any]:
+        if self._depth:
+            self._depth += 1
+            try:
+                yield self.data
+            finally:
+                self._depth -= 1
+            return
+
+        try:
+            with storage.locked(self.name) as version:
+                if self.data is None or version != self.version:
+                    self._load()
+                self._depth = 1
+                try:
+                    yield self.data
+                except BaseException:
+                    # 本地可能改了一半：丢掉缓存，下次 get() 从存储重新读（file 后端不比版本号，只能靠 data = None）
+                    self.data = None
+                    self.version = -1
+                    raise
+                finally:
+                    self._depth = 0
+                try:
+                    self.version = storage.write(self.name, self.data, self.compact)
+                except Exception as e:
+                    self.data = None
+                    self.version = -1
+                    raise StateWriteError(f"failed to save {self.name}: {e}") from e
+        except sqlite3.OperationalError as e:
+            # BEGIN IMMEDIATE 等写锁超时（STATE_BUSY_TIMEOUT）/ 提交失败
+            raise StateWriteError(f"{self.name} is busy: {e}") from e
+
+    def reload(self) -> None:
+        """丢掉本地缓存、重新读入（文件被外部改过时用）；edit() 进行中不动。"""
+        if not self._depth:
+            self._load()
+
+    def delete(self) -> None:
+        storage.delete(self.name)
+        self.data = None
+        self.version = -1
+
+
+class LeaderElection:
+    """
+    基于租约的 leader 选举：每 LEADER_RENEW_INTERVAL 秒续约 / 抢占一次（租约 LEADER_LEASE_TTL 秒）。
+    - 拿到租约 -> on_elected()；之后每次续约成功 -> on_renewed()
+    - 续约失败，或连续 TTL 秒没能确认（数据库出错）-> on_demoted()
+    - 正常退出时释放租约，备机下一次抢占就能接管；崩溃则等租约过期
+    file 后端（单实例）总是 leader。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.is_leader = False
+        self._confirmed = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._on_elected: Callable[[], None] = lambda: None
+        self._on_demoted: Callable[[], None] = lambda: None
+        self._on_renewed: Callable[[], None] = lambda: None
+
+    async def start(
+        self,
+        on_elected: Callable[[], None],
+        on_demoted: Callable[[], None],
+        on_renewed: Callable[[], None] = lambda: None,
+    ) -> None:
+        self._on_elected, self._on_demoted, self._on_renewed = on_elected, on_demoted, on_renewed
+        # 第一次在启动钩子里直接跑：单实例时和原来一样，启动完成时调度器已经在跑
+        self._tick()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        try:
+            self._on_demoted()
+        except Exception as e:
+            log.error(f"❌ Leader {self.name} hook failed: {e}")
+        try:
+            storage.release_lease(self.name, INSTANCE_ID)
+            log.info(f"🔓 {INSTANCE_ID} released lease {self.name}")
+        except Exception as e:
+            log.error(f"❌ Failed to release lease {self.name}: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.LEADER_RENEW_INTERVAL)
+            self._tick()
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        try:
+            held = storage.acquire_lease(self.name, INSTANCE_ID, settings.LEADER_LEASE_TTL)
+        except Exception as e:
+            log.error(f"❌ Lease {self.name} check failed: {e}")
+            # 租约在 TTL 内仍然有效；超过 TTL 还确认不了就必须让位
+            held = self.is_leader and now - self._confirmed < settings.LEADER_LEASE_TTL
+        else:
+            if held:
+                self._confirmed = now
+        if held != self.is_leader:
+            self._set_leader(held)
+        elif held:
+            try:
+                self._on_renewed()
+            except Exception as e:
+                log.error(f"❌ Leader {self.name} renew hook failed: {e}")
+
+    def _set_leader(self, leader: bool) -> None:
+        self.is_leader = leader
+        if leader:
+            log.info(f"👑 {INSTANCE_ID} is now leader for {self.name}")
+        else:
+            log.warning(f"👋 {INSTANCE_ID} is no longer leader for {self.name}")
+        try:
+            (self._on_elected if leader else self._on_demoted)()
+        except Exception as e:
+            log.error(f"❌ Leader {self.name} hook failed: {e}")
+
+
+scheduler_leader = LeaderElection("scheduler")
@@ -0,0 +1,187 @@
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Set, Tuple
+
+# (category, entry_id)
+DocKey = Tuple[str, int]
+
+_CJK = r"\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[a-z0-9_]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+_TAG_SPLIT_RE = re.compile(r"[,，、;；\n]+")
+_TAG_SPACE_RE = re.compile(r"[\s\-]+")
+
+
+# ---------- 标签 ----------
+
+def clean_tag(raw) -> str:
+    """单个标签的展示形式：NFKC 归一（全角→半角）、去掉 '#'、空白 / 连字符 → '_'。"""
+    tag = unicodedata.normalize("NFKC", str(raw)).strip().lstrip("#").strip()
+    return _TAG_SPACE_RE.sub("_", tag).strip("_")
+
+
+def canonical_tag(raw) -> str:
+    """标签的规范键（索引 / 去重用）：在 clean_tag 基础上 casefold，"#CET 6" == "cet_6"。"""
+    return clean_tag(raw).casefold()
+
+
+def normalize_tags(raw) -> List[str]:
+    """
+    把 AI / 用户给的各种 tags（列表、逗号分隔字符串、带不带 '#'）统一成展示形式的列表，
+    按规范键去重并保留首次出现的写法。
+    """
+    if not raw:
+        return []
+    if isinstance(raw, str):
+        raw = _TAG_SPLIT_RE.split(raw)
+    tags, seen = [], set()
+    for item in raw:
+        tag = clean_tag(item)
+        key = tag.casefold()
+        if tag and key not in seen:
+            seen.add(key)
+            tags.append(tag)
+    return tags
+
+
+def format_tags(raw, empty: str = "") -> str:
+    """渲染为 '#tag1 #tag2'；没有标签时返回 empty。"""
+    tags = normalize_tags(raw)
+    return " ".join(f"#{t}" for t in tags) if tags else empty
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中英混合分词（不依赖 jieba 之类的词典）：
+    - 中文连续片段 → 单字 + 相邻二元组（bigram），"交报告" → 交 报 告 交报 报告
+    - 英文 / 数字 → 小写整词；长度 >= 4 的词额外产出 "~" 前缀的三元组，用于容错匹配（typo / 词形变化）
+    """
+    tokens: List[str] = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if _CJK_RE.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+            if len(run) >= 4:
+                tokens.extend("~" + run[i:i + 3] for i in range(len(run) - 2))
+    return tokens
+
+
+class TaskIndex:
+    """
+    任务的增量 BM25 倒排索引（title 权重 x2，note / tags 各 x1），外加按规范标签的精确倒排表。
+    由 TaskManager 在增删改时维护，查询成本只和命中的 posting 有关，与任务总数基本无关。
+    """
+
+    K1 = 1.2
+    B = 0.75
+    TITLE_WEIGHT = 2
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[DocKey, int]] = {}
+        self.docs: Dict[DocKey, dict] = {}
+        self.doc_terms: Dict[DocKey, Counter] = {}
+        self.doc_len: Dict[DocKey, int] = {}
+        self.tag_postings: Dict[str, Set[DocKey]] = {}
+        self.doc_tags: Dict[DocKey, Set[str]] = {}
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    # ---------- 维护 ----------
+
+    @classmethod
+    def _entry_terms(cls, entry: dict) -> Counter:
+        terms = Counter()
+        title = tokenize(str(entry.get("title") or ""))
+        for _ in range(cls.TITLE_WEIGHT):
+            terms.update(title)
+        terms.update(tokenize(str(entry.get("note") or "")))
+        for tag in normalize_tags(entry.get("tags")):
+            terms.update(tokenize(tag.replace("_", " ")))
+        return terms
+
+    def add(self, category: str, entry: dict) -> None:
+        if entry.get("id") is None:
+            return
+        key = (category, entry["id"])
+        self.remove(category, entry["id"])
+        terms = self._entry_terms(entry)
+        self.docs[key] = entry
+        self.doc_terms[key] = terms
+        length = sum(terms.values())
+        self.doc_len[key] = length
+        self._total_len += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[key] = tf
+        tags = {t.casefold() for t in normalize_tags(entry.get("tags"))}
+        self.doc_tags[key] = tags
+        for tag in tags:
+            self.tag_postings.setdefault(tag, set()).add(key)
+
+    def remove(self, category: str, entry_id: int) -> None:
+        key = (category, entry_id)
+        self.docs.pop(key, None)
+        for tag in self.doc_tags.pop(key, ()):
+            keys = self.tag_postings.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tag_postings[tag]
+        terms = self.doc_terms.pop(key, None)
+        if terms is None:
+            return
+        self._total_len -= self.doc_len.pop(key, 0)
+        for term in terms:
+            plist = self.postings.get(term)
+            if plist is not None:
+                plist.pop(key, None)
+                if not plist:
+                    del self.postings[term]
+
+    def rebuild(self, data: Dict[str, List[dict]]) -> None:
+        self.__init__()
+        for category, entries in data.items():
+            for entry in entries:
+                self.add(category, entry)
+
+    # ---------- 查询 ----------
+
+    def search(self, query: str, k: int = 20, categories: Iterable[str] | None = None) -> List[Tuple[DocKey, float]]:
+        """返回按 BM25 分数降序的 [(doc_key, score)]，最多 k 条。"""
+        n = len(self.doc_terms)
+        if not n:
+            return []
+        allowed = set(categories) if categories else None
+        avgdl = self._total_len / n or 1.0
+        scores: Dict[DocKey, float] = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for key, tf in plist.items():
+                if allowed is not None and key[0] not in allowed:
+                    continue
+                norm = tf + self.K1 * (1 - self.B + self.B * self.doc_len[key] / avgdl)
+                scores[key] = scores.get(key, 0.0) + idf * tf * (self.K1 + 1) / norm
+        return heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+
+    def by_tag(self, tag: str, categories: Iterable[str] | None = None, limit: int | None = None) -> List[DocKey]:
+        """按规范标签精确查找，返回按 (类别, id) 排序的 doc_key（limit 截断时只做部分排序）。"""
+        allowed = set(categories) if categories else None
+        keys = self.tag_postings.get(canonical_tag(tag), ())
+        matched = (k for k in keys if allowed is None or k[0] in allowed)
+        return heapq.nsmallest(limit, matched) if limit else sorted(matched)
+
+    def tag_size(self, tag: str) -> int:
+        return len(self.tag_postings.get(canonical_tag(tag), ()))
+
+    def tag_counts(self, limit: int = 30) -> List[Tuple[str, int]]:
+        """最常用的标签（规范键）及其任务数。"""
+        return heapq.nlargest(limit, ((t, len(keys)) for t, keys in self.tag_postings.items()), key=lambda kv: kv[1])
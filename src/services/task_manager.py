@@ -1,16 +1,15 @@
-import json
-import os
 import logging
 from datetime import datetime
-from typing import List, Dict
+import re
+from typing import Callable, List, Dict, Optional
 
+from src.config import settings
 from src.services.scheduler import scheduler_service
+from src.services.shared_state import Document
+from src.services.task_index import TaskIndex, normalize_tags
 
 log = logging.getLogger(__name__)
 
-# 与其他 JSON 存储保持风格一致
-DB_FILE = "/app/data/tasks.json"
-
 
 class TaskManager:
     """
@@ -22,33 +21,43 @@ class TaskManager:
     """
 
     def __init__(self):
-        self.data = self._load_db()
-        self._ensure_keys()
-        self._reschedule_reminders()
+        # 标题 / 备注 / 标签的倒排索引，增删改时同步维护；（重新）读入文档时整体重建
+        self._index = TaskIndex()
+        # 每次增删改 / 重新读入 +1；列表分页等派生视图据此判断缓存是否失效
+        self.version = 0
+        # DATA_DIR/tasks.json（或共享后端里的同名文档）；读盘、建索引推迟到首次访问 / 启动钩子
+        self.doc = Document("tasks", lambda: {"todo": [], "reminder": [], "days": [], "annis": []}, self._on_load)
+        # 上次对齐调度器时的文档版本（见 sync_reminders）
+        self._synced_version = None
+        # apply_operations 的批量 edit 进行中时，reminder 的调度器改动先记在这里，整批写回成功后再执行
+        self._deferred: Optional[List[Callable[[], None]]] = None
 
     # ---------- 基础存取 ----------
 
-    def _ensure_keys(self):
+    def _on_load(self, data: Dict[str, List[dict]]) -> None:
         for k in ("todo", "reminder", "days", "annis"):
-            self.data.setdefault(k, [])
+            data.setdefault(k, [])
+        self._index.rebuild(data)
+        self.version += 1
 
-    def _load_db(self) -> Dict[str, List[dict]]:
-        if not os.path.exists(DB_FILE):
-            return {"todo": [], "reminder": [], "days": [], "annis": []}
-        try:
-            with open(DB_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            log.error(f"Failed to load tasks DB: {e}")
-            return {"todo": [], "reminder": [], "days": [], "annis": []}
-
-    def _save_db(self):
-        os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
-        try:
-            with open(DB_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.data, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            log.error(f"Failed to save tasks DB: {e}")
+    def load(self) -> None:
+        self.doc.get()
+
+    @property
+    def data(self) -> Dict[str, List[dict]]:
+        return self.doc.get()
+
+    @property
+    def index(self) -> TaskIndex:
+        self.doc.get()
+        return self._index
+
+    def _after_commit(self, fn: Callable[[], None]) -> None:
+        """调度器改动要等文档真正写回之后再做，避免给没保存下来的 reminder 挂上 job。"""
+        if self._deferred is not None:
+            self._deferred.append(fn)
+        else:
+            fn()
 
     # ---------- CRUD 接口 ----------
 
@@ -58,59 +67,158 @@ class TaskManager:
         - 保证 entry 有唯一 id（秒级时间戳）
         - 对 reminder 会自动挂到 scheduler 上
         """
-        if category not in self.data:
-            log.warning(f"Unknown task category: {category}")
-            self.data[category] = []
-
-        if "id" not in entry:
-            entry["id"] = int(datetime.now().timestamp())
-
-        self.data[category].append(entry)
-        self._save_db()
+        with self.doc.edit() as data:
+            if category not in data:
+                log.warning(f"Unknown task category: {category}")
+                data[category] = []
+
+            if "id" not in entry:
+                # 秒级时间戳；同一秒内批量创建时顺延，保证 id 唯一
+                new_id = int(datetime.now().timestamp())
+                existing = {e.get("id") for e in data[category]}
+                while new_id in existing:
+                    new_id += 1
+                entry["id"] = new_id
+
+            if "tags" in entry:
+                entry["tags"] = normalize_tags(entry["tags"])
+            data[category].append(entry)
+            self._index.add(category, entry)
+            self.version += 1
 
         if category == "reminder" and entry.get("datetime"):
-            scheduler_service.schedule_reminder(entry)
+            self._after_commit(lambda: scheduler_service.schedule_reminder(entry))
 
     def delete_entry(self, category: str, entry_id: int) -> bool:
         """
         删除任务：
         - 如果是 reminder，会同时取消对应的定时任务
         """
-        items = self.data.get(category, [])
-        for i, item in enumerate(items):
-            if item.get("id") == entry_id:
-                del items[i]
-                self._save_db()
-                if category == "reminder":
-                    scheduler_service.cancel_reminder(entry_id)
-                return True
-        return False
+        with self.doc.edit() as data:
+            items = data.get(category, [])
+            for i, item in enumerate(items):
+                if item.get("id") == entry_id:
+                    del items[i]
+                    self._index.remove(category, entry_id)
+                    self.version += 1
+                    break
+            else:
+                return False
+        if category == "reminder":
+            self._after_commit(lambda: scheduler_service.cancel_reminder(entry_id))
+        return True
 
     def update_entry(self, category: str, entry_id: int, new_data: dict) -> bool:
         """
         更新任务：
         - 如果是 reminder 且时间发生变化，会重新挂载
         """
-        items = self.data.get(category, [])
-        for item in items:
-            if item.get("id") == entry_id:
-                item.update(new_data)
-                self._save_db()
-                if category == "reminder" and item.get("datetime"):
-                    scheduler_service.schedule_reminder(item)
-                return True
-        return False
+        with self.doc.edit() as data:
+            for item in data.get(category, []):
+                if item.get("id") == entry_id:
+                    item.update(new_data)
+                    if "tags" in new_data:
+                        item["tags"] = normalize_tags(item["tags"])
+                    self._index.add(category, item)
+                    self.version += 1
+                    break
+            else:
+                return False
+        if category == "reminder" and item.get("datetime"):
+            self._after_commit(lambda: scheduler_service.schedule_reminder(item))
+        return True
+
+    def apply_operations(self, operations: List[dict]) -> List[dict]:
+        """
+        批量执行 AI 给出的操作（create / update / delete），整批在一个 edit 里，最后只写一次。
+        update 只合并非 null 字段，避免把没提到的字段清空。
+        返回实际生效的操作列表（'list' 等无状态操作不算）。
+        reminder 的调度器改动在整批写回成功后才执行；写回失败（StateWriteError）时一个都不挂。
+        """
+        applied = []
+        self._deferred = []
+        try:
+            with self.doc.edit():
+                for op in operations:
+                    op_type = op.get("op")
+                    target = op.get("target")
+                    if target not in ("todo", "reminder", "days", "annis"):
+                        continue
+                    data = {k: v for k, v in (op.get("data") or {}).items() if v is not None}
+                    entry_id = op.get("id")
+                    try:
+                        if op_type == "create":
+                            self.add_entry(target, data)
+                            applied.append({"op": op_type, "target": target, "id": data.get("id"), "data": data})
+                        elif op_type == "update" and entry_id is not None:
+                            if self.update_entry(target, entry_id, data):
+                                applied.append({"op": op_type, "target": target, "id": entry_id, "data": data})
+                        elif op_type == "delete" and entry_id is not None:
+                            if self.delete_entry(target, entry_id):
+                                applied.append({"op": op_type, "target": target, "id": entry_id, "data": data})
+                    except Exception as e:
+                        log.error(f"❌ {op_type} failed in apply_operations: {e}")
+            deferred = self._deferred
+        finally:
+            self._deferred = None
+        for fn in deferred:
+            try:
+                fn()
+            except Exception as e:
+                log.error(f"❌ Failed to update reminder job after apply_operations: {e}")
+        return applied
 
     def get_entries(self, category: str) -> List[Dict]:
         return self.data.get(category, [])
 
-    # ---------- 启动时重挂 reminder ----------
+    # ---------- 检索 ----------
+
+    def search(self, query: str, k: int = 20, categories: List[str] | None = None) -> List[tuple]:
+        """全文检索（标题 / 备注 / 标签，BM25 排序），返回 [(category, entry)]。"""
+        return [(key[0], self.index.docs[key]) for key, _ in self.index.search(query, k, categories)]
 
-    def _reschedule_reminders(self):
+    def entries_with_tag(self, tag: str, categories: List[str] | None = None, limit: int | None = None) -> List[tuple]:
+        """按标签精确查找（大小写 / '#' / 空格与下划线不敏感），返回 [(category, entry)]。"""
+        return [(key[0], self.index.docs[key]) for key in self.index.by_tag(tag, categories, limit)]
+
+    def relevant_entries(self, text: str, k: int | None = None, recent: int | None = None) -> Dict[str, List[Dict]]:
+        """
+        为 process_owner_command 挑选与这句话相关的少量任务，而不是把整个数据库塞进 prompt：
+        - BM25 检索 top-K（标题 / 备注 / 标签，中英文都支持）
+        - 消息里直接写出的 id（如「删掉 123」）
+        - 每类最近创建的几条（兜底「刚才那个」这类指代）
+        返回 {category: [entry, ...]}，总量与任务库大小无关。
         """
-        进程重启后，把未来的 reminder 重新挂载一遍。
+        k = settings.TASK_CONTEXT_TOP_K if k is None else k
+        recent = settings.TASK_CONTEXT_RECENT if recent is None else recent
+
+        keys = [key for key, _ in self.index.search(text, k)]
+        for raw_id in re.findall(r"\d{3,}", text):
+            keys.extend((category, int(raw_id)) for category in self.data)
+        for category, entries in self.data.items():
+            if recent:
+                keys.extend((category, e.get("id")) for e in entries[-recent:])
+
+        result: Dict[str, List[Dict]] = {c: [] for c in ("todo", "reminder", "days", "annis")}
+        seen = set()
+        for key in keys:
+            entry = self.index.docs.get(key)
+            if entry is None or key in seen:
+                continue
+            seen.add(key)
+            result.setdefault(key[0], []).append(entry)
+        return result
+
+    # ---------- 启动 / 接任 leader 时重挂 reminder ----------
+
+    def reschedule_reminders(self):
+        """
+        把库里未来的 reminder 挂到调度器上（时间没变的 job 不动），并撤掉库里已经没有的 reminder job。
+        进程重启 / 成为调度 leader 时由启动钩子调用。
         """
         now = datetime.now()
+        scheduled = scheduler_service.reminder_jobs()
+        wanted = set()
         count = 0
         for r in self.data.get("reminder", []):
             try:
@@ -119,12 +227,24 @@ class TaskManager:
                 event_time = datetime.fromisoformat(r["datetime"])
                 # scheduler 内部会自己减 15 分钟，这里只看事件是否仍在未来
                 if event_time > now:
-                    scheduler_service.schedule_reminder(r)
-                    count += 1
+                    job_id = str(r["id"])
+                    wanted.add(job_id)
+                    if scheduled.get(job_id) != r["datetime"]:
+                        scheduler_service.schedule_reminder(r)
+                        count += 1
             except Exception as e:
                 log.error(f"Failed to reschedule reminder {r}: {e}")
+        for job_id in scheduled.keys() - wanted:
+            scheduler_service.cancel_reminder(int(job_id))
+        self._synced_version = self.doc.version
         if count:
             log.info(f"🔄 Rescheduled {count} pending reminders.")
 
+    def sync_reminders(self):
+        """leader 续约时调用：任务库有新版本（其它副本增删改过）才重新对一遍 reminder。"""
+        self.load()
+        if self.doc.version != self._synced_version:
+            self.reschedule_reminders()
+
 
 task_manager = TaskManager()
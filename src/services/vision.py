@@ -0,0 +1,105 @@
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+from telegram import Message, PhotoSize
+
+from src.config import settings
+from src.services.ai_agent import agent
+from src.services.executors import cpu_executor
+from src.utils.imaging import dhash
+
+log = logging.getLogger(__name__)
+
+
+class ImagePipeline:
+    """
+    私聊图片分析：
+    1. 从 Telegram 给的多个 PhotoSize 里挑「短边 >= IMAGE_MIN_SIDE 的最小一张」（没有就取最大的）
+    2. 先按 file_unique_id 查缓存（同一个文件被反复转发时连下载都省了）
+    3. 下载到内存（不落临时文件），在 CPU 进程池里算 dHash，在缓存里找汉明距离 <= IMAGE_HASH_MAX_DISTANCE 的近似图
+    4. 都没命中才调一次视觉模型；结果按两个 key 写回 LRU 缓存（失败结果不缓存）
+    """
+
+    def __init__(self):
+        self.by_file_id: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.by_hash: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def pick_size(photos: Sequence[PhotoSize]) -> PhotoSize:
+        ordered = sorted(photos, key=lambda p: p.width * p.height)
+        for photo in ordered:
+            if min(photo.width, photo.height) >= settings.IMAGE_MIN_SIDE:
+                return photo
+        return ordered[-1]
+
+    def _remember(self, cache: OrderedDict, key, verdict: Dict[str, Any]) -> None:
+        cache[key] = verdict
+        cache.move_to_end(key)
+        while len(cache) > settings.IMAGE_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    def _near(self, h: int) -> Optional[Dict[str, Any]]:
+        best, best_dist = None, settings.IMAGE_HASH_MAX_DISTANCE + 1
+        for key in self.by_hash:
+            dist = (key ^ h).bit_count()
+            if dist < best_dist:
+                best, best_dist = key, dist
+        if best is None:
+            return None
+        self.by_hash.move_to_end(best)
+        return self.by_hash[best]
+
+    async def analyze(self, photos: Sequence[PhotoSize]) -> Dict[str, Any]:
+        """返回 analyze_image 的结果（summary / tags / risk），命中缓存时额外带 cached=True。"""
+        photo = self.pick_size(photos)
+
+        cached = self.by_file_id.get(photo.file_unique_id)
+        if cached:
+            self.hits += 1
+            self.by_file_id.move_to_end(photo.file_unique_id)
+            return {**cached, "cached": True}
+
+        tg_file = await photo.get_file()
+        data = bytes(await tg_file.download_as_bytearray())
+
+        # 解码 + 缩放是纯 CPU 活，放进进程池，不占事件循环
+        try:
+            h = await cpu_executor.run(dhash, data)
+        except Exception as e:
+            # 进程池出问题（worker 被杀、起不来）只影响近似去重，分析照常走 AI
+            log.warning(f"⚠️ dHash offload failed, skipping near-duplicate lookup: {e}")
+            h = None
+        if h is not None:
+            cached = self._near(h)
+            if cached:
+                self.hits += 1
+                self._remember(self.by_file_id, photo.file_unique_id, cached)
+                return {**cached, "cached": True}
+
+        self.misses += 1
+        verdict = await agent.analyze_image(data)
+        if "error" not in verdict:
+            self._remember(self.by_file_id, photo.file_unique_id, verdict)
+            if h is not None:
+                self._remember(self.by_hash, h, verdict)
+        return verdict
+
+
+image_pipeline = ImagePipeline()
+
+
+async def describe_message(msg: Message) -> str:
+    """消息的文字表示：图片会附上视觉模型的描述，供后续文本分类 / 对话使用。"""
+    text = msg.text or msg.caption or ""
+    if not msg.photo:
+        return text
+    try:
+        verdict = await image_pipeline.analyze(msg.photo)
+    except Exception as e:
+        log.error(f"❌ Image pipeline failed: {e}")
+        return f"{text}\n[图片：无法分析]".strip()
+    tags = ", ".join(verdict.get("tags") or [])
+    return f"{text}\n[图片：{verdict.get('summary')}（{tags}；risk={verdict.get('risk')}）]".strip()
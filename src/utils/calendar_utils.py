@@ -1,6 +1,4 @@
 import datetime
-import holidays
-from lunarcalendar import Converter, Solar, Lunar
 
 # Define major Chinese Lunar Holidays (Month, Day)
 LUNAR_HOLIDAYS = {
@@ -14,6 +12,10 @@ LUNAR_HOLIDAYS = {
 
 def get_today_holidays() -> list[str]:
     """Returns a list of holiday names for today (UTC+8)."""
+    # 只有每天 7:00 的 job 用得到，放到这里 import，不拖慢启动
+    import holidays
+    from lunarcalendar import Converter, Solar
+
     # 1. Get current time in China
     tz = datetime.timezone(datetime.timedelta(hours=8))
     now = datetime.datetime.now(tz)
@@ -0,0 +1,46 @@
+import io
+import logging
+from typing import Optional
+
+# 这个模块会被 CPU 进程池的 worker 直接 import：不要依赖 src.config / 各 service
+
+log = logging.getLogger(__name__)
+
+_pil = None
+
+
+def _image_module():
+    """Pillow 可选：没有它就只按 file_unique_id 精确去重。第一张图片到来时才 import。"""
+    global _pil
+    if _pil is None:
+        try:
+            from PIL import Image
+        except ImportError:
+            Image = False
+        _pil = Image
+    return _pil or None
+
+
+def dhash(data: bytes, size: int = 8) -> Optional[int]:
+    """
+    差值哈希（dHash）：缩成 (size+1)×size 灰度图，逐行比较相邻像素，得到 64 bit 指纹。
+    重新压缩、缩放、加轻微水印后的同一张图，汉明距离通常在个位数。
+    data 可以是 bytes 或 memoryview（进程池经共享内存传进来的）。
+    """
+    Image = _image_module()
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft("L", (size * 8, size * 8))  # JPEG 直接按缩小比例解码，省掉大部分解码开销
+            pixels = list(img.convert("L").resize((size + 1, size)).getdata())
+    except Exception as e:
+        log.warning(f"⚠️ dHash failed: {e}")
+        return None
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
@@ -0,0 +1,117 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import zlib
+from typing import Any, Dict, Optional
+
+from src.config import settings
+
+# LogRecord 自带的属性；其余的（extra=...）当作结构化字段输出
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class LogText:
+    """
+    包一段用户内容（消息正文、AI 结果…），真正格式化时才截断 / 脱敏：
+        log.info("📩 text=%s", LogText(msg.text))
+    调用方只多分配一个小对象，被采样丢掉或级别不够的记录完全不付格式化的代价。
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else str(self.value)
+        if settings.LOG_REDACT_TEXT:
+            # 只留长度和指纹，方便对照同一条消息的前后日志
+            return f"<{len(text)} chars #{zlib.crc32(text.encode('utf-8')) & 0xffffffff:08x}>"
+        limit = settings.LOG_TEXT_MAX
+        if limit and len(text) > limit:
+            return text[:limit] + f"…(+{len(text) - limit})"
+        return text
+
+    __repr__ = __str__
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    事件循环线程只做「过滤 + 入队」：
+    - 标准 QueueHandler.prepare 会在调用线程里 format 一遍，这里跳过，消息拼接放到后台线程
+    - 按 extra={"stage": ...} 做采样（LOG_SAMPLING），WARNING 及以上一律保留
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            stage = getattr(record, "stage", None)
+            if stage is not None:
+                rate = settings.LOG_SAMPLING.get(stage)
+                if rate is not None and random.random() >= rate:
+                    return False
+        return super().filter(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """一行一个 JSON 对象：ts / level / logger / msg + extra 里的结构化字段。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value if isinstance(value, (int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging() -> None:
+    """
+    根 logger -> DeferredQueueHandler -> 后台 QueueListener 线程 -> stderr。
+    LOG_FORMAT=json 输出结构化 JSON，text 保持原来的人类可读格式。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stderr)
+    if settings.LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(settings.LOG_LEVEL)
+    # httpx 每个请求一条 INFO，量大且没有信息量
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """把队列里剩下的记录写完（进程退出时自动调用）。"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
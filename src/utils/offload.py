@@ -0,0 +1,34 @@
+from multiprocessing import shared_memory
+from typing import Any, Callable, Tuple
+
+# 进程池 worker 侧的小工具：和 imaging 一样不依赖 src.config，worker 启动时只 import 这么多
+
+
+class SharedBytes:
+    """大块 bytes 参数的占位：数据放在共享内存 name 里，worker 按 size 取 memoryview，不经 pickle / 管道复制。"""
+
+    __slots__ = ("name", "size")
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+
+
+def call_shared(fn: Callable[..., Any], args: Tuple[Any, ...]) -> Any:
+    """在 worker 里执行 fn(*args)：SharedBytes 换成共享内存上的 memoryview，调用结束后断开（由父进程 unlink）。"""
+    segments = []
+    real_args = []
+    for arg in args:
+        if isinstance(arg, SharedBytes):
+            shm = shared_memory.SharedMemory(name=arg.name)
+            view = shm.buf[: arg.size]
+            segments.append((shm, view))
+            real_args.append(view)
+        else:
+            real_args.append(arg)
+    try:
+        return fn(*real_args)
+    finally:
+        for shm, view in segments:
+            view.release()
+            shm.close()